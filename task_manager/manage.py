@@ -3,10 +3,15 @@
 import os
 import sys
 
+# Commands that never read secrets; they boot without a Key Vault round trip.
+NO_SECRETS_COMMANDS = {'help', 'version', 'makemigrations', 'makemessages', 'compilemessages', 'startapp'}
+
 
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_manager.settings')
+    if len(sys.argv) < 2 or sys.argv[1] in NO_SECRETS_COMMANDS or sys.argv[1] in {'-h', '--help', '--version'}:
+        os.environ.setdefault('AZURE_VAULT_SKIP', 'True')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
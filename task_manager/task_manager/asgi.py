@@ -11,6 +11,12 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from task_manager import boot
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_manager.settings')
+# Serve the hot read endpoints with the native async views (tasks.async_views).
+os.environ.setdefault('TASK_ASYNC_READ_VIEWS', 'True')
 
-application = get_asgi_application()
+with boot.phase('django.setup'):
+    application = get_asgi_application()
+boot.log_report('asgi')
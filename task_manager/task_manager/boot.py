@@ -0,0 +1,37 @@
+"""Boot timing: where a process spends its time before it can serve work.
+
+Code on the startup path wraps its steps in :func:`phase`; entry points
+(WSGI/ASGI, Celery workers) log :func:`report` once ready when
+``BOOT_TIMING_REPORT`` is set. ``manage.py boot_report`` profiles a cold boot
+in a fresh interpreter, including the slowest imports.
+"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_started = time.perf_counter()
+phases = []
+
+
+@contextmanager
+def phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases.append((name, time.perf_counter() - started))
+
+
+def report():
+    lines = [f'{name:<32}{seconds * 1000:>10.1f} ms' for name, seconds in phases]
+    lines.append(f'{"since settings import":<32}{(time.perf_counter() - _started) * 1000:>10.1f} ms')
+    return '\n'.join(lines)
+
+
+def log_report(entry_point):
+    if os.getenv('BOOT_TIMING_REPORT', '').lower() in {'1', 'true', 'yes', 'on'}:
+        logger.warning('Boot timing for %s (pid %d):\n%s', entry_point, os.getpid(), report())
@@ -1,5 +1,8 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_shutdown, worker_ready
+
+from task_manager import boot
 
 # Set default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_manager.settings')
@@ -10,4 +13,17 @@ app = Celery('task_manager')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django apps
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+
+@worker_ready.connect
+def _report_boot(**kwargs):
+    boot.log_report('celery worker')
+
+
+@worker_process_shutdown.connect
+def _flush_metrics(**kwargs):
+    # Each prefork child buffers metrics; write them out before it exits.
+    from tasks import metrics
+
+    metrics.flush()
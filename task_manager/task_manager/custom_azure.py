@@ -1,6 +1,106 @@
+"""Azure Blob storage backends tuned for large task inputs and outputs.
 
+All storages in a process share one BlobServiceClient per account, backed by a
+pooled HTTP session, instead of building a client per storage instance. Large
+uploads are split into ``AZURE_BLOCK_SIZE`` blocks sent ``AZURE_UPLOAD_MAX_CONN``
+at a time. Files opened for reading fetch byte ranges on demand rather than
+downloading the whole blob first, and ``save_many``/``open_many`` move many
+blobs concurrently. Point ``AZURE_STORAGE_CONNECTION_STRING`` at Azurite to
+run all of this locally.
+"""
+
+import io
 import os
-from storages.backends.azure_storage import AzureStorage
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.storage.blob import BlobServiceClient
+from django.core.files.base import File
+from storages.backends.azure_storage import AzureStorage, AzureStorageFile
+from storages.utils import setting
+
+MB = 1024 * 1024
+
+_clients_lock = threading.Lock()
+_clients = {}
+
+
+def _pooled_session(pool_size):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def shared_service_client(key, factory):
+    """The process-wide client for ``key``, built by ``factory`` on first use.
+
+    Keyed by pid as well, so a forked worker never reuses its parent's sockets.
+    """
+    key = (os.getpid(), key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = factory()
+        return client
+
+
+class BlobRangeReader(io.RawIOBase):
+    """Seekable, read-only view of bytes ``[start, end)`` of a blob.
+
+    Only the ranges actually read are downloaded; wrap it in a
+    ``BufferedReader`` to fetch them in chunk-sized requests.
+    """
+
+    def __init__(self, blob_client, start, end, max_concurrency=1, timeout=None):
+        self.blob_client = blob_client
+        self.start = start
+        self.end = end
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.position = 0
+
+    @property
+    def size(self):
+        return self.end - self.start
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('Negative seek position')
+        self.position = offset
+        return offset
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self.size - self.position)
+        if length <= 0:
+            return 0
+        data = self.blob_client.download_blob(
+            offset=self.start + self.position,
+            length=length,
+            max_concurrency=self.max_concurrency,
+            timeout=self.timeout,
+        ).readall()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
 
 class _BaseAzureStorage(AzureStorage):
     account_name = os.getenv('AZURE_ACCOUNT_NAME')
@@ -9,9 +109,82 @@ class _BaseAzureStorage(AzureStorage):
     expiration_secs = None
     overwrite_files = False
 
+    def get_default_settings(self):
+        return {
+            **super().get_default_settings(),
+            'upload_max_conn': setting('AZURE_UPLOAD_MAX_CONN', 4),
+            'download_max_conn': setting('AZURE_DOWNLOAD_MAX_CONN', 4),
+            'block_size': setting('AZURE_BLOCK_SIZE', 8 * MB),
+            'single_put_size': setting('AZURE_SINGLE_PUT_SIZE', 16 * MB),
+            'read_chunk_size': setting('AZURE_READ_CHUNK_SIZE', 4 * MB),
+            'pool_size': setting('AZURE_POOL_SIZE', 32),
+            'bulk_max_workers': setting('AZURE_BULK_MAX_WORKERS', 8),
+        }
+
+    def _get_service_client(self, use_custom_domain):
+        if self.connection_string is not None:
+            return shared_service_client(
+                (self.connection_string,),
+                lambda: BlobServiceClient.from_connection_string(self.connection_string, **self._client_options()),
+            )
+
+        domain = self.custom_domain if self.custom_domain and use_custom_domain else None
+        account_url = '{}://{}'.format(self.azure_protocol, domain or f'{self.account_name}.blob.{self.endpoint_suffix}')
+        if self.account_key:
+            credential = {'account_name': self.account_name, 'account_key': self.account_key}
+        else:
+            credential = self.sas_token or self.token_credential
+        return shared_service_client(
+            (account_url, self.account_name),
+            lambda: BlobServiceClient(account_url, credential=credential, **self._client_options()),
+        )
+
+    def _client_options(self):
+        options = {
+            'session': _pooled_session(self.pool_size),
+            'max_block_size': self.block_size,
+            'max_single_put_size': self.single_put_size,
+            'max_chunk_get_size': self.read_chunk_size,
+            'max_single_get_size': self.read_chunk_size,
+        }
+        if self.api_version:
+            options['api_version'] = self.api_version
+        return options
+
+    def _open(self, name, mode='rb'):
+        if mode.strip('b') != 'r':
+            return AzureStorageFile(name, mode, self)
+        return File(io.BufferedReader(self.open_range(name), self.read_chunk_size), name)
+
+    def open_range(self, name, offset=0, length=None):
+        """A raw reader over ``length`` bytes of blob ``name`` starting at ``offset``."""
+        blob_client = self.client.get_blob_client(self._get_valid_path(name))
+        size = blob_client.get_blob_properties(timeout=self.timeout).size
+        end = size if length is None else min(size, offset + length)
+        return BlobRangeReader(blob_client, min(offset, end), end, self.download_max_conn, self.timeout)
+
+    def save_many(self, items, max_workers=None):
+        """Save ``(name, content)`` pairs concurrently; returns the stored names in order."""
+        items = list(items)
+        with ThreadPoolExecutor(max_workers=max_workers or self.bulk_max_workers) as pool:
+            return list(pool.map(lambda item: self.save(*item), items))
+
+    def open_many(self, names, max_workers=None):
+        """Download ``names`` concurrently; returns ``{name: bytes}``."""
+        names = list(names)
+
+        def download(name):
+            return self.client.download_blob(
+                self._get_valid_path(name), max_concurrency=self.download_max_conn, timeout=self.timeout
+            ).readall()
+
+        with ThreadPoolExecutor(max_workers=max_workers or self.bulk_max_workers) as pool:
+            return dict(zip(names, pool.map(download, names)))
+
+
 class AzureMediaStorage(_BaseAzureStorage):
     azure_container = os.getenv('AZURE_MEDIA_CONTAINER', 'media')
 
 
 class AzureStaticStorage(_BaseAzureStorage):
-    azure_container = os.getenv('AZURE_STATIC_CONTAINER', 'static')
\ No newline at end of file
+    azure_container = os.getenv('AZURE_STATIC_CONTAINER', 'static')
@@ -0,0 +1,161 @@
+"""Key Vault secrets for the settings module.
+
+Imported by ``settings.py`` before Django is configured, so nothing here may
+touch Django. Secrets are fetched concurrently and kept in a Fernet-encrypted
+file cache: a process that finds a fresh cache makes no network calls, and one
+that finds a stale cache boots from it and refreshes it in the background.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Key Vault secret name -> settings/environment name.
+SECRET_MAPPING = {
+    'DJANGO-SECRET-KEY': 'SECRET_KEY',
+    'DB-NAME': 'DB_NAME',
+    'DB-USER': 'DB_USER',
+    'DB-PASSWORD': 'DB_PASS',
+    'DB-HOST': 'DB_HOST',
+    'DB-PORT': 'DB_PORT',
+    'AZURE-STORAGE-CONNECTION-STRING': 'AZURE_STORAGE_CONNECTION_STRING',
+    'AZURE-ACCOUNT-NAME': 'AZURE_ACCOUNT_NAME',
+    'AZURE-ACCOUNT-KEY': 'AZURE_ACCOUNT_KEY',
+}
+
+
+def default_client_factory(vault_name):
+    from azure.identity import DefaultAzureCredential
+    from azure.keyvault.secrets import SecretClient
+
+    return SecretClient(vault_url=f'https://{vault_name}.vault.azure.net', credential=DefaultAzureCredential())
+
+
+class SecretCache:
+    """Encrypted JSON file holding the last fetched secrets and when they were fetched."""
+
+    def __init__(self, path, key, clock=time.time):
+        from cryptography.fernet import Fernet
+
+        self.path = path
+        self.fernet = Fernet(key)
+        self.clock = clock
+
+    def read(self):
+        """Return ``(values, age_seconds)``, or ``(None, None)`` if missing or unreadable."""
+        try:
+            with open(self.path, 'rb') as f:
+                payload = json.loads(self.fernet.decrypt(f.read()))
+        except FileNotFoundError:
+            return None, None
+        except Exception:
+            logger.warning('Ignoring unreadable secrets cache %s', self.path, exc_info=True)
+            return None, None
+        return payload['values'], self.clock() - payload['fetched_at']
+
+    def write(self, values):
+        token = self.fernet.encrypt(json.dumps({'fetched_at': self.clock(), 'values': values}).encode('utf-8'))
+        directory = os.path.dirname(self.path) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.secrets-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(token)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            logger.warning('Could not write secrets cache %s', self.path, exc_info=True)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+
+class VaultSecretsLoader:
+    def __init__(self, vault_name, mapping=None, client_factory=default_client_factory, cache=None,
+                 ttl=3600, max_workers=8):
+        self.vault_name = vault_name
+        self.mapping = mapping or SECRET_MAPPING
+        self.client_factory = client_factory
+        self.cache = cache
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.refresh_thread = None
+
+    def fetch(self):
+        """Fetch every mapped secret concurrently; secrets that fail are logged and left out."""
+        client = self.client_factory(self.vault_name)
+        names = list(self.mapping)
+        loaded, failed = {}, []
+
+        def get(kv_name):
+            try:
+                return client.get_secret(kv_name).value
+            except Exception as exc:
+                failed.append(f'{kv_name} ({exc.__class__.__name__})')
+                return None
+
+        # The first call acquires the access token; the rest reuse it instead of racing for one.
+        values = [get(names[0])]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            values += pool.map(get, names[1:])
+        for kv_name, value in zip(names, values):
+            if value is not None:
+                loaded[self.mapping[kv_name]] = value
+        if failed:
+            logger.warning('Could not load %d Key Vault secret(s): %s', len(failed), ', '.join(failed))
+        return loaded, not failed
+
+    def load(self):
+        """Secrets from a fresh cache, else a stale one (refreshed in the background), else the vault."""
+        cached, age = self.cache.read() if self.cache else (None, None)
+        if cached is not None and age < self.ttl:
+            return cached
+        if cached is not None:
+            self.refresh_in_background()
+            return cached
+        loaded, complete = self.fetch()
+        if complete and self.cache:
+            self.cache.write(loaded)
+        return loaded
+
+    def refresh(self):
+        try:
+            loaded, complete = self.fetch()
+        except Exception:
+            logger.warning('Background Key Vault refresh failed', exc_info=True)
+            return
+        if complete and self.cache:
+            self.cache.write(loaded)
+
+    def refresh_in_background(self):
+        self.refresh_thread = threading.Thread(target=self.refresh, name='keyvault-refresh', daemon=True)
+        self.refresh_thread.start()
+
+
+def load_vault_secrets(vault_name):
+    """Load secrets for ``vault_name`` using the ``SECRETS_CACHE_*`` environment settings.
+
+    The cache is used only when ``SECRETS_CACHE_KEY`` (a Fernet key) is set, so
+    secrets never reach the disk unencrypted.
+    """
+    cache = None
+    key = os.getenv('SECRETS_CACHE_KEY')
+    if key:
+        path = os.getenv('SECRETS_CACHE_PATH') or os.path.join(
+            tempfile.gettempdir(), f'task_manager-secrets-{vault_name}.bin'
+        )
+        try:
+            cache = SecretCache(path, key)
+        except ValueError:
+            logger.warning('SECRETS_CACHE_KEY is not a valid Fernet key; secrets cache disabled')
+
+    loader = VaultSecretsLoader(vault_name, cache=cache, ttl=int(os.getenv('SECRETS_CACHE_TTL', '3600')))
+    try:
+        return loader.load()
+    except Exception:
+        logger.warning('Key Vault %s unavailable; using environment variables', vault_name, exc_info=True)
+        return {}
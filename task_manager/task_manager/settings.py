@@ -1,11 +1,15 @@
 """Django settings for task_manager project."""
 
 import os
+import sys
 from datetime import timedelta
 from pathlib import Path
 
 from dotenv import load_dotenv
 
+from task_manager import boot
+from task_manager.keyvault import load_vault_secrets
+
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -15,44 +19,12 @@ def _get_env_bool(name: str, default: bool = False) -> bool:
     return os.getenv(name, str(default)).lower() in {'1', 'true', 'yes', 'on'}
 
 
-def _load_keyvault_secrets(vault_name: str) -> dict[str, str]:
-    """Load configured secrets from Azure Key Vault.
-
-    If Key Vault is unavailable (local dev/Jenkins), return an empty dict and
-    allow environment-variable fallbacks.
-    """
-
-    secret_mapping = {
-        'DJANGO-SECRET-KEY': 'SECRET_KEY',
-        'DB-NAME': 'DB_NAME',
-        'DB-USER': 'DB_USER',
-        'DB-PASSWORD': 'DB_PASS',
-        'DB-HOST': 'DB_HOST',
-        'DB-PORT': 'DB_PORT',
-        'AZURE-STORAGE-CONNECTION-STRING': 'AZURE_STORAGE_CONNECTION_STRING',
-        'AZURE-ACCOUNT-NAME': 'AZURE_ACCOUNT_NAME',
-        'AZURE-ACCOUNT-KEY': 'AZURE_ACCOUNT_KEY',
-    }
-
-    try:
-        from azure.identity import DefaultAzureCredential
-        from azure.keyvault.secrets import SecretClient
-
-        client = SecretClient(
-            vault_url=f'https://{vault_name}.vault.azure.net',
-            credential=DefaultAzureCredential(),
-        )
-
-        loaded = {}
-        for kv_name, local_name in secret_mapping.items():
-            loaded[local_name] = client.get_secret(kv_name).value
-        return loaded
-    except Exception:
-        return {}
-
-
+# Key Vault is skipped by processes that need no secrets (AZURE_VAULT_SKIP, set by
+# manage.py for commands such as makemigrations); see task_manager.keyvault for
+# the concurrent fetch and the encrypted local cache.
 VAULT_NAME = os.getenv('AZURE_VAULT_NAME')
-VAULT_SECRETS = _load_keyvault_secrets(VAULT_NAME) if VAULT_NAME else {}
+with boot.phase('settings.keyvault'):
+    VAULT_SECRETS = load_vault_secrets(VAULT_NAME) if VAULT_NAME and not _get_env_bool('AZURE_VAULT_SKIP') else {}
 
 for key, value in VAULT_SECRETS.items():
     if value and not os.getenv(key):
@@ -82,11 +54,13 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'tasks.pagination.TaskCursorPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', '50')),
 }
 
 SIMPLE_JWT = {
@@ -104,6 +78,8 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
+    # First, so request metrics cover the whole middleware stack.
+    'tasks.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -190,7 +166,199 @@ AZURE_STATIC_CONTAINER = os.getenv('AZURE_STATIC_CONTAINER', 'static')
 if AZURE_CONNECTION_STRING or (AZURE_ACCOUNT_NAME and AZURE_ACCOUNT_KEY):
     DEFAULT_FILE_STORAGE = 'task_manager.custom_azure.AzureMediaStorage'
 
+# Blob transfer tuning (see task_manager.custom_azure). Blobs above
+# AZURE_SINGLE_PUT_SIZE are uploaded as AZURE_BLOCK_SIZE blocks in parallel.
+AZURE_BLOCK_SIZE = int(os.getenv('AZURE_BLOCK_SIZE_MB', '8')) * 1024 * 1024
+AZURE_SINGLE_PUT_SIZE = int(os.getenv('AZURE_SINGLE_PUT_SIZE_MB', '16')) * 1024 * 1024
+AZURE_READ_CHUNK_SIZE = int(os.getenv('AZURE_READ_CHUNK_SIZE_MB', '4')) * 1024 * 1024
+AZURE_UPLOAD_MAX_CONN = int(os.getenv('AZURE_UPLOAD_MAX_CONN', '4'))
+AZURE_DOWNLOAD_MAX_CONN = int(os.getenv('AZURE_DOWNLOAD_MAX_CONN', '4'))
+AZURE_POOL_SIZE = int(os.getenv('AZURE_POOL_SIZE', '32'))
+AZURE_BULK_MAX_WORKERS = int(os.getenv('AZURE_BULK_MAX_WORKERS', '8'))
+
+# Shared cache (Redis in deployments) so counters aggregate across processes.
+REDIS_CACHE_URL = os.getenv('REDIS_CACHE_URL')
+# maxmemory-policy is per Redis server, and the main one also holds the Celery
+# queues, chord counters and metric series, which must never be evicted. The
+# result cache therefore gets its own instance (allkeys-lru) when
+# REDIS_RESULT_CACHE_URL is set; sharing the main server, use volatile-lru at
+# most there (result and auth entries carry TTLs, queues and metrics do not).
+REDIS_RESULT_CACHE_URL = os.getenv('REDIS_RESULT_CACHE_URL') or REDIS_CACHE_URL
+if REDIS_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_CACHE_URL,
+        },
+        'metrics': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_CACHE_URL,
+        },
+        'auth': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_CACHE_URL,
+        },
+        'results': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_RESULT_CACHE_URL,
+            'KEY_PREFIX': 'results',
+        },
+    }
+else:
+    # One process-local store per purpose: LocMemCache culls past MAX_ENTRIES,
+    # and metric series (kept forever) must not push out users or results.
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'metrics': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'task-metrics',
+            'OPTIONS': {'MAX_ENTRIES': sys.maxsize},
+        },
+        'auth': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'auth-users',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('AUTH_USER_CACHE_MAX_ENTRIES', '10000'))},
+        },
+        'results': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'task-results',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('TASK_RESULT_CACHE_MAX_ENTRIES', '10000'))},
+        },
+    }
+
+TASK_METRICS_CACHE = os.getenv('TASK_METRICS_CACHE', 'metrics')
+# Metrics are buffered per process and written to the cache at most this often.
+TASK_METRICS_FLUSH_SECONDS = float(os.getenv('TASK_METRICS_FLUSH_SECONDS', '1'))
+# Bearer token required by /metrics when set.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Authenticated users cached per JWT user id (users.authentication); invalidated on save.
+AUTH_USER_CACHE = os.getenv('AUTH_USER_CACHE', 'auth')
+AUTH_USER_CACHE_SECONDS = int(os.getenv('AUTH_USER_CACHE_SECONDS', '60'))
+# Avatar renditions rendered by users.tasks.generate_avatar_renditions after each upload.
+AVATAR_RENDITIONS = [
+    {'name': 'small', 'max_size': [64, 64], 'format': 'WEBP', 'quality': 80},
+    {'name': 'medium', 'max_size': [256, 256], 'format': 'WEBP', 'quality': 80},
+]
+
+# Memoized task results (tasks.result_cache); TTL in seconds.
+TASK_RESULT_CACHE = os.getenv('TASK_RESULT_CACHE', 'results')
+TASK_RESULT_CACHE_TTL = int(os.getenv('TASK_RESULT_CACHE_TTL', str(7 * 24 * 3600)))
+
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
 CELERY_ACCEPT_CONTENT = ['json']
-CELERY_TASK_SERIALIZER = 'json'
\ No newline at end of file
+CELERY_TASK_SERIALIZER = 'json'
+# Prefetching would let a worker sit on Low tasks while Critical ones queue up.
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.getenv('CELERY_WORKER_PREFETCH_MULTIPLIER', '1'))
+# 'priority' makes a worker always poll its -Q queues in the order given.
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'queue_order_strategy': os.getenv('CELERY_QUEUE_ORDER_STRATEGY', 'priority'),
+}
+
+# One queue per Task.priority level; workers list them critical-first in -Q.
+TASK_PRIORITY_QUEUES = {
+    1: os.getenv('TASK_QUEUE_LOW', 'tasks.low'),
+    2: os.getenv('TASK_QUEUE_MEDIUM', 'tasks.medium'),
+    3: os.getenv('TASK_QUEUE_HIGH', 'tasks.high'),
+    4: os.getenv('TASK_QUEUE_CRITICAL', 'tasks.critical'),
+}
+# A pending task moves up one queue for every period it has waited.
+TASK_PRIORITY_AGING_SECONDS = int(os.getenv('TASK_PRIORITY_AGING_SECONDS', '300'))
+TASK_PRIORITY_AGING_BATCH_SIZE = int(os.getenv('TASK_PRIORITY_AGING_BATCH_SIZE', '1000'))
+
+# Task input uploads: size cap and extensions accepted (content is sniffed too).
+TASK_MAX_UPLOAD_MB = int(os.getenv('TASK_MAX_UPLOAD_MB', '100'))
+TASK_ALLOWED_INPUT_TYPES = [
+    ext.strip()
+    for ext in os.getenv(
+        'TASK_ALLOWED_INPUT_TYPES',
+        '.csv,.json,.ndjson,.jsonl,.txt,.png,.jpg,.jpeg,.gif,.webp,.bmp,.tif,.tiff,.pdf,.zip,.xlsx,.docx,.gz',
+    ).split(',')
+]
+
+# Bulk submission: request size cap, INSERT chunk size and broker publish batch.
+TASK_BULK_MAX_ITEMS = int(os.getenv('TASK_BULK_MAX_ITEMS', '10000'))
+TASK_BULK_CREATE_BATCH_SIZE = int(os.getenv('TASK_BULK_CREATE_BATCH_SIZE', '1000'))
+TASK_DISPATCH_BATCH_SIZE = int(os.getenv('TASK_DISPATCH_BATCH_SIZE', '500'))
+
+# Transactional outbox drained by `manage.py relay_outbox` (tasks.outbox).
+TASK_OUTBOX_BATCH_SIZE = int(os.getenv('TASK_OUTBOX_BATCH_SIZE', '500'))
+TASK_OUTBOX_MAX_RATE = float(os.getenv('TASK_OUTBOX_MAX_RATE', '0'))
+TASK_OUTBOX_POLL_SECONDS = float(os.getenv('TASK_OUTBOX_POLL_SECONDS', '0.2'))
+TASK_OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv('TASK_OUTBOX_MAX_BACKOFF_SECONDS', '30'))
+TASK_OUTBOX_RETENTION_SECONDS = int(os.getenv('TASK_OUTBOX_RETENTION_SECONDS', '86400'))
+
+# Rows fetched per keyset query by the streaming export.
+TASK_EXPORT_BATCH_SIZE = int(os.getenv('TASK_EXPORT_BATCH_SIZE', '2000'))
+
+# Full-text search for ?search= (tasks.search); empty picks the database vendor's index.
+TASK_SEARCH_BACKEND = os.getenv('TASK_SEARCH_BACKEND', '')
+
+# Redis pub/sub used for task status/progress push (tasks.events / tasks.streams).
+TASK_EVENTS_REDIS_URL = os.getenv('TASK_EVENTS_REDIS_URL', CELERY_BROKER_URL)
+# Publishing happens off the request thread, but a hung Redis must still not pile events up.
+TASK_EVENTS_SOCKET_TIMEOUT = float(os.getenv('TASK_EVENTS_SOCKET_TIMEOUT', '0.5'))
+TASK_EVENTS_QUEUE_SIZE = int(os.getenv('TASK_EVENTS_QUEUE_SIZE', '10000'))
+TASK_EVENTS_HEARTBEAT_SECONDS = float(os.getenv('TASK_EVENTS_HEARTBEAT_SECONDS', '15'))
+TASK_EVENTS_RETRY_MS = int(os.getenv('TASK_EVENTS_RETRY_MS', '3000'))
+
+# Native async list/detail/status/dashboard views; task_manager.asgi enables them.
+TASK_ASYNC_READ_VIEWS = _get_env_bool('TASK_ASYNC_READ_VIEWS', False)
+TASK_LONG_POLL_MAX_SECONDS = float(os.getenv('TASK_LONG_POLL_MAX_SECONDS', '60'))
+
+# Handler progress writes: at most one per interval or per step, batched per process.
+TASK_PROGRESS_FLUSH_MS = int(os.getenv('TASK_PROGRESS_FLUSH_MS', '1000'))
+TASK_PROGRESS_FLUSH_STEP = int(os.getenv('TASK_PROGRESS_FLUSH_STEP', '10'))
+TASK_PROGRESS_BATCH = _get_env_bool('TASK_PROGRESS_BATCH', True)
+
+# Cancellation: running handlers poll for it at most once per TASK_CANCEL_CHECK_MS
+# and are terminated if still running TASK_CANCEL_GRACE_SECONDS later.
+TASK_CANCEL_CHECK_MS = int(os.getenv('TASK_CANCEL_CHECK_MS', '1000'))
+TASK_CANCEL_GRACE_SECONDS = int(os.getenv('TASK_CANCEL_GRACE_SECONDS', '30'))
+TASK_CANCEL_BATCH_SIZE = int(os.getenv('TASK_CANCEL_BATCH_SIZE', '500'))
+
+# Transient handler failures are retried after a full-jitter exponential backoff:
+# a random delay in [0, min(MAX, BASE * 2 ** (retry - 1))] seconds.
+TASK_RETRY_BASE_SECONDS = float(os.getenv('TASK_RETRY_BASE_SECONDS', '5'))
+TASK_RETRY_MAX_SECONDS = float(os.getenv('TASK_RETRY_MAX_SECONDS', '600'))
+TASK_REPLAY_BATCH_SIZE = int(os.getenv('TASK_REPLAY_BATCH_SIZE', '500'))
+
+# Map-reduce (tasks.sharding): csv/ndjson inputs of at least TASK_SHARD_MIN_BYTES
+# are split into ~TASK_SHARD_BYTES ranges (at most TASK_SHARD_MAX) run on separate workers.
+TASK_SHARD_MIN_BYTES = int(os.getenv('TASK_SHARD_MIN_BYTES', str(256 * 1024 * 1024)))
+TASK_SHARD_BYTES = int(os.getenv('TASK_SHARD_BYTES', str(64 * 1024 * 1024)))
+TASK_SHARD_MAX = int(os.getenv('TASK_SHARD_MAX', '64'))
+
+# Largest task DAG accepted by POST /api/workflows/ (tasks.workflows).
+TASK_WORKFLOW_MAX_STEPS = int(os.getenv('TASK_WORKFLOW_MAX_STEPS', '100'))
+
+# Retention (tasks.retention): terminal tasks older than TASK_ARCHIVE_AFTER_DAYS
+# (0 disables) move to the archive table in throttled batches.
+TASK_ARCHIVE_AFTER_DAYS = int(os.getenv('TASK_ARCHIVE_AFTER_DAYS', '30'))
+TASK_ARCHIVE_BATCH_SIZE = int(os.getenv('TASK_ARCHIVE_BATCH_SIZE', '500'))
+TASK_ARCHIVE_PAUSE_SECONDS = float(os.getenv('TASK_ARCHIVE_PAUSE_SECONDS', '0.5'))
+TASK_ARCHIVE_MAX_SECONDS = float(os.getenv('TASK_ARCHIVE_MAX_SECONDS', '600'))
+
+CELERY_BEAT_SCHEDULE = {
+    'age-pending-tasks': {
+        'task': 'tasks.tasks.age_pending_tasks',
+        'schedule': float(os.getenv('TASK_PRIORITY_AGING_INTERVAL', '60')),
+    },
+    'reconcile-task-counters': {
+        'task': 'tasks.tasks.reconcile_task_counters',
+        'schedule': float(os.getenv('TASK_COUNTER_RECONCILE_INTERVAL', '3600')),
+    },
+    'archive-terminal-tasks': {
+        'task': 'tasks.tasks.archive_terminal_tasks',
+        'schedule': float(os.getenv('TASK_ARCHIVE_INTERVAL', '3600')),
+    },
+}
+
+# Handler execution pools used by tasks.engine (0 runs handlers inline). Prefork
+# workers (the default, see docker-compose) run CPU-bound handlers inline and get
+# their CPU parallelism from --concurrency; leave TASK_CPU_POOL_SIZE at 0 there.
+# Only set it for --pool=threads/solo workers, to the cores that worker may use.
+TASK_CPU_POOL_SIZE = int(os.getenv('TASK_CPU_POOL_SIZE', '0'))
+TASK_IO_POOL_SIZE = int(os.getenv('TASK_IO_POOL_SIZE', '8'))
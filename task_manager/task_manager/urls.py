@@ -6,9 +6,12 @@ from django.contrib import admin
 from django.urls import include, path
 from django.views.generic import TemplateView
 
+from tasks.views import metrics_view
+
 urlpatterns = [
     path('', TemplateView.as_view(template_name='index.html'), name='frontend-home'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/', include('users.urls')),
     path('api/', include('tasks.urls')),
 ]
\ No newline at end of file
@@ -11,6 +11,10 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from task_manager import boot
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_manager.settings')
 
-application = get_wsgi_application()
+with boot.phase('django.setup'):
+    application = get_wsgi_application()
+boot.log_report('wsgi')
@@ -1,9 +1,37 @@
 from django.contrib import admin
-from .models import Task
+from .models import ArchivedTask, Task, TaskDeadLetter, TaskOutbox, UserTaskStats, Workflow
 
 # Register your models here.
 
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
     list_display = ('title', 'user', 'status', 'created_at')
-    list_filter = ('status',) # This uses the index we created for optimization!
\ No newline at end of file
+    list_filter = ('status',) # This uses the index we created for optimization!
+
+
+@admin.register(UserTaskStats)
+class UserTaskStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'pending', 'processing', 'completed', 'failed', 'cancelled', 'updated_at')
+
+
+@admin.register(TaskOutbox)
+class TaskOutboxAdmin(admin.ModelAdmin):
+    list_display = ('task', 'priority', 'created_at', 'dispatched_at', 'attempts')
+    list_filter = ('dispatched_at',)
+
+
+@admin.register(TaskDeadLetter)
+class TaskDeadLetterAdmin(admin.ModelAdmin):
+    list_display = ('task', 'reason', 'error_type', 'attempts', 'created_at', 'replayed_at')
+    list_filter = ('reason', 'replayed_at')
+
+
+@admin.register(ArchivedTask)
+class ArchivedTaskAdmin(admin.ModelAdmin):
+    list_display = ('title', 'user', 'status', 'created_at', 'archived_at')
+
+
+@admin.register(Workflow)
+class WorkflowAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'status', 'created_at', 'completed_at')
+    list_filter = ('status',)
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class TasksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tasks'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from . import events  # noqa: F401  (connects the post_save publisher)
+        from .instrumentation import install_query_counter
+        from .search import install as install_search_index
+
+        connection_created.connect(install_query_counter, dispatch_uid='tasks.instrumentation.query_counter')
+        post_migrate.connect(install_search_index, sender=self, dispatch_uid='tasks.search.install')
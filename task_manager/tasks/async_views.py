@@ -0,0 +1,199 @@
+"""Native async implementations of the hot read endpoints (ASGI only).
+
+Served in place of the DRF views for the same URLs when
+``TASK_ASYNC_READ_VIEWS`` is on (``task_manager.asgi`` turns it on), so a
+status poll or list request costs a coroutine instead of a thread. Queries are
+built by :class:`~tasks.views.TaskViewSet` itself (filters, projection,
+pagination) and evaluated with the async ORM, so both stacks return identical
+responses. Writes on the same URLs are handed to the DRF views unchanged.
+"""
+
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from users.authentication import authenticate_async
+
+from . import events
+from .models import ArchivedTask, UserTaskStats
+from .serializers import HEAVY_FIELDS, TaskListSerializer, TaskStatusSerializer
+from .streams import TERMINAL_STATUSES
+from .views import TaskViewSet, status_aggregates
+
+logger = logging.getLogger(__name__)
+
+_list_view = TaskViewSet.as_view({'get': 'list', 'post': 'create'}, basename='task', detail=False)
+_detail_view = TaskViewSet.as_view(
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'},
+    basename='task',
+    detail=True,
+)
+
+
+def _render(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def _error(exc):
+    detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    return _render(detail, status=exc.status_code)
+
+
+async def _viewset(request, action, **kwargs):
+    """A TaskViewSet set up for ``action`` on behalf of the JWT user, or None if unauthenticated."""
+    user = await authenticate_async(request)
+    if user is None:
+        return None
+    view = TaskViewSet(action=action, kwargs=kwargs, format_kwarg=None, basename='task')
+    view.request = Request(request)
+    view.request.user = user
+    return view
+
+
+def _unauthorized():
+    return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+
+def _not_found():
+    return JsonResponse({'detail': 'Not found.'}, status=404)
+
+
+def _delegating(sync_view):
+    """Mark an async GET view CSRF-exempt and hand other methods to the DRF ``sync_view``."""
+
+    def decorator(func):
+        async def view(request, *args, **kwargs):
+            if request.method != 'GET':
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+            return await func(request, *args, **kwargs)
+
+        view.__name__ = func.__name__
+        view.__doc__ = func.__doc__
+        # Lets request metrics label the view as the DRF route it stands in for.
+        view.cls = sync_view.cls
+        view.actions = sync_view.actions
+        # Authentication is by bearer token, as on the DRF views.
+        view.csrf_exempt = True
+        return view
+
+    return decorator
+
+
+async def _archived(view, pk):
+    """The user's archived task ``pk`` (see tasks.retention), or None."""
+    return await ArchivedTask.objects.filter(user=view.request.user, pk=pk).afirst()
+
+
+@_delegating(_list_view)
+async def task_list(request):
+    """``GET /api/tasks/``: keyset-paginated, projected list."""
+    view = await _viewset(request, 'list')
+    if view is None:
+        return _unauthorized()
+    try:
+        queryset = view.filter_queryset(view.get_queryset())
+        paginator = view.paginator
+        page_queryset = paginator.get_page_queryset(queryset, view.request, view)
+        rows = [row async for row in (page_queryset if page_queryset is not None else queryset)]
+        if page_queryset is None:
+            return _render(view.get_serializer(rows, many=True).data)
+        page = paginator.set_page(rows)
+        return _render(paginator.get_paginated_response(view.get_serializer(page, many=True).data).data)
+    except APIException as exc:
+        return _error(exc)
+
+
+@_delegating(_detail_view)
+async def task_detail(request, pk):
+    """``GET /api/tasks/<pk>/``."""
+    view = await _viewset(request, 'retrieve', pk=pk)
+    if view is None:
+        return _unauthorized()
+    try:
+        task = await view.get_queryset().filter(pk=pk).afirst() or await _archived(view, pk)
+        if task is None:
+            return _not_found()
+        return _render(view.get_serializer(task).data)
+    except APIException as exc:
+        return _error(exc)
+
+
+def _changed(task, params):
+    """Whether ``task`` differs from the ``?last_status=``/``?last_progress=`` the client saw."""
+    if 'last_status' not in params and 'last_progress' not in params:
+        return False
+    if params.get('last_status', task.status) != task.status:
+        return True
+    return params.get('last_progress', str(task.progress)) != str(task.progress)
+
+
+@_delegating(TaskViewSet.as_view({'get': 'task_status'}, basename='task', detail=True))
+async def task_status(request, pk):
+    """``GET /api/tasks/<pk>/status/``, optionally long-polling with ``?wait=<seconds>``.
+
+    With ``wait`` the response is held until the task differs from the
+    ``last_status``/``last_progress`` given in the query (or, without them,
+    until its next event), the task finishes, or the wait runs out.
+    """
+    view = await _viewset(request, 'task_status', pk=pk)
+    if view is None:
+        return _unauthorized()
+    queryset = view.get_queryset().filter(pk=pk)
+    task = await queryset.afirst()
+    if task is None:
+        # Archived tasks are finished, so there is nothing to wait for.
+        task = await _archived(view, pk)
+        return _render(TaskStatusSerializer(task).data) if task else _not_found()
+
+    try:
+        wait = min(float(request.GET.get('wait') or 0), settings.TASK_LONG_POLL_MAX_SECONDS)
+    except ValueError:
+        return JsonResponse({'wait': 'Expected a number of seconds.'}, status=400)
+    if wait > 0 and task.status not in TERMINAL_STATUSES and not _changed(task, request.GET):
+        task = await _wait_for_change(queryset, task, wait, request.GET)
+    return _render(TaskStatusSerializer(task).data)
+
+
+async def _wait_for_change(queryset, task, wait, params):
+    subscription = events.subscribe([events.task_channel(task.pk)], timeout=wait)
+    try:
+        await subscription.__anext__()
+        # Re-read once subscribed so a change in between is not missed.
+        task = await queryset.afirst() or task
+        if not _changed(task, params) and task.status not in TERMINAL_STATUSES:
+            await asyncio.wait_for(subscription.__anext__(), timeout=wait)
+            task = await queryset.afirst() or task
+    except asyncio.TimeoutError:
+        pass
+    except Exception:
+        # Without pub/sub the poll degrades to an immediate answer.
+        logger.debug('Long-poll for task %s unavailable', task.pk, exc_info=True)
+    finally:
+        await subscription.aclose()
+    return task
+
+
+@_delegating(TaskViewSet.as_view({'get': 'dashboard_stats'}, basename='task', detail=False))
+async def dashboard_stats(request):
+    """``GET /api/tasks/dashboard_stats/``."""
+    view = await _viewset(request, 'dashboard_stats')
+    if view is None:
+        return _unauthorized()
+    user = view.request.user
+    if any(request.GET.get(name) for name in ('status', 'task_type', 'priority')):
+        stats = await view.get_queryset().aaggregate(**status_aggregates())
+    else:
+        counters = await UserTaskStats.objects.filter(user=user).afirst()
+        if counters is None:
+            await sync_to_async(UserTaskStats.objects.reconcile)(user.pk)
+            counters = await UserTaskStats.objects.aget(user=user)
+        stats = counters.as_dict()
+
+    recent_tasks = [task async for task in view.get_queryset().defer(*HEAVY_FIELDS)[:5]]
+    return _render({'stats': stats, 'recent_tasks': TaskListSerializer(recent_tasks, many=True).data})
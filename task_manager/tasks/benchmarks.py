@@ -0,0 +1,283 @@
+"""Benchmark harness: seeded dataset, endpoint scenarios with budgets, worker throughput.
+
+Used by ``manage.py benchmark`` and by the query-budget tests. Requests go
+through the Django test client in-process, so the numbers measure the
+application and database (authentication, query building, serialization)
+without network or server overhead. Broker and event-bus calls are stubbed out
+for the same reason; the outbox rows they would be fed from are still written.
+"""
+
+import io
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from datetime import timedelta
+from statistics import quantiles
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import Task, UserTaskStats
+from .tasks import process_task_file
+
+BENCH_PREFIX = 'bench-user-'
+# Tasks created while benchmarking (not part of the seeded dataset); removed afterwards.
+SCRATCH_TITLE = 'bench-run'
+
+_WORDS = ['invoice', 'report', 'backup', 'thumbnail', 'export', 'digest', 'audit', 'sync', 'import', 'archive']
+# Seeded status mix, by weight.
+_STATUSES = [('COMPLETED', 12), ('PENDING', 4), ('FAILED', 2), ('PROCESSING', 1), ('CANCELLED', 1)]
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    method: str
+    url_name: str
+    query: str = ''
+    detail: bool = False
+    # Budgets: SQL statements per request (transaction control excluded) and p99 latency.
+    max_queries: int = 1
+    max_p99_ms: float = 100.0
+    # Each iteration acts on a fresh PENDING scratch task (e.g. cancel).
+    needs_pending: bool = False
+    body: object = None
+
+
+SCENARIOS = [
+    Scenario('list', 'get', 'task-list', '?page_size=20', max_queries=1, max_p99_ms=50),
+    Scenario('filter', 'get', 'task-list', '?status=COMPLETED&priority=2&page_size=20', max_queries=1, max_p99_ms=50),
+    Scenario('search', 'get', 'task-list', '?search=invoice&page_size=20', max_queries=1, max_p99_ms=250),
+    Scenario('detail', 'get', 'task-detail', detail=True, max_queries=1, max_p99_ms=30),
+    Scenario('status', 'get', 'task-task-status', detail=True, max_queries=1, max_p99_ms=30),
+    Scenario('dashboard_stats', 'get', 'task-dashboard-stats', max_queries=2, max_p99_ms=50),
+    # Task INSERT, counter UPDATE, outbox INSERT.
+    Scenario('create', 'post', 'task-list', max_queries=3, max_p99_ms=80,
+             body=lambda i: {'title': f'{SCRATCH_TITLE} create {i}', 'task_type': 'REPORT_GENERATION'}),
+    Scenario('cancel', 'post', 'task-cancel', detail=True, needs_pending=True, max_queries=5, max_p99_ms=80),
+    # SQLite's parameter limit splits the 100-row task INSERT in three; one outbox INSERT.
+    Scenario('enqueue', 'post', 'task-bulk-create', max_queries=5, max_p99_ms=400,
+             body=lambda i: [{'title': f'{SCRATCH_TITLE} enqueue {i}.{n}', 'task_type': 'REPORT_GENERATION'}
+                             for n in range(100)]),
+]
+
+
+@contextmanager
+def offline():
+    """Stub out broker and pub/sub calls made on the request path."""
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch('tasks.events.publish'))
+        stack.enter_context(mock.patch('tasks.cancellation.revoke'))
+        stack.enter_context(mock.patch('tasks.tasks.terminate_cancelled_tasks.apply_async'))
+        yield
+
+
+def check_database(force=False):
+    """Refuse to seed anything but a SQLite database unless ``force`` is set."""
+    if connection.vendor != 'sqlite' and not force:
+        raise RuntimeError(
+            f'Refusing to seed benchmark data into a {connection.vendor} database; '
+            'run against the local SQLite database (USE_AZURE_SQL off) or pass force=True'
+        )
+
+
+def seed(users, tasks, batch_size=5000, seed_value=0, log=None, force=False):
+    """Make sure ``users`` bench users own at least ``tasks`` tasks between them; returns the users.
+
+    Data is generated from ``seed_value``, so a dataset of the same size is
+    built the same way on every run. Existing bench data is reused. Only
+    SQLite databases are seeded unless ``force`` is set (see :func:`check_database`).
+    """
+    check_database(force)
+    User = get_user_model()
+    existing = set(User.objects.filter(username__startswith=BENCH_PREFIX).values_list('username', flat=True))
+    password = make_password(None)
+    User.objects.bulk_create(
+        [
+            User(username=name, email=f'{name}@bench.example.com', password=password)
+            for name in (f'{BENCH_PREFIX}{index:05d}' for index in range(users))
+            if name not in existing
+        ],
+        batch_size=batch_size,
+    )
+    bench_users = list(User.objects.filter(username__startswith=BENCH_PREFIX).order_by('username')[:users])
+
+    rng = random.Random(seed_value)
+    statuses = [status for status, weight in _STATUSES for _ in range(weight)]
+    task_types = [value for value, _ in Task.TASK_TYPES]
+    have = Task.objects.filter(user__in=bench_users).count()
+    now = timezone.now()
+    for start in range(have, tasks, batch_size):
+        batch = []
+        for index in range(start, min(start + batch_size, tasks)):
+            status = statuses[index % len(statuses)]
+            words = rng.sample(_WORDS, 2)
+            task = Task(
+                user=bench_users[index % len(bench_users)],
+                title=f'{words[0].title()} {words[1]} #{index}',
+                description=f'Nightly {words[1]} for account {index % 997}',
+                task_type=task_types[index % len(task_types)],
+                priority=index % 4 + 1,
+                status=status,
+                input_data={'records': [{'value': index % 100}]},
+            )
+            if status in {'COMPLETED', 'FAILED'}:
+                task.started_at = now - timedelta(seconds=rng.randint(60, 86400))
+                task.completed_at = task.started_at + timedelta(seconds=rng.randint(1, 600))
+                task.progress = 100 if status == 'COMPLETED' else rng.randint(0, 99)
+            batch.append(task)
+        Task.objects.bulk_create(batch)
+        if log:
+            log(f'Seeded {start + len(batch)}/{tasks} tasks')
+
+    for user in bench_users:
+        UserTaskStats.objects.reconcile(user.pk)
+    return bench_users
+
+
+def cleanup(users):
+    """Delete scratch tasks created by scenarios and the worker harness."""
+    scratch = Task.objects.filter(user__in=users, title__startswith=SCRATCH_TITLE)
+    if scratch.exists():
+        scratch.delete()
+        for user in users:
+            UserTaskStats.objects.reconcile(user.pk)
+
+
+def client_for(user):
+    host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+    client = APIClient(HTTP_HOST=host)
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    return client
+
+
+def _percentile(values, q):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return quantiles(values, n=100, method='inclusive')[q - 1]
+
+
+def _statements(captured):
+    """Queries issued, not counting transaction control (BEGIN, COMMIT, savepoints)."""
+    return sum(
+        1 for query in captured.captured_queries
+        if 'SAVEPOINT' not in query['sql'] and query['sql'] not in {'BEGIN', 'COMMIT', 'ROLLBACK'}
+    )
+
+
+def run_scenario(client, user, scenario, iterations, warmup=1):
+    """Run ``scenario`` ``iterations`` times (after ``warmup`` untimed calls) and summarise it."""
+    task_id = Task.objects.filter(user=user).exclude(title__startswith=SCRATCH_TITLE).values_list('pk', flat=True)[:1]
+    task_id = task_id[0] if task_id else None
+    pending = []
+    if scenario.needs_pending:
+        pending = Task.objects.bulk_create(
+            [Task(user=user, title=f'{SCRATCH_TITLE} {scenario.name} {i}') for i in range(warmup + iterations)]
+        )
+        UserTaskStats.objects.record(user.pk, {'PENDING': len(pending)})
+
+    latencies, statements, errors = [], [], 0
+    for i in range(warmup + iterations):
+        pk = pending[i].pk if scenario.needs_pending else task_id
+        path = reverse(scenario.url_name, args=[pk] if scenario.detail else []) + scenario.query
+        data = scenario.body(i) if scenario.body else None
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(client, scenario.method)(path, data, format='json') if data is not None \
+                else getattr(client, scenario.method)(path)
+            elapsed = time.perf_counter() - started
+        if i < warmup:
+            continue
+        if response.status_code >= 400:
+            errors += 1
+        latencies.append(elapsed)
+        statements.append(_statements(captured))
+
+    latencies.sort()
+    result = {
+        'name': scenario.name,
+        'iterations': iterations,
+        'queries': max(statements),
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(_percentile(latencies, 99) * 1000, 3),
+        'req_per_s': round(iterations / sum(latencies), 1),
+        'errors': errors,
+        'max_queries': scenario.max_queries,
+        'max_p99_ms': scenario.max_p99_ms,
+    }
+    result['within_budget'] = (
+        not errors and result['queries'] <= scenario.max_queries and result['p99_ms'] <= scenario.max_p99_ms
+    )
+    return result
+
+
+def _png():
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (40, 120, 200)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _worker_input(task_type, index):
+    # ``nonce`` keeps cacheable handlers from being answered by tasks.result_cache.
+    if task_type in {'DATA_PROCESSING', 'FILE_CONVERSION'}:
+        records = [{'id': n, 'value': (n * 7 + index) % 101, 'label': f'row{n}'} for n in range(1000)]
+        return {'records': records, 'target_format': 'csv', 'nonce': index}
+    if task_type == 'IMAGE_PROCESSING':
+        return {'format': 'JPEG', 'max_size': [128, 128], 'nonce': index}
+    if task_type == 'EMAIL_NOTIFICATION':
+        return {'subject': 'Bench', 'message': 'Benchmark', 'recipients': ['bench@example.com']}
+    return {}
+
+
+def worker_throughput(user, per_type):
+    """Run ``per_type`` tasks of every registered type through ``process_task_file``; tasks/sec per type."""
+    image = default_storage.save('task_inputs/bench.png', ContentFile(_png()))
+    results = []
+    try:
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            for task_type, _ in Task.TASK_TYPES:
+                tasks = Task.objects.bulk_create([
+                    Task(
+                        user=user,
+                        title=f'{SCRATCH_TITLE} worker {task_type} {i}',
+                        task_type=task_type,
+                        input_data=_worker_input(task_type, i),
+                        input_file=image if task_type == 'IMAGE_PROCESSING' else None,
+                    )
+                    for i in range(per_type + 1)
+                ])
+                UserTaskStats.objects.record(user.pk, {'PENDING': len(tasks)})
+                # The first task warms up the handler's pool and imports; it is not timed.
+                process_task_file(str(tasks[0].pk))
+                durations, completed = [], 0
+                for task in tasks[1:]:
+                    started = time.perf_counter()
+                    completed += bool(process_task_file(str(task.pk)))
+                    durations.append(time.perf_counter() - started)
+                results.append({
+                    'task_type': task_type,
+                    'tasks': per_type,
+                    'completed': completed,
+                    'tasks_per_s': round(per_type / sum(durations), 1),
+                    'p50_ms': round(_percentile(sorted(durations), 50) * 1000, 3),
+                })
+    finally:
+        default_storage.delete(image)
+        for name in Task.objects.filter(user=user, title__startswith=SCRATCH_TITLE).exclude(output_file='') \
+                .values_list('output_file', flat=True):
+            if name:
+                default_storage.delete(name)
+    return results
@@ -0,0 +1,116 @@
+"""Cancelling pending and running tasks.
+
+Cancelling marks the rows CANCELLED and revokes their Celery messages (the
+Celery id is the Task id), so queued work is dropped before it executes.
+Handlers already running see the new status through a
+:class:`CancellationToken` checked at their progress points and stop early.
+Any that are still running after ``TASK_CANCEL_GRACE_SECONDS`` are terminated:
+by ``tasks.tasks.terminate_cancelled_tasks`` when they run inline in a prefork
+worker child, or by the engine when they run in its process pool (see
+:mod:`tasks.engine`).
+"""
+
+import logging
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from . import events, workflows
+from .models import Task, UserTaskStats
+
+logger = logging.getLogger(__name__)
+
+CANCELLABLE_STATUSES = ('PENDING', 'PROCESSING')
+
+
+class TaskCancelled(Exception):
+    """Raised inside a handler when its task has been cancelled."""
+
+
+class CancellationToken:
+    """Cooperative cancellation check for a running task.
+
+    ``is_cancelled()`` is cheap enough to call at every progress point: the
+    task row is read at most once per ``TASK_CANCEL_CHECK_MS``.
+    """
+
+    def __init__(self, task_id, interval_ms=None, clock=time.monotonic):
+        self.task_id = task_id
+        self.interval = (interval_ms if interval_ms is not None else settings.TASK_CANCEL_CHECK_MS) / 1000
+        self.clock = clock
+        self.cancelled = False
+        self._checked_at = None
+
+    def is_cancelled(self):
+        if self.cancelled:
+            return True
+        now = self.clock()
+        if self._checked_at is None or now - self._checked_at >= self.interval:
+            self._checked_at = now
+            self.cancelled = Task.objects.filter(pk=self.task_id, status='CANCELLED').exists()
+        return self.cancelled
+
+    def raise_if_cancelled(self):
+        if self.is_cancelled():
+            raise TaskCancelled(f'Task {self.task_id} was cancelled')
+
+
+def revoke(task_ids, terminate=False):
+    """Revoke the Celery messages for ``task_ids``; never raises."""
+    from .tasks import process_task_file
+
+    if not task_ids:
+        return
+    try:
+        process_task_file.app.control.revoke([str(task_id) for task_id in task_ids], terminate=terminate)
+    except Exception:
+        logger.warning('Could not revoke %d task(s)', len(task_ids), exc_info=True)
+
+
+def _after_cancel(rows):
+    revoke([task_id for task_id, _, _ in rows])
+    running = [str(task_id) for task_id, _, previous in rows if previous == 'PROCESSING']
+    if running:
+        from .tasks import terminate_cancelled_tasks
+
+        try:
+            terminate_cancelled_tasks.apply_async(args=[running], countdown=settings.TASK_CANCEL_GRACE_SECONDS)
+        except Exception:
+            logger.warning('Could not schedule termination of %d task(s)', len(running), exc_info=True)
+    for task_id, user_id, _ in rows:
+        events.publish({'id': str(task_id), 'user': user_id, 'status': 'CANCELLED'})
+
+
+def cancel_tasks(queryset, batch_size=None):
+    """Cancel every pending or processing task in ``queryset``; returns how many."""
+    batch_size = batch_size or settings.TASK_CANCEL_BATCH_SIZE
+    ids = list(queryset.filter(status__in=CANCELLABLE_STATUSES).values_list('pk', flat=True))
+    cancelled = 0
+    for start in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            rows = list(
+                Task.objects.select_for_update()
+                .filter(pk__in=ids[start:start + batch_size], status__in=CANCELLABLE_STATUSES)
+                .values_list('pk', 'user_id', 'status', 'workflow_id')
+            )
+            if not rows:
+                continue
+            in_workflows = [pk for pk, _, _, workflow_id in rows if workflow_id]
+            rows = [(pk, user_id, previous) for pk, user_id, previous, _ in rows]
+            Task.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(status='CANCELLED')
+
+            deltas = defaultdict(Counter)
+            for _, user_id, previous in rows:
+                deltas[user_id][previous] -= 1
+                deltas[user_id]['CANCELLED'] += 1
+            for user_id, changes in deltas.items():
+                UserTaskStats.objects.record(user_id, changes)
+            if in_workflows:
+                # Steps downstream of a cancelled workflow step can never run.
+                workflows.halt(in_workflows, 'CANCELLED')
+
+            transaction.on_commit(lambda rows=rows: _after_cancel(rows))
+        cancelled += len(rows)
+    return cancelled
@@ -0,0 +1,199 @@
+"""Execution pools for task handlers.
+
+Under the default prefork Celery worker, CPU-bound handlers run inline in the
+worker child and CPU parallelism comes from ``--concurrency``: prefork
+children are daemonic and may not start processes of their own. Workers run
+with ``--pool=threads`` or ``--pool=solo`` can instead set
+``TASK_CPU_POOL_SIZE`` to give the one worker process a shared process pool,
+so its threads use every core without fighting over the GIL. I/O-bound
+handlers run on a thread pool (or an event loop for coroutine handlers). Both
+pools are created lazily on first use, and a process pool broken by a dead
+child is replaced on the next call.
+
+Cancelled tasks are hard-stopped where they run: in prefork children by
+Celery's ``revoke(terminate=True)``; in the process pool by the worker thread
+waiting on the handler, which kills the pool process running it once the task
+has stayed cancelled for ``TASK_CANCEL_GRACE_SECONDS`` (the pool is replaced,
+and other handlers it was running are retried). This module must not import models at
+import time: spawned pool processes unpickle references to it before
+``django.setup()`` has run.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_process_pool = None
+_thread_pool = None
+_inline_warned = False
+# Pool processes report (task_id, pid) on this queue when they start a handler.
+_started = None
+_pids = {}
+# Set in process-pool children only; handlers run anywhere else never report a pid.
+_in_pool_process = False
+
+
+def _init_pool_process(settings_module, started):
+    global _started, _in_pool_process
+    _started = started
+    _in_pool_process = True
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+
+    django.setup()
+
+
+def _in_daemon_process():
+    """True in prefork worker children, which cannot have child processes."""
+    if multiprocessing.current_process().daemon:
+        return True
+    try:
+        from billiard.process import current_process
+    except ImportError:
+        return False
+    return bool(current_process().daemon)
+
+
+def _use_process_pool():
+    global _inline_warned
+    if settings.TASK_CPU_POOL_SIZE <= 0:
+        return False
+    if _in_daemon_process():
+        if not _inline_warned:
+            _inline_warned = True
+            logger.warning('TASK_CPU_POOL_SIZE is ignored in daemonic (prefork) workers; running handlers inline')
+        return False
+    return True
+
+
+def _get_process_pool():
+    global _process_pool, _started
+    with _lock:
+        # A pool whose child died is unusable for good; start a fresh one.
+        if _process_pool is None or _process_pool._broken:
+            if _process_pool is not None:
+                logger.warning('Replacing broken handler process pool: %s', _process_pool._broken)
+                _process_pool.shutdown(wait=False, cancel_futures=True)
+            # spawn keeps children from inheriting the parent's DB connections.
+            context = multiprocessing.get_context('spawn')
+            _started = context.SimpleQueue()
+            _pids.clear()
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.TASK_CPU_POOL_SIZE,
+                mp_context=context,
+                initializer=_init_pool_process,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'task_manager.settings'), _started),
+            )
+        return _process_pool
+
+
+def _get_thread_pool():
+    global _thread_pool
+    with _lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=settings.TASK_IO_POOL_SIZE, thread_name_prefix='task-io'
+            )
+        return _thread_pool
+
+
+def _call(task_type, ctx):
+    """Run a handler in the current process; returns ``(output_data, output_file)``."""
+    from . import progress
+    from .handlers import get_handler
+
+    func = get_handler(task_type).func
+    if _in_pool_process:
+        _started.put((ctx.task_id, os.getpid()))
+    try:
+        if asyncio.iscoroutinefunction(func):
+            output = asyncio.run(func(ctx))
+        else:
+            output = func(ctx)
+    finally:
+        # Progress held back in this process must land before the task is finalised.
+        progress.release(ctx.task_id)
+    return output or {}, ctx.output_file
+
+
+def run_handler(ctx):
+    """Run the handler for ``ctx.task_type`` on the pool that suits it."""
+    from .handlers import get_handler
+
+    handler = get_handler(ctx.task_type)
+    if handler.cpu_bound and _use_process_pool():
+        pool = _get_process_pool()
+        try:
+            return _wait_killable(pool, pool.submit(_call, ctx.task_type, ctx), ctx)
+        finally:
+            _pool_pid(ctx.task_id)
+            with _lock:
+                _pids.pop(ctx.task_id, None)
+    elif not handler.cpu_bound and settings.TASK_IO_POOL_SIZE > 0:
+        future = _get_thread_pool().submit(_call, ctx.task_type, ctx)
+    else:
+        return _call(ctx.task_type, ctx)
+    return future.result()
+
+
+def _pool_pid(task_id):
+    """Pid of the pool process that started ``task_id``'s handler, if known."""
+    with _lock:
+        while _started is not None and not _started.empty():
+            started_id, pid = _started.get()
+            _pids[started_id] = pid
+        return _pids.get(task_id)
+
+
+def _wait_killable(pool, future, ctx):
+    """Wait for a pool handler; kill its process if the task stays cancelled past the grace period."""
+    from .cancellation import TaskCancelled
+
+    interval = settings.TASK_CANCEL_CHECK_MS / 1000
+    cancelled_at = None
+    while True:
+        try:
+            return future.result(timeout=interval)
+        except FutureTimeout:
+            pass
+        if cancelled_at is None:
+            if ctx.cancellation.is_cancelled():
+                cancelled_at = time.monotonic()
+        elif time.monotonic() - cancelled_at >= settings.TASK_CANCEL_GRACE_SECONDS:
+            pid = _pool_pid(ctx.task_id)
+            # Only ever signal a process of this pool, and never this one.
+            if pid != os.getpid() and pid in (pool._processes or {}):
+                logger.warning('Killing pool process %s still running cancelled task %s', pid, ctx.task_id)
+                os.kill(pid, signal.SIGKILL)
+            raise TaskCancelled(f'Task {ctx.task_id} was cancelled')
+
+
+def map_cpu(func, *iterables):
+    """``map`` on the process pool (in process when it is disabled); ``func`` must be top-level.
+
+    For I/O-bound handlers and worker code that fan CPU work out themselves;
+    never call it from a handler already running in the process pool.
+    """
+    if _use_process_pool():
+        return list(_get_process_pool().map(func, *iterables))
+    return list(map(func, *iterables))
+
+
+def shutdown():
+    global _process_pool, _thread_pool
+    with _lock:
+        for pool in (_process_pool, _thread_pool):
+            if pool is not None:
+                pool.shutdown(wait=True)
+        _process_pool = _thread_pool = None
@@ -0,0 +1,156 @@
+"""Task status/progress events over Redis pub/sub.
+
+Workers and API processes publish a small JSON event whenever a task's status
+or progress changes; the SSE views in ``tasks.streams`` relay them to clients
+subscribed to one task or to all of a user's tasks.
+
+:func:`publish` only queues the event: a background thread per process sends
+queued events in pipelined batches, with short socket timeouts, so a slow or
+hung Redis never holds up the request or task that changed the row. Events
+that do not fit in the queue (``TASK_EVENTS_QUEUE_SIZE``) are dropped; clients
+catch up from the status endpoint.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_lock = threading.Lock()
+_outgoing = None
+_publisher_pid = None
+# Events sent per pipeline round trip.
+BATCH_SIZE = 100
+
+
+def task_channel(task_id):
+    return f'tasks:task:{task_id}'
+
+
+def user_channel(user_id):
+    return f'tasks:user:{user_id}'
+
+
+def _redis():
+    global _client
+    if _client is None:
+        import redis
+
+        _client = redis.Redis.from_url(
+            settings.TASK_EVENTS_REDIS_URL,
+            socket_connect_timeout=settings.TASK_EVENTS_SOCKET_TIMEOUT,
+            socket_timeout=settings.TASK_EVENTS_SOCKET_TIMEOUT,
+        )
+    return _client
+
+
+def task_event(task, **fields):
+    """The event payload for ``task``; ``fields`` override the row's values."""
+    from .serializers import TaskStatusSerializer
+
+    if not fields:
+        fields = TaskStatusSerializer(task).data
+    return {'id': str(task.pk), 'user': task.user_id, **fields}
+
+
+def _queue():
+    """This process's outgoing queue; the publisher thread is (re)started after a fork."""
+    global _outgoing, _publisher_pid
+    with _lock:
+        if _publisher_pid != os.getpid():
+            _outgoing = queue.Queue(maxsize=settings.TASK_EVENTS_QUEUE_SIZE)
+            threading.Thread(target=_run, args=(_outgoing,), name='task-events', daemon=True).start()
+            _publisher_pid = os.getpid()
+        return _outgoing
+
+
+def _take(outgoing, block=True):
+    batch = []
+    try:
+        if block:
+            batch.append(outgoing.get())
+        while len(batch) < BATCH_SIZE:
+            batch.append(outgoing.get_nowait())
+    except queue.Empty:
+        pass
+    return batch
+
+
+def _send(batch):
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for event in batch:
+            message = json.dumps(event, cls=DjangoJSONEncoder)
+            pipe.publish(task_channel(event['id']), message)
+            pipe.publish(user_channel(event['user']), message)
+        pipe.execute()
+    except Exception:
+        logger.debug('Could not publish %d task events', len(batch), exc_info=True)
+
+
+def _run(outgoing):
+    while True:
+        _send(_take(outgoing))
+
+
+@atexit.register
+def _drain():
+    """Send what is still queued when the process exits."""
+    if _publisher_pid == os.getpid():
+        while batch := _take(_outgoing, block=False):
+            _send(batch)
+
+
+def publish(event):
+    """Queue ``event`` for its task and user channels; never blocks or raises."""
+    try:
+        _queue().put_nowait(event)
+    except queue.Full:
+        logger.debug('Dropping event for task %s: publish queue full', event['id'])
+
+
+def publish_task(task, **fields):
+    publish(task_event(task, **fields))
+
+
+@receiver(post_save, sender='tasks.Task', dispatch_uid='tasks.events.publish_on_save')
+def publish_on_save(sender, instance, update_fields=None, **kwargs):
+    """Publish status/progress changes once the surrounding transaction commits."""
+    if update_fields is not None and not {'status', 'progress'} & set(update_fields):
+        return
+    event = task_event(instance)
+    transaction.on_commit(lambda: publish(event))
+
+
+async def subscribe(channels, timeout):
+    """Yield decoded events from ``channels``.
+
+    Yields None once the subscription is active and whenever ``timeout``
+    seconds pass without a message, so callers can send keep-alives.
+    """
+    import redis.asyncio as aioredis
+
+    client = aioredis.Redis.from_url(
+        settings.TASK_EVENTS_REDIS_URL, socket_connect_timeout=settings.TASK_EVENTS_SOCKET_TIMEOUT
+    )
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(*channels)
+        yield None
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+            yield json.loads(message['data']) if message else None
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
@@ -0,0 +1,83 @@
+"""Constant-memory NDJSON/CSV encoders for task exports.
+
+Rows are read in keyset batches of ``TASK_EXPORT_BATCH_SIZE`` ordered by
+``(created_at, id)``: each batch is a short indexed query and nothing but the
+current batch is held in memory, however long the history is.
+"""
+
+import csv
+import io
+import json
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .models import Task
+
+EXPORT_FIELDS = [
+    field.attname for field in Task._meta.concrete_fields if field.attname != 'queued_priority'
+]
+JSON_FIELDS = {'input_data', 'output_data'}
+
+
+def iter_rows(queryset, batch_size=None):
+    """Yield ``values()`` dicts for ``queryset`` in ``(created_at, id)`` order."""
+    batch_size = batch_size or settings.TASK_EXPORT_BATCH_SIZE
+    queryset = queryset.order_by('created_at', 'id').values(*EXPORT_FIELDS)
+    last = None
+    while True:
+        batch = queryset
+        if last is not None:
+            batch = batch.filter(
+                Q(created_at__gt=last['created_at']) | Q(created_at=last['created_at'], id__gt=last['id'])
+            )
+        rows = list(batch[:batch_size])
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last = rows[-1]
+
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        for name in JSON_FIELDS:
+            row[name] = json.dumps(row[name], cls=DjangoJSONEncoder)
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def encode(lines, flush_bytes=64 * 1024):
+    """Group text lines into ~``flush_bytes`` UTF-8 chunks to cut per-write overhead."""
+    pending, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= flush_bytes:
+            yield b''.join(pending)
+            pending, size = [], 0
+    if pending:
+        yield b''.join(pending)
+
+
+def gzip_stream(chunks, level=6):
+    """Incrementally gzip a byte stream."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,405 @@
+"""Task-type handler registry and the built-in handlers.
+
+Each entry in ``Task.TASK_TYPES`` maps to exactly one handler. A handler is a
+plain function that receives a :class:`HandlerContext` and returns the dict
+stored in ``Task.output_data``. CPU-bound handlers run in the engine's process
+pool, so they must be importable top-level functions and must only rely on
+what the context carries.
+
+Handlers registered with a ``merge`` function can also run as map-reduce over
+large input files (see :mod:`tasks.sharding`): the handler runs once per shard
+with ``ctx.shard`` set, and ``merge(ctx, outputs)`` combines the shard outputs
+into the task's result.
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.core.mail import send_mail
+from django.db import models
+
+from . import images, progress, sharding
+from .cancellation import CancellationToken
+from .models import Task
+from .utils.file_handler import FileHandler
+
+
+@dataclass(frozen=True)
+class Handler:
+    task_type: str
+    func: Callable
+    cpu_bound: bool = False
+    version: int = 1
+    # Deterministic in its inputs, so results may be reused (see tasks.result_cache).
+    cacheable: bool = False
+    # merge(ctx, outputs) -> output_data; lets large inputs be split into shards.
+    merge: Optional[Callable] = None
+
+
+@dataclass
+class HandlerContext:
+    """Everything a handler may use; picklable so it can cross the process pool."""
+
+    task_id: str
+    user_id: int
+    task_type: str
+    input_data: dict
+    input_file: Optional[str] = None
+    output_file: Optional[str] = None
+    cancellation: Optional[CancellationToken] = field(default=None, repr=False)
+    shard: Optional[sharding.Shard] = None
+
+    def __post_init__(self):
+        if self.cancellation is None:
+            self.cancellation = CancellationToken(self.task_id)
+
+    def open_input(self, mode='rb'):
+        if not self.input_file:
+            raise ValueError('Task has no input file')
+        return default_storage.open(self.input_file, mode)
+
+    def save_output(self, filename, content):
+        """Store ``content`` (text, bytes or a file) as the task's output file and return its storage name."""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        content = ContentFile(content) if isinstance(content, bytes) else File(content)
+        self.output_file = default_storage.save(f'task_outputs/{filename}', content)
+        return self.output_file
+
+    def report_progress(self, percent):
+        """Cheap to call often: writes are coalesced by :mod:`tasks.progress`.
+
+        Also a cancellation point; raises ``TaskCancelled`` once the task has
+        been cancelled.
+        """
+        progress.get_reporter(self.task_id, self.user_id).report(percent)
+        self.cancellation.raise_if_cancelled()
+
+    def raise_if_cancelled(self):
+        """Cancellation point for handlers that do not report progress."""
+        self.cancellation.raise_if_cancelled()
+
+
+_registry: dict[str, Handler] = {}
+
+
+def register(task_type, *, cpu_bound=False, version=1, cacheable=False, merge=None):
+    """Register the decorated function as the handler for ``task_type``."""
+    if task_type not in dict(Task.TASK_TYPES):
+        raise ValueError(f'Unknown task type: {task_type}')
+
+    def decorator(func):
+        _registry[task_type] = Handler(
+            task_type, func, cpu_bound=cpu_bound, version=version, cacheable=cacheable, merge=merge
+        )
+        return func
+
+    return decorator
+
+
+def get_handler(task_type):
+    try:
+        return _registry[task_type]
+    except KeyError:
+        raise LookupError(f'No handler registered for task type {task_type}') from None
+
+
+def input_format(ctx):
+    fmt = ctx.input_data.get('input_format')
+    if not fmt and ctx.input_file:
+        fmt = os.path.splitext(ctx.input_file)[1].lstrip('.')
+    return (fmt or 'json').lower()
+
+
+def iter_records(ctx):
+    """Yield input records as dicts from ``input_data['records']`` or the input file."""
+    if 'records' in ctx.input_data:
+        yield from ctx.input_data['records']
+        return
+
+    fmt = input_format(ctx)
+    if ctx.shard is not None:
+        yield from _iter_shard(ctx, fmt)
+        return
+    with ctx.open_input('rb') as raw:
+        text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        if fmt == 'csv':
+            yield from csv.DictReader(text)
+        elif fmt in {'ndjson', 'jsonl'}:
+            for line in text:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(text)
+
+
+def _iter_shard(ctx, fmt):
+    lines = sharding.iter_lines(ctx.input_file, ctx.shard.start, ctx.shard.end)
+    if fmt == 'csv':
+        records = csv.DictReader(lines, fieldnames=ctx.shard.fieldnames)
+    else:
+        records = (json.loads(line) for line in lines if line.strip())
+    for count, record in enumerate(records, 1):
+        if count % 1000 == 0:
+            ctx.raise_if_cancelled()
+        yield record
+
+
+def _to_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def merge_stats(ctx, outputs):
+    """Combine the shards' column statistics; means are recomputed from the merged sums."""
+    rows = 0
+    columns = {}
+    for output in outputs:
+        rows += output['rows']
+        for key, part in output['columns'].items():
+            col = columns.get(key)
+            if col is None:
+                columns[key] = {name: part[name] for name in ('count', 'sum', 'min', 'max')}
+            else:
+                col['count'] += part['count']
+                col['sum'] += part['sum']
+                col['min'] = min(col['min'], part['min'])
+                col['max'] = max(col['max'], part['max'])
+
+    for col in columns.values():
+        col['mean'] = col['sum'] / col['count']
+    return {'rows': rows, 'columns': columns}
+
+
+@register('DATA_PROCESSING', cpu_bound=True, cacheable=True, merge=merge_stats)
+def process_data(ctx):
+    """Compute per-column count/sum/min/max/mean over the numeric fields."""
+    rows = 0
+    columns = {}
+    total = len(ctx.input_data['records']) if 'records' in ctx.input_data else None
+    for record in iter_records(ctx):
+        rows += 1
+        if total and rows % 1000 == 0:
+            ctx.report_progress(rows * 100 // total)
+        for key, value in record.items():
+            number = _to_number(value)
+            if number is None:
+                continue
+            col = columns.get(key)
+            if col is None:
+                columns[key] = {'count': 1, 'sum': number, 'min': number, 'max': number}
+            else:
+                col['count'] += 1
+                col['sum'] += number
+                col['min'] = min(col['min'], number)
+                col['max'] = max(col['max'], number)
+
+    for col in columns.values():
+        col['mean'] = col['sum'] / col['count']
+    return {'rows': rows, 'columns': columns}
+
+
+def _collect_fieldnames(records):
+    fieldnames = []
+    for record in records:
+        fieldnames.extend(key for key in record if key not in fieldnames)
+    return fieldnames
+
+
+def _convert_shard(ctx, target):
+    """Write the shard's records as a fragment :func:`merge_conversions` can append as is."""
+    records = list(iter_records(ctx))
+    fieldnames = []
+    if target == 'csv':
+        fieldnames = _collect_fieldnames(records)
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, fieldnames=fieldnames).writerows(records)
+        content = buffer.getvalue()
+    elif target in {'ndjson', 'jsonl'}:
+        content = ''.join(json.dumps(record) + '\n' for record in records)
+    elif target == 'json':
+        # Joined like json.dumps joins list items, so the merged file matches an unsharded run.
+        content = ', '.join(json.dumps(record) for record in records)
+    else:
+        raise ValueError(f'Unsupported target format: {target}')
+
+    name = ctx.save_output(f'{ctx.task_id}.part{ctx.shard.index:05d}.{target}', content)
+    return {'format': target, 'rows': len(records), 'part': name, 'fieldnames': fieldnames}
+
+
+def merge_conversions(ctx, outputs):
+    """Join the shards' fragments, in input order, into the task's output file."""
+    target = ctx.input_data.get('target_format', 'json').lower()
+    parts = [output for output in outputs if output['rows']]
+    with tempfile.TemporaryFile() as out:
+        if target == 'csv':
+            fieldnames = []
+            for output in parts:
+                fieldnames.extend(key for key in output['fieldnames'] if key not in fieldnames)
+            text = io.TextIOWrapper(out, encoding='utf-8', newline='')
+            writer = csv.DictWriter(text, fieldnames=fieldnames)
+            writer.writeheader()
+            for output in parts:
+                if output['fieldnames'] == fieldnames:
+                    text.flush()
+                    sharding.copy_part(output['part'], out)
+                    continue
+                # Columns differ from the merged header: re-lay the rows out under it.
+                with default_storage.open(output['part'], 'rb') as raw:
+                    rows = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+                    writer.writerows(csv.DictReader(rows, fieldnames=output['fieldnames']))
+            text.flush()
+            text.detach()
+        elif target == 'json':
+            out.write(b'[')
+            for index, output in enumerate(parts):
+                if index:
+                    out.write(b', ')
+                sharding.copy_part(output['part'], out)
+            out.write(b']')
+        else:
+            for output in parts:
+                sharding.copy_part(output['part'], out)
+        out.seek(0)
+        name = ctx.save_output(f'{ctx.task_id}.{target}', out)
+    sharding.discard_parts(outputs)
+    return {'format': target, 'rows': sum(output['rows'] for output in outputs), 'output_file': name}
+
+
+@register('FILE_CONVERSION', cpu_bound=True, cacheable=True, merge=merge_conversions)
+def convert_file(ctx):
+    """Convert tabular input between csv, json and ndjson."""
+    target = ctx.input_data.get('target_format', 'json').lower()
+    if ctx.shard is not None:
+        return _convert_shard(ctx, target)
+    records = list(iter_records(ctx))
+
+    if target == 'csv':
+        fieldnames = _collect_fieldnames(records)
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(records)
+        content = buffer.getvalue()
+    elif target in {'ndjson', 'jsonl'}:
+        content = ''.join(json.dumps(record) + '\n' for record in records)
+    elif target == 'json':
+        content = json.dumps(records)
+    else:
+        raise ValueError(f'Unsupported target format: {target}')
+
+    name = ctx.save_output(f'{ctx.task_id}.{target}', content)
+    return {'format': target, 'rows': len(records), 'output_file': name}
+
+
+def unowned_files(user_id, names):
+    """The storage names in ``names`` that are neither input nor output file of a task of ``user_id``."""
+    owned = Task.objects.filter(user_id=user_id).filter(
+        models.Q(input_file__in=names) | models.Q(output_file__in=names)
+    )
+    known = {name for pair in owned.values_list('input_file', 'output_file') for name in pair}
+    return [name for name in names if name not in known]
+
+
+def _owned_images(ctx, names):
+    missing = unowned_files(ctx.user_id, names)
+    if missing:
+        raise ValueError(f'Unknown images: {", ".join(missing)}')
+    return names
+
+
+@register('IMAGE_PROCESSING', version=2, cacheable=True)
+def process_image(ctx):
+    """Resize/convert images into one or more renditions each.
+
+    ``input_data['images']`` lists stored images (inputs or outputs of the
+    owner's tasks) to process as one batch; by default the input file is the
+    only one. ``input_data['renditions']`` lists ``{name, max_size, format,
+    mode, quality}`` specs; without it, a single rendition is built from the
+    top-level ``format``, ``max_size`` and ``mode``. The first rendition of
+    the first image becomes the task's output file.
+    """
+    if ctx.input_data.get('images'):
+        sources = _owned_images(ctx, list(ctx.input_data['images']))
+    elif ctx.input_file:
+        sources = [ctx.input_file]
+    else:
+        raise ValueError('IMAGE_PROCESSING requires an input file or input_data["images"]')
+    specs = ctx.input_data.get('renditions') or [{
+        'name': 'image',
+        'format': ctx.input_data.get('format', 'PNG'),
+        'max_size': ctx.input_data.get('max_size'),
+        'mode': ctx.input_data.get('mode'),
+    }]
+    renditions = [images.Rendition.from_dict(spec) for spec in specs]
+
+    contents = FileHandler.open_many(sources)
+    results = images.render_many([contents[name] for name in sources], renditions)
+
+    items, described = [], []
+    for index, (source, rendered) in enumerate(zip(sources, results)):
+        entry = {'source': source, 'renditions': {}}
+        for rendition, output in zip(renditions, rendered):
+            name = f'task_outputs/{ctx.task_id}/{index}_{rendition.name}.{rendition.extension}'
+            items.append((name, ContentFile(output['content'])))
+            entry['renditions'][rendition.name] = {
+                'width': output['width'], 'height': output['height'], 'format': output['format'],
+            }
+        described.append(entry)
+    paths = iter(FileHandler.save_many(items))
+    for entry in described:
+        for output in entry['renditions'].values():
+            output['output_file'] = next(paths)
+
+    first = described[0]['renditions'][renditions[0].name]
+    ctx.output_file = first['output_file']
+    return {**first, 'images': described}
+
+
+@register('REPORT_GENERATION')
+def generate_report(ctx):
+    """Summarise the owner's tasks by status and type as a CSV report."""
+    queryset = Task.objects.filter(user_id=ctx.user_id).exclude(pk=ctx.task_id)
+    if ctx.input_data.get('since'):
+        queryset = queryset.filter(created_at__gte=ctx.input_data['since'])
+    if ctx.input_data.get('until'):
+        queryset = queryset.filter(created_at__lt=ctx.input_data['until'])
+
+    rows = list(
+        queryset.values('task_type', 'status').annotate(count=models.Count('id')).order_by('task_type', 'status')
+    )
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=['task_type', 'status', 'count'])
+    writer.writeheader()
+    writer.writerows(rows)
+    name = ctx.save_output(f'report_{ctx.task_id}.csv', buffer.getvalue())
+    return {'total': sum(row['count'] for row in rows), 'rows': len(rows), 'output_file': name}
+
+
+@register('EMAIL_NOTIFICATION')
+def send_notification(ctx):
+    """Send the email described by ``input_data`` (subject, message, recipients)."""
+    recipients = ctx.input_data.get('recipients') or []
+    if not recipients:
+        raise ValueError('EMAIL_NOTIFICATION requires at least one recipient')
+    sent = send_mail(
+        ctx.input_data.get('subject', ''),
+        ctx.input_data.get('message', ''),
+        ctx.input_data.get('from_email'),
+        recipients,
+    )
+    return {'sent': sent, 'recipients': len(recipients)}
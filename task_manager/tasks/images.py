@@ -0,0 +1,85 @@
+"""Pillow image pipeline: decode each image once, write every rendition from it.
+
+JPEGs are opened in draft mode sized for the largest rendition, so libjpeg
+decodes them at 1/2, 1/4 or 1/8 scale and a multi-megapixel photo bound for
+a thumbnail is never decoded at full size. Downscaling uses ``thumbnail``
+with a reducing gap, which shrinks by whole factors before resampling. The
+decode and resize work is plain CPU: :func:`render_many` spreads a batch of
+images over the engine's process pool, while callers keep the storage I/O.
+"""
+
+import io
+from dataclasses import dataclass
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from . import engine
+
+# Formats that need an RGB (or grayscale) image.
+OPAQUE_FORMATS = {'JPEG'}
+EXTENSIONS = {'JPEG': 'jpg'}
+
+
+@dataclass(frozen=True)
+class Rendition:
+    name: str
+    max_size: Optional[tuple] = None
+    format: str = 'PNG'
+    mode: Optional[str] = None
+    quality: Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, spec):
+        max_size = spec.get('max_size')
+        return cls(
+            name=spec.get('name', 'image'),
+            max_size=tuple(max_size) if max_size else None,
+            format=spec.get('format', 'PNG').upper(),
+            mode=spec.get('mode'),
+            quality=spec.get('quality'),
+        )
+
+    @property
+    def extension(self):
+        return EXTENSIONS.get(self.format, self.format.lower())
+
+
+def render(data, renditions):
+    """Decode the image bytes ``data`` once and encode each of ``renditions``.
+
+    Returns one dict per rendition: name, content (bytes), width, height, format.
+    """
+    image = Image.open(io.BytesIO(data))
+    if all(rendition.max_size for rendition in renditions):
+        # Square bound: EXIF rotation may still swap the axes after decoding.
+        largest = max(max(rendition.max_size) for rendition in renditions)
+        image.draft(None, (largest, largest))
+    image.load()
+    image = ImageOps.exif_transpose(image)
+
+    rendered = []
+    for rendition in renditions:
+        output = image.copy()
+        if rendition.max_size:
+            output.thumbnail(rendition.max_size, Image.LANCZOS, reducing_gap=2.0)
+        if rendition.mode:
+            output = output.convert(rendition.mode)
+        elif rendition.format in OPAQUE_FORMATS and output.mode not in {'RGB', 'L'}:
+            output = output.convert('RGB')
+        options = {'quality': rendition.quality} if rendition.quality else {}
+        buffer = io.BytesIO()
+        output.save(buffer, format=rendition.format, **options)
+        rendered.append({
+            'name': rendition.name,
+            'content': buffer.getvalue(),
+            'width': output.width,
+            'height': output.height,
+            'format': rendition.format,
+        })
+    return rendered
+
+
+def render_many(contents, renditions):
+    """:func:`render` each of ``contents`` on the CPU pool; results keep the input order."""
+    return engine.map_cpu(render, contents, [renditions] * len(contents))
@@ -0,0 +1,125 @@
+"""Per-request cost accounting for the API viewsets.
+
+:class:`RequestMetricsMiddleware` opens a :class:`RequestCost` for each
+request; the database wrapper, serializers and renderer add to it while the
+request runs, and for DRF viewset routes the totals are recorded in
+:mod:`tasks.metrics`, labelled by viewset and action. Outside a request (or for
+non-viewset routes) every hook is a no-op apart from one context lookup.
+"""
+
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from rest_framework.renderers import JSONRenderer
+
+from . import metrics
+
+_current = ContextVar('request_cost', default=None)
+
+
+class RequestCost:
+    __slots__ = ('started', 'queries', 'query_seconds', 'serialize_seconds', 'serializing')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.serializing = False
+
+    def record(self, request, response):
+        match = getattr(request, 'resolver_match', None)
+        actions = getattr(match.func, 'actions', None) if match else None
+        if actions is None:
+            return
+        labels = {
+            'view': match.func.cls.__name__,
+            'action': actions.get(request.method.lower(), request.method.lower()),
+        }
+        metrics.request_seconds.observe(time.perf_counter() - self.started, **labels)
+        metrics.request_queries.observe(self.queries, **labels)
+        metrics.request_query_seconds.observe(self.query_seconds, **labels)
+        metrics.request_serialize_seconds.observe(self.serialize_seconds, **labels)
+        if not response.streaming:
+            metrics.response_size_bytes.observe(len(response.content), **labels)
+
+
+def count_queries(execute, sql, params, many, context):
+    """Database execute wrapper adding each query's count and time to the current request."""
+    cost = _current.get()
+    if cost is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        cost.queries += 1
+        cost.query_seconds += time.perf_counter() - started
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """``connection_created`` receiver: wrap the connection with :func:`count_queries` once."""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+class TimedRepresentationMixin:
+    """Adds a serializer's ``to_representation`` time to the current request (outermost call only)."""
+
+    def to_representation(self, instance):
+        cost = _current.get()
+        if cost is None or cost.serializing:
+            return super().to_representation(instance)
+        cost.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            cost.serialize_seconds += time.perf_counter() - started
+            cost.serializing = False
+
+
+class TimedJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        cost = _current.get()
+        if cost is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            cost.serialize_seconds += time.perf_counter() - started
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        cost = RequestCost()
+        token = _current.set(cost)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        cost.record(request, response)
+        return response
+
+    async def __acall__(self, request):
+        cost = RequestCost()
+        token = _current.set(cost)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        cost.record(request, response)
+        return response
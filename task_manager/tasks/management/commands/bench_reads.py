@@ -0,0 +1,161 @@
+"""Load-test the hot read endpoints on one or more running servers.
+
+Compares the WSGI stack (gunicorn, DRF views) with the ASGI stack (uvicorn,
+``tasks.async_views``) for the same URLs::
+
+    python manage.py bench_reads --target wsgi=http://127.0.0.1:8000 \\
+        --target asgi=http://127.0.0.1:8001 --concurrency 200 --duration 20
+
+Each target is hit with ``--concurrency`` keep-alive connections for
+``--duration`` seconds per endpoint; req/s, p50 and p99 are reported. The
+client is a minimal HTTP/1.1 implementation on asyncio, so the benchmark
+needs nothing beyond the standard library.
+"""
+
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tasks.models import Task
+
+BENCH_USERNAME = 'bench-reads'
+
+
+class _Connection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def get(self, path, headers):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'GET {path} HTTP/1.1', f'Host: {self.host}:{self.port}', 'Connection: keep-alive']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await self.writer.drain()
+
+        version, status = (await self.reader.readline()).split()[:2]
+        status = int(status)
+        # HTTP/1.0 servers close after each response unless told otherwise.
+        length, chunked, close = 0, False, version == b'HTTP/1.0'
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            name, value = name.lower(), value.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'transfer-encoding' and 'chunked' in value:
+                chunked = True
+            elif name == 'connection':
+                close = value == 'close' or (close and value != 'keep-alive')
+
+        if chunked:
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def _run(base_url, path, headers, concurrency, duration):
+    url = urlsplit(base_url)
+    prefix = url.path.rstrip('/')
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        connection = _Connection(url.hostname, url.port or 80)
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    status = await connection.get(prefix + path, headers)
+                except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                    errors += 1
+                    connection.close()
+                    continue
+                if status == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def _percentile(values, q):
+    if not values:
+        return float('nan')
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark task read endpoints (req/s, p50, p99) against running WSGI/ASGI servers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', required=True, metavar='NAME=URL',
+            help='Server to benchmark, e.g. wsgi=http://127.0.0.1:8000 (repeatable).',
+        )
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per endpoint and target.')
+        parser.add_argument('--tasks', type=int, default=200, help='Tasks to seed for the benchmark user.')
+
+    def handle(self, *args, target, concurrency, duration, tasks, **options):
+        targets = []
+        for item in target:
+            name, sep, url = item.partition('=')
+            if not sep or not url.startswith('http://'):
+                raise CommandError(f'Expected NAME=http://host:port, got {item!r}')
+            targets.append((name, url))
+
+        user, _ = get_user_model().objects.get_or_create(
+            username=BENCH_USERNAME, defaults={'email': f'{BENCH_USERNAME}@example.com'}
+        )
+        missing = tasks - Task.objects.filter(user=user).count()
+        for index in range(max(0, missing)):
+            Task.objects.create(user=user, title=f'Bench {index}', priority=index % 4 + 1)
+        task_id = Task.objects.filter(user=user).values_list('pk', flat=True).first()
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+        endpoints = [
+            ('detail', f'/api/tasks/{task_id}/'),
+            ('status', f'/api/tasks/{task_id}/status/'),
+            ('list', '/api/tasks/?page_size=20'),
+            ('dashboard', '/api/tasks/dashboard_stats/'),
+        ]
+        self.stdout.write(f'{"target":<10}{"endpoint":<12}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+        for label, path in endpoints:
+            for name, url in targets:
+                latencies, errors, elapsed = asyncio.run(_run(url, path, headers, concurrency, duration))
+                latencies.sort()
+                self.stdout.write(
+                    f'{name:<10}{label:<12}{len(latencies) / elapsed:>10.1f}'
+                    f'{_percentile(latencies, 50) * 1000:>10.1f}{_percentile(latencies, 99) * 1000:>10.1f}'
+                    f'{errors:>8}'
+                )
@@ -0,0 +1,124 @@
+"""Reproducible performance benchmark with query and latency budgets.
+
+Seeds (or reuses) a deterministic dataset, measures the task endpoints
+in-process and the worker throughput per handler type, and writes the results
+as JSON so runs can be diffed between commits::
+
+    python manage.py benchmark --users 1000 --tasks 1000000 --json after.json --compare before.json --check
+
+``--check`` fails the command when an endpoint exceeds its query or p99
+budget (see ``tasks.benchmarks.SCENARIOS``). Seeding writes a million rows,
+so only a SQLite database is used unless ``--force`` is given.
+"""
+
+import json
+import platform
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from tasks import benchmarks
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark task endpoints and workers on a seeded dataset; optionally enforce budgets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--tasks', type=int, default=1_000_000)
+        parser.add_argument('--iterations', type=int, default=200, help='Timed requests per endpoint.')
+        parser.add_argument('--worker-tasks', type=int, default=20, help='Tasks per handler type; 0 skips workers.')
+        parser.add_argument('--only', action='append', help='Run only these scenarios (repeatable).')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', dest='json_path', help='Write machine-readable results here.')
+        parser.add_argument('--compare', help='Previous --json output to diff against.')
+        parser.add_argument('--check', action='store_true', help='Fail if any budget is exceeded.')
+        parser.add_argument('--force', action='store_true', help='Seed a database other than SQLite.')
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in benchmarks.SCENARIOS if not options['only'] or s.name in options['only']]
+        if connection.vendor != 'sqlite' and not options['force']:
+            raise CommandError(f'Refusing to seed benchmark data into a {connection.vendor} database without --force')
+        users = benchmarks.seed(
+            options['users'], options['tasks'], seed_value=options['seed'], log=self.stdout.write, force=True
+        )
+        # The busiest bench user: every user holds about the same share of the dataset.
+        user = users[0]
+        results = {
+            'meta': {
+                'commit': _commit(),
+                'timestamp': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'users': options['users'],
+                'tasks': options['tasks'],
+                'iterations': options['iterations'],
+            },
+            'endpoints': [],
+            'workers': [],
+        }
+        try:
+            with benchmarks.offline():
+                client = benchmarks.client_for(user)
+                for scenario in scenarios:
+                    results['endpoints'].append(
+                        benchmarks.run_scenario(client, user, scenario, options['iterations'])
+                    )
+                if options['worker_tasks']:
+                    results['workers'] = benchmarks.worker_throughput(user, options['worker_tasks'])
+        finally:
+            benchmarks.cleanup(users)
+
+        self.report(results, self.load(options['compare']))
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+        over = [r['name'] for r in results['endpoints'] if not r['within_budget']]
+        if options['check'] and over:
+            raise CommandError(f'Over budget: {", ".join(over)}')
+
+    def load(self, path):
+        if not path:
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def report(self, results, baseline):
+        before = {r['name']: r for r in (baseline or {}).get('endpoints', [])}
+        self.stdout.write(
+            f'{"endpoint":<16}{"queries":>8}{"p50 ms":>10}{"p99 ms":>10}{"req/s":>10}{"budget":>10}'
+            + (f'{"Δp50":>10}{"Δqueries":>10}' if baseline else '')
+        )
+        for r in results['endpoints']:
+            line = (
+                f'{r["name"]:<16}{r["queries"]:>8}{r["p50_ms"]:>10.2f}{r["p99_ms"]:>10.2f}'
+                f'{r["req_per_s"]:>10.1f}{"ok" if r["within_budget"] else "OVER":>10}'
+            )
+            old = before.get(r['name'])
+            if old:
+                change = (r['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0.0
+                line += f'{change:>+9.1f}%{r["queries"] - old["queries"]:>+10d}'
+            self.stdout.write(line)
+
+        before = {r['task_type']: r for r in (baseline or {}).get('workers', [])}
+        if results['workers']:
+            self.stdout.write(f'\n{"handler":<22}{"tasks/s":>10}{"p50 ms":>10}{"done":>8}' + (f'{"Δtasks/s":>12}' if baseline else ''))
+        for r in results['workers']:
+            line = f'{r["task_type"]:<22}{r["tasks_per_s"]:>10.1f}{r["p50_ms"]:>10.2f}{r["completed"]:>5}/{r["tasks"]:<3}'
+            old = before.get(r['task_type'])
+            if old and old['tasks_per_s']:
+                line += f'{(r["tasks_per_s"] - old["tasks_per_s"]) / old["tasks_per_s"] * 100:>+11.1f}%'
+            self.stdout.write(line)
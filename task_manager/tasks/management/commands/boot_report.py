@@ -0,0 +1,72 @@
+"""Show where a cold process start spends its time.
+
+Boots Django in a fresh interpreter under ``python -X importtime`` and
+reports the recorded boot phases (Key Vault, ``django.setup``, URLconf, first
+database connection) followed by the slowest top-level imports::
+
+    python manage.py boot_report --top 15
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+_BOOT_SCRIPT = '''
+import json
+from task_manager import boot
+import django
+with boot.phase('django.setup'):
+    django.setup()
+from django.urls import get_resolver
+with boot.phase('urlconf'):
+    get_resolver().url_patterns
+from django.db import connection
+with boot.phase('db.connect'):
+    connection.ensure_connection()
+print(json.dumps(boot.phases))
+'''
+
+
+def _slowest_imports(stderr, top):
+    """Top-level modules from ``-X importtime`` output, by cumulative microseconds."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented; their time is already in their parent's total.
+        if not name.startswith('  '):
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+class Command(BaseCommand):
+    help = 'Profile a cold boot: timed startup phases and the slowest imports.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Number of slow imports to list.')
+
+    def handle(self, *args, top, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'task_manager.settings'))
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', _BOOT_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0:
+            raise CommandError(f'Boot failed:\n{result.stderr[-2000:]}')
+
+        self.stdout.write(f'{"phase":<32}{"ms":>10}')
+        for name, seconds in json.loads(result.stdout.strip().splitlines()[-1]):
+            self.stdout.write(f'{name:<32}{seconds * 1000:>10.1f}')
+        self.stdout.write(f'{"total (interpreter start to ready)":<32}{elapsed * 1000:>10.1f}')
+
+        self.stdout.write(f'\n{"slowest imports":<48}{"ms":>10}')
+        for micros, name in _slowest_imports(result.stderr, top):
+            self.stdout.write(f'{name:<48}{micros / 1000:>10.1f}')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from tasks import search
+
+
+class Command(BaseCommand):
+    help = 'Install the task full-text index if missing or outdated and repopulate it from the task table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, database, **options):
+        connection = connections[database]
+        backend = search.get_backend(connection)
+        backend.install(connection)
+        backend.rebuild(connection)
+        self.stdout.write(f'Rebuilt the task search index with {type(backend).__name__}')
@@ -0,0 +1,52 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tasks import outbox
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Publish committed task outbox entries to the Celery broker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.TASK_OUTBOX_BATCH_SIZE)
+        parser.add_argument(
+            '--max-rate', type=float, default=settings.TASK_OUTBOX_MAX_RATE,
+            help='Upper bound on messages per second (0 for unbounded), e.g. while catching up after an outage.',
+        )
+        parser.add_argument('--poll-interval', type=float, default=settings.TASK_OUTBOX_POLL_SECONDS)
+        parser.add_argument('--once', action='store_true', help='Drain the current backlog and exit.')
+
+    def handle(self, *args, batch_size, max_rate, poll_interval, once, **options):
+        backoff = poll_interval
+        last_prune = 0.0
+        while True:
+            started = time.monotonic()
+            try:
+                handled = outbox.relay_batch(batch_size)
+            except Exception:
+                logger.warning('Outbox relay could not publish; retrying in %.1fs', backoff, exc_info=True)
+                if once:
+                    raise
+                time.sleep(backoff)
+                backoff = min(backoff * 2, settings.TASK_OUTBOX_MAX_BACKOFF_SECONDS)
+                continue
+            backoff = poll_interval
+
+            if handled:
+                elapsed = time.monotonic() - started
+                logger.info('Relayed %d outbox entries in %.3fs', handled, elapsed)
+                if max_rate:
+                    time.sleep(max(0.0, handled / max_rate - elapsed))
+                continue
+
+            if once:
+                return
+            if started - last_prune >= 60:
+                outbox.prune()
+                last_prune = started
+            time.sleep(poll_interval)
@@ -0,0 +1,326 @@
+"""Low-overhead counters and histograms shared through the Django cache.
+
+Observations are summed in process and flushed to the cache at most every
+``TASK_METRICS_FLUSH_SECONDS`` (one Redis pipeline per flush, on a background
+thread), so a request or task pays for a dict update, not a round trip per
+bucket. Metrics have a cache alias of their own (``TASK_METRICS_CACHE``), so
+their series never crowd users or results out of a size-capped cache. With a Redis cache
+configured, every web process and Celery child adds into the same keys, so the
+numbers aggregate across the whole deployment. The label sets seen are
+registered in the cache as they are flushed, which lets :func:`render` list
+every series for a Prometheus scrape. Metric writes never raise: a cache
+outage must not fail a request or a task.
+"""
+
+import atexit
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, math.inf)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, math.inf)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, math.inf)
+
+REGISTRY = {}
+COLLECTORS = []
+
+_lock = threading.Lock()
+_pending = defaultdict(int)
+_touched = {}
+_last_flush = 0.0
+# Held for a whole flush, so a reader's flush waits for one already writing.
+_flush_lock = threading.Lock()
+_flusher = None
+
+
+def _cache():
+    return caches[settings.TASK_METRICS_CACHE]
+
+
+def _incr(cache, key, delta):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            return cache.incr(key, delta)
+        return delta
+
+
+def _series_key(name, labels):
+    if not labels:
+        return f'metrics:{name}'
+    parts = ','.join(f'{key}={labels[key]}' for key in sorted(labels))
+    return f'metrics:{name}:{parts}'
+
+
+def _record(metric, labels, deltas):
+    """Queue ``{suffix: delta}`` increments for one series; flush when due."""
+    key = _series_key(metric.name, labels)
+    now = time.monotonic()
+    with _lock:
+        for suffix, delta in deltas.items():
+            _pending[key + suffix] += delta
+        if key not in _touched:
+            _touched[key] = (metric.name, {name: str(value) for name, value in labels.items()})
+        due = now - _last_flush >= settings.TASK_METRICS_FLUSH_SECONDS
+    if due:
+        _flush_soon()
+
+
+def _flush_soon():
+    global _flusher
+    with _lock:
+        if _flusher is not None and _flusher.is_alive():
+            return
+        _flusher = threading.Thread(target=flush, name='metrics-flush', daemon=True)
+        _flusher.start()
+
+
+def _write(cache, deltas, series):
+    """Apply ``deltas`` and mark ``series`` registered; returns the series that were new."""
+    if isinstance(cache, RedisCache):
+        # Django stores integers unpickled, so INCRBY keeps them readable by cache.get().
+        pipe = cache._cache.get_client(write=True).pipeline(transaction=False)
+        for key, delta in deltas.items():
+            pipe.incrby(cache.make_and_validate_key(key), delta)
+        for key in series:
+            pipe.set(cache.make_and_validate_key(f'{key}:registered'), 1, nx=True)
+        added = pipe.execute()[len(deltas):]
+        return [key for key, new in zip(series, added) if new]
+    for key, delta in deltas.items():
+        _incr(cache, key, delta)
+    return [key for key in series if cache.add(f'{key}:registered', 1, timeout=None)]
+
+
+def flush():
+    """Write this process's buffered observations to the shared cache."""
+    global _last_flush
+    with _flush_lock:
+        with _lock:
+            deltas, series = dict(_pending), dict(_touched)
+            _pending.clear()
+            _touched.clear()
+            _last_flush = time.monotonic()
+        if not deltas and not series:
+            return
+        try:
+            cache = _cache()
+            for key in _write(cache, deltas, list(series)):
+                name, labels = series[key]
+                index = _incr(cache, f'metrics:{name}:series', 1)
+                cache.set(f'metrics:{name}:series:{index}', labels, timeout=None)
+        except Exception:
+            logger.debug('Dropping %d metric updates', len(deltas), exc_info=True)
+
+
+atexit.register(flush)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help=''):
+        self.name = name
+        self.help = help
+        REGISTRY[name] = self
+
+    def series(self, **labels):
+        """Label sets recorded by any process, optionally only those matching ``labels``."""
+        flush()
+        cache = _cache()
+        count = cache.get(f'metrics:{self.name}:series', 0)
+        found = cache.get_many([f'metrics:{self.name}:series:{index}' for index in range(1, count + 1)])
+        wanted = {name: str(value) for name, value in labels.items()}
+        unique = {}
+        for series in found.values():
+            if wanted.items() <= series.items():
+                unique[_series_key(self.name, series)] = series
+        return list(unique.values())
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        try:
+            _record(self, labels, {'': amount})
+        except Exception:
+            logger.debug('Dropping %s increment', self.name, exc_info=True)
+
+    def value(self, **labels):
+        flush()
+        return _cache().get(_series_key(self.name, labels), 0)
+
+    def exposition(self, cache):
+        all_series = self.series()
+        values = cache.get_many([_series_key(self.name, labels) for labels in all_series])
+        return [
+            f'{self.name}_total{_format_labels(labels)} {values.get(_series_key(self.name, labels), 0)}'
+            for labels in all_series
+        ]
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; sums are kept in millionths to stay integral."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, buckets=DEFAULT_BUCKETS, help=''):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        try:
+            bucket = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+            _record(self, labels, {f':b{bucket}': 1, ':count': 1, ':sum_u': round(value * 1_000_000)})
+        except Exception:
+            logger.debug('Dropping %s observation', self.name, exc_info=True)
+
+    def _keys(self, key):
+        return [f'{key}:b{i}' for i in range(len(self.buckets))] + [f'{key}:count', f'{key}:sum_u']
+
+    def _snapshot(self, key, values):
+        cumulative, running = [], 0
+        for i, bound in enumerate(self.buckets):
+            running += values.get(f'{key}:b{i}', 0)
+            cumulative.append((bound, running))
+        return {
+            'buckets': cumulative,
+            'count': values.get(f'{key}:count', 0),
+            'sum': values.get(f'{key}:sum_u', 0) / 1_000_000,
+        }
+
+    def snapshot(self, **labels):
+        """Return cumulative bucket counts, total count and sum over every series matching ``labels``."""
+        keys = [_series_key(self.name, series) for series in self.series(**labels)]
+        values = _cache().get_many([name for key in keys for name in self._keys(key)])
+        total = {'buckets': [(bound, 0) for bound in self.buckets], 'count': 0, 'sum': 0.0}
+        for key in keys:
+            one = self._snapshot(key, values)
+            total['buckets'] = [(bound, a + b) for (bound, a), (_, b) in zip(total['buckets'], one['buckets'])]
+            total['count'] += one['count']
+            total['sum'] += one['sum']
+        return total
+
+    def quantile(self, q, snapshot=None, **labels):
+        """Estimate the ``q`` quantile by interpolating inside the matching bucket."""
+        snapshot = snapshot or self.snapshot(**labels)
+        total = snapshot['count']
+        if not total:
+            return None
+        rank = q * total
+        lower_bound, lower_count = 0.0, 0
+        for bound, count in snapshot['buckets']:
+            if count >= rank:
+                if math.isinf(bound):
+                    return lower_bound
+                width = count - lower_count
+                fraction = (rank - lower_count) / width if width else 1.0
+                return lower_bound + (bound - lower_bound) * fraction
+            lower_bound, lower_count = bound, count
+        return lower_bound
+
+    def exposition(self, cache):
+        all_series = self.series()
+        keys = [_series_key(self.name, labels) for labels in all_series]
+        values = cache.get_many([name for key in keys for name in self._keys(key)])
+        lines = []
+        for labels, key in zip(all_series, keys):
+            snapshot = self._snapshot(key, values)
+            for bound, count in snapshot['buckets']:
+                le = '+Inf' if math.isinf(bound) else repr(bound)
+                lines.append(f'{self.name}_bucket{_format_labels({**labels, "le": le})} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {snapshot["sum"]}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {snapshot["count"]}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in sorted(labels.items())) + '}'
+
+
+def collector(func):
+    """Register ``func() -> [(name, kind, help, [(labels, value), ...]), ...]`` to run at scrape time."""
+    COLLECTORS.append(func)
+    return func
+
+
+@collector
+def _task_backlog():
+    # Read from the task table at scrape time, so a killed worker cannot leave a gauge stuck.
+    from django.db.models import Count
+
+    from .models import Task
+
+    rows = (
+        Task.objects.filter(status__in=['PENDING', 'PROCESSING'], pending_dependencies=0)
+        .values_list('status', 'task_type', 'priority')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    pending, in_flight = [], []
+    for status, task_type, priority, count in rows:
+        (pending if status == 'PENDING' else in_flight).append(({'task_type': task_type, 'priority': priority}, count))
+    return [
+        ('task_in_flight', 'gauge', 'Tasks currently processing.', in_flight),
+        ('task_pending', 'gauge', 'Tasks waiting for a worker.', pending),
+    ]
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    flush()
+    cache = _cache()
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f'# HELP {metric.name} {metric.help or metric.name}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.exposition(cache))
+    for func in COLLECTORS:
+        try:
+            families = func()
+        except Exception:
+            logger.warning('Metrics collector %s failed', func.__name__, exc_info=True)
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(f'{name}{_format_labels(labels)} {value}' for labels, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+queue_wait_seconds = Histogram(
+    'task_queue_wait_seconds', help='Time from creation to a worker starting the task (first attempt).'
+)
+result_cache_lookups = Counter('task_result_cache_lookups', help='Result cache lookups by outcome.')
+result_cache_errors = Counter('task_result_cache_errors', help='Result cache calls that failed, by operation.')
+outbox_published = Counter('task_outbox_published', help='Tasks published to the broker by the outbox relay.')
+# Commit-to-publish delay of outbox entries; the relay's backlog shows up here.
+outbox_lag_seconds = Histogram('task_outbox_lag_seconds', help='Delay between an outbox entry and its publication.')
+processing_seconds = Histogram('task_processing_seconds', help='Handler run time of completed tasks.')
+task_attempts = Counter(
+    'task_attempts', help='Finished task attempts by outcome (completed, retried, failed, cancelled).'
+)
+
+request_seconds = Histogram('api_request_seconds', REQUEST_BUCKETS, help='API request latency per view and action.')
+request_queries = Histogram('api_request_queries', COUNT_BUCKETS, help='SQL queries per API request.')
+request_query_seconds = Histogram('api_request_query_seconds', REQUEST_BUCKETS, help='Time in SQL per API request.')
+request_serialize_seconds = Histogram(
+    'api_request_serialize_seconds', REQUEST_BUCKETS, help='Serializer and renderer time per API request.'
+)
+response_size_bytes = Histogram('api_response_size_bytes', SIZE_BUCKETS, help='API response body size.')
@@ -1,7 +1,9 @@
 import uuid
+from collections import Counter
 
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Lookup
 from django.utils import timezone
 
 
@@ -36,6 +38,8 @@ class Task(models.Model):
     description = models.TextField(blank=True)
     task_type = models.CharField(max_length=50, choices=TASK_TYPES, default='DATA_PROCESSING')
     priority = models.IntegerField(choices=PRIORITY_CHOICES, default=2)
+    # Priority of the queue the task was last published to; raised by aging.
+    queued_priority = models.IntegerField(null=True, blank=True, editable=False)
 
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -51,6 +55,16 @@ class Task(models.Model):
     error_message = models.TextField(blank=True)
     retry_count = models.IntegerField(default=0)
     max_retries = models.IntegerField(default=3)
+    # Content address of (task_type, input, handler version) for result reuse.
+    cache_key = models.CharField(max_length=64, blank=True, editable=False)
+
+    # Workflow membership (tasks.workflows): the step's key within the workflow
+    # and how many of its upstream steps have yet to complete.
+    workflow = models.ForeignKey(
+        'Workflow', on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name='tasks'
+    )
+    workflow_step = models.CharField(max_length=64, blank=True, editable=False)
+    pending_dependencies = models.IntegerField(default=0, editable=False)
 
     class Meta:
         indexes = [
@@ -59,6 +73,7 @@ class Task(models.Model):
             models.Index(fields=['task_type', 'status']),
             models.Index(fields=['created_at']),
             models.Index(fields=['user', 'status', 'created_at']),
+            models.Index(fields=['user', 'priority', 'created_at']),
             models.Index(fields=['priority', 'status', 'created_at']),
         ]
         ordering = ['-created_at']
@@ -66,15 +81,279 @@ class Task(models.Model):
     def __str__(self):
         return f"{self.title} - {self.status}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so save() can count the transition.
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     def save(self, *args, **kwargs):
+        if self.queued_priority is None:
+            self.queued_priority = self.priority
         if self.status == 'PROCESSING' and not self.started_at:
             self.started_at = timezone.now()
         elif self.status == 'COMPLETED' and not self.completed_at:
             self.completed_at = timezone.now()
-        super().save(*args, **kwargs)
+
+        update_fields = kwargs.get('update_fields')
+        status_written = update_fields is None or 'status' in update_fields
+        previous = None if self._state.adding else getattr(self, '_loaded_status', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if status_written and previous != self.status:
+                UserTaskStats.objects.record(self.user_id, {previous: -1, self.status: 1})
+        if status_written:
+            self._loaded_status = self.status
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            UserTaskStats.objects.record(self.user_id, {self.status: -1})
+        return result
 
     @property
     def processing_time(self):
         if self.started_at and self.completed_at:
             return (self.completed_at - self.started_at).total_seconds()
-        return None
\ No newline at end of file
+        return None
+
+
+class UserTaskStatsManager(models.Manager):
+    def record(self, user_id, deltas):
+        """Apply ``{status: delta}`` changes to a user's counters atomically.
+
+        A missing row is rebuilt from the real counts, which already include
+        the change being recorded.
+        """
+        changes = {
+            STATUS_COUNTER_FIELDS[status]: F(STATUS_COUNTER_FIELDS[status]) + delta
+            for status, delta in deltas.items()
+            if status in STATUS_COUNTER_FIELDS and delta
+        }
+        if not changes:
+            return
+        changes['updated_at'] = timezone.now()
+        if not self.filter(user_id=user_id).update(**changes):
+            self.reconcile(user_id)
+
+    def reconcile(self, user_id):
+        """Recount a user's tasks (archived ones included) by status and overwrite the counters."""
+        counts = Counter()
+        for model in (Task, ArchivedTask):
+            counts.update(dict(
+                model.objects.filter(user_id=user_id)
+                .values_list('status')
+                .annotate(count=models.Count('id'))
+                .order_by()
+            ))
+        values = {field: counts[status] for status, field in STATUS_COUNTER_FIELDS.items()}
+        try:
+            with transaction.atomic():
+                self.update_or_create(user_id=user_id, defaults=values)
+        except IntegrityError:
+            # Lost a creation race; the winner's row is updated instead.
+            self.filter(user_id=user_id).update(**values)
+
+
+class UserTaskStats(models.Model):
+    """Per-user task counts by status, kept in step with every status change.
+
+    Tasks moved to ``ArchivedTask`` stay counted.
+
+    Writes that bypass ``Task.save()``/``Task.delete()`` (bulk_create, queryset
+    update/delete) must call ``UserTaskStats.objects.record`` themselves; the
+    periodic reconciliation repairs any drift.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='task_stats'
+    )
+    pending = models.IntegerField(default=0)
+    processing = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    cancelled = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserTaskStatsManager()
+
+    def __str__(self):
+        return f"Task stats for {self.user_id}"
+
+    def as_dict(self):
+        counts = {field: getattr(self, field) for field in STATUS_COUNTER_FIELDS.values()}
+        return {'total': sum(counts.values()), **counts}
+
+
+class TaskOutbox(models.Model):
+    """A Celery publish owed for a task, written in the task's own transaction.
+
+    ``manage.py relay_outbox`` drains undispatched rows to the broker, so a
+    committed task always gets published and an uncommitted one never is.
+    """
+
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='outbox_entries')
+    # Queue level to publish on (see tasks.scheduling.queue_for_priority).
+    priority = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Not published before this time; set for retries waiting out their backoff.
+    not_before = models.DateTimeField(null=True, blank=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['dispatched_at', 'id'])]
+
+    def __str__(self):
+        return f"Outbox entry for {self.task_id}"
+
+
+class TaskDeadLetter(models.Model):
+    """A task that failed for good, kept for inspection and replay."""
+
+    REASON_CHOICES = [
+        ('permanent', 'Permanent error'),
+        ('transient', 'Retries exhausted'),
+    ]
+
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='dead_letters')
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    error_type = models.CharField(max_length=255)
+    error_message = models.TextField(blank=True)
+    attempts = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    replayed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['replayed_at', 'created_at'])]
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Dead letter for {self.task_id}: {self.error_type}"
+
+
+class Workflow(models.Model):
+    """A DAG of tasks run by ``tasks.workflows``: each step starts once all its upstream steps completed."""
+
+    STATUS_CHOICES = [
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+        ('CANCELLED', 'Cancelled'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='workflows')
+    name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='RUNNING')
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-created_at'])]
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.name or self.id} - {self.status}"
+
+
+class TaskDependency(models.Model):
+    """``downstream`` may only start after ``upstream`` has completed."""
+
+    upstream = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='downstream_links')
+    downstream = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='upstream_links')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['upstream', 'downstream'], name='unique_task_dependency'),
+        ]
+
+    def __str__(self):
+        return f"{self.upstream_id} -> {self.downstream_id}"
+
+
+class ArchivedTask(models.Model):
+    """A terminal task moved out of the hot ``Task`` table by ``tasks.retention``.
+
+    Same columns as ``Task`` (so the task serializers render it unchanged),
+    indexed only for lookups by id and per-user history.
+    """
+
+    id = models.UUIDField(primary_key=True, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_tasks')
+
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    task_type = models.CharField(max_length=50, choices=Task.TASK_TYPES)
+    priority = models.IntegerField(choices=Task.PRIORITY_CHOICES)
+    queued_priority = models.IntegerField(null=True, blank=True)
+
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    input_data = models.JSONField(default=dict)
+    output_data = models.JSONField(default=dict, blank=True)
+    input_file = models.FileField(upload_to='task_inputs/', null=True, blank=True)
+    output_file = models.FileField(upload_to='task_outputs/', null=True, blank=True)
+
+    progress = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    retry_count = models.IntegerField(default=0)
+    max_retries = models.IntegerField(default=3)
+    cache_key = models.CharField(max_length=64, blank=True)
+    workflow = models.ForeignKey(
+        'Workflow', on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_tasks'
+    )
+    workflow_step = models.CharField(max_length=64, blank=True)
+    pending_dependencies = models.IntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-created_at'])]
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.title} - {self.status} (archived)"
+
+    processing_time = Task.processing_time
+
+
+class SearchDocumentField(models.TextField):
+    """An FTS table's hidden column named after the table, the target of ``MATCH``."""
+
+
+@SearchDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class TaskSearchEntry(models.Model):
+    """A row of the SQLite FTS5 index over task titles and descriptions.
+
+    The table is created and kept in sync by ``tasks.search``; this model only
+    lets querysets join to it (``search_entry__document__match``) and read its
+    bm25 ``rank``.
+    """
+
+    task = models.OneToOneField(
+        Task, on_delete=models.DO_NOTHING, primary_key=True, db_column='id', db_constraint=False,
+        related_name='search_entry',
+    )
+    document = SearchDocumentField(db_column='tasks_task_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'tasks_task_fts'
+
+
+STATUS_COUNTER_FIELDS = {status: status.lower() for status, _ in Task.STATUS_CHOICES}
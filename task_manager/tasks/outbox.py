@@ -0,0 +1,78 @@
+"""Relay of :class:`~tasks.models.TaskOutbox` entries to the Celery broker.
+
+Entries are claimed in id order (``SKIP LOCKED`` where the database supports
+it, so several relays can run side by side), published over one producer
+connection per batch and marked dispatched. Delivery is at-least-once: a
+batch that fails part-way is retried whole, and the worker's PENDING claim
+drops the duplicates.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .metrics import outbox_lag_seconds, outbox_published
+from .models import Task, TaskOutbox
+from .scheduling import publish_many
+
+logger = logging.getLogger(__name__)
+
+
+def relay_batch(batch_size=None):
+    """Publish up to ``batch_size`` undispatched entries; returns how many were handled.
+
+    Broker errors are recorded on the entries and re-raised.
+    """
+    batch_size = batch_size or settings.TASK_OUTBOX_BATCH_SIZE
+    with transaction.atomic():
+        entries = list(
+            TaskOutbox.objects.select_for_update(skip_locked=True)
+            .filter(Q(not_before__isnull=True) | Q(not_before__lte=timezone.now()), dispatched_at__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        if not entries:
+            return 0
+        ids = [entry.pk for entry in entries]
+        # Tasks cancelled or already finished need no message.
+        pending = set(
+            Task.objects.filter(pk__in={entry.task_id for entry in entries}, status='PENDING')
+            .values_list('pk', flat=True)
+        )
+        try:
+            publish_many([(entry.task_id, entry.priority) for entry in entries if entry.task_id in pending])
+        except Exception as exc:
+            error = exc
+            TaskOutbox.objects.filter(pk__in=ids).update(attempts=F('attempts') + 1, last_error=str(exc)[:1000])
+        else:
+            error = None
+            now = timezone.now()
+            TaskOutbox.objects.filter(pk__in=ids).update(dispatched_at=now, attempts=F('attempts') + 1)
+
+    if error is not None:
+        raise error
+
+    outbox_published.inc(len(pending))
+    for entry in entries:
+        outbox_lag_seconds.observe((now - (entry.not_before or entry.created_at)).total_seconds())
+    return len(entries)
+
+
+def backlog():
+    """``(count, oldest_age_seconds)`` of entries due but not yet published."""
+    now = timezone.now()
+    waiting = TaskOutbox.objects.filter(Q(not_before__isnull=True) | Q(not_before__lte=now), dispatched_at__isnull=True)
+    oldest = waiting.order_by('id').values_list('created_at', flat=True).first()
+    age = (now - oldest).total_seconds() if oldest else 0.0
+    return waiting.count(), age
+
+
+def prune(retention_seconds=None):
+    """Delete entries dispatched more than ``retention_seconds`` ago."""
+    retention_seconds = retention_seconds if retention_seconds is not None else settings.TASK_OUTBOX_RETENTION_SECONDS
+    cutoff = timezone.now() - timedelta(seconds=retention_seconds)
+    deleted, _ = TaskOutbox.objects.filter(dispatched_at__lt=cutoff).delete()
+    return deleted
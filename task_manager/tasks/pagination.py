@@ -0,0 +1,157 @@
+"""Keyset pagination for task listings.
+
+DRF's ``CursorPagination`` keys on the first ordering field only and falls back
+to OFFSET within ties, which degrades on low-cardinality orderings such as
+``status`` or ``priority``. Here the cursor carries the full sort key plus
+``created_at`` and the row ``id`` as tiebreakers, matching the
+``(user, <field>, created_at)`` indexes, so every page is a single index range
+seek.
+Search results (annotated with ``relevance`` by :mod:`tasks.search`) are
+ordered best match first unless ``?ordering=`` is given.
+"""
+
+import json
+from base64 import b64decode, b64encode
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class TaskCursorPagination(CursorPagination):
+    ordering = '-created_at'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    secondary = 'created_at'
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, request, queryset, view):
+        if 'relevance' in queryset.query.annotations and not request.query_params.get(api_settings.ORDERING_PARAM):
+            return ('-relevance',)
+        return super().get_ordering(request, queryset, view)
+
+    def get_sort_key(self, request, queryset, view):
+        """Ordering fields with the tiebreakers appended, as ``(name, descending)`` pairs."""
+        ordering = list(self.get_ordering(request, queryset, view))
+        # Break ties in the same direction as the primary sort.
+        descending = ordering[0].startswith('-')
+        for tiebreaker in (self.secondary, self.tiebreaker):
+            if tiebreaker not in {field.lstrip('-') for field in ordering}:
+                ordering.append(f'-{tiebreaker}' if descending else tiebreaker)
+        return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page(list(page_queryset))
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """The unevaluated query for one page (plus a look-ahead row), or None if unpaginated.
+
+        Split from :meth:`set_page` so async views can evaluate it with the async ORM.
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.sort_key = self.get_sort_key(request, queryset, view)
+        self.model = queryset.model
+        self.cursor = self.decode_cursor(request)
+        self.reverse = bool(self.cursor and self.cursor['r'])
+
+        order_by = []
+        for name, descending in self.sort_key:
+            # Walking backwards flips every direction; results are re-reversed below.
+            order_by.append(f'-{name}' if descending != self.reverse else name)
+        queryset = queryset.order_by(*order_by)
+
+        if self.cursor:
+            queryset = queryset.filter(self._after(self.cursor['k'], self.reverse))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        """Trim the look-ahead row from ``rows`` and work out the page links."""
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+
+        self.page = rows
+        if self.reverse:
+            self.has_next = self.cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        return rows
+
+    def _after(self, key, reverse):
+        """Row-value comparison ``(f1, f2, ..) > (v1, v2, ..)`` expanded into ORs."""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.sort_key, key):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _field(self, name):
+        try:
+            return self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None  # an annotation such as search relevance
+
+    def _key_for(self, row):
+        key = []
+        for name, _ in self.sort_key:
+            field = self._field(name)
+            key.append(field.value_to_string(row) if field else getattr(row, name))
+        return key
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values = cursor['k']
+            if len(values) != len(self.sort_key):
+                raise ValueError
+            cursor['k'] = []
+            for (name, _), value in zip(self.sort_key, values):
+                field = self._field(name)
+                cursor['k'].append(field.to_python(value) if field else float(value))
+            cursor['r'] = bool(cursor.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, cursor):
+        encoded = b64encode(json.dumps(cursor, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor({'k': self._key_for(self.page[-1]), 'r': 0})
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor({'k': self._key_for(self.page[0]), 'r': 1})
+
+    def get_html_context(self):
+        return {
+            'previous_url': self.get_previous_link(),
+            'next_url': self.get_next_link(),
+        }
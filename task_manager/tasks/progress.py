@@ -0,0 +1,159 @@
+"""Coalesced, write-throttled progress reporting for handlers.
+
+Handlers may report progress as often as they like. A :class:`ProgressReporter`
+keeps the latest value in memory and only writes when the value has moved by
+``TASK_PROGRESS_FLUSH_STEP`` percent or ``TASK_PROGRESS_FLUSH_MS`` has passed.
+Writes touch the ``progress`` column alone (a queryset update, so no SELECT,
+no ``Task.save()`` and no JSON columns). With ``TASK_PROGRESS_BATCH`` on, all
+reporters in a process share a :class:`ProgressBatcher` that folds their
+pending values into one multi-row UPDATE; a timer writes values held back
+once the interval is up, so a stalled handler's last report still lands.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Value, When
+
+from . import events
+from .models import Task
+
+
+def _write(values):
+    """Persist ``{task_id: percent}`` with a single UPDATE.
+
+    Only tasks still processing are touched, so a late flush cannot overwrite a finished task's progress.
+    """
+    if not values:
+        return
+    if len(values) == 1:
+        (task_id, percent), = values.items()
+        Task.objects.filter(pk=task_id, status='PROCESSING').update(progress=percent)
+        return
+    Task.objects.filter(pk__in=list(values), status='PROCESSING').update(
+        progress=Case(
+            *[When(pk=task_id, then=Value(percent)) for task_id, percent in values.items()],
+            default=F('progress'),
+            output_field=IntegerField(),
+        )
+    )
+
+
+class ProgressBatcher:
+    """Collects pending progress values from many tasks and writes them together."""
+
+    def __init__(self, interval_ms=None, clock=time.monotonic):
+        self.interval = (interval_ms if interval_ms is not None else settings.TASK_PROGRESS_FLUSH_MS) / 1000
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = clock()
+        self._timer = None
+
+    def add(self, task_id, percent):
+        with self._lock:
+            self._pending[task_id] = percent
+            wait = self.interval - (self.clock() - self._last_flush)
+            if wait > 0 and self._timer is None:
+                self._timer = threading.Timer(wait, self._flush_held)
+                self._timer.daemon = True
+                self._timer.start()
+        if wait <= 0:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            values, self._pending = self._pending, {}
+            self._last_flush = self.clock()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        _write(values)
+
+    def _flush_held(self):
+        with self._lock:
+            # Cleared when a flush got there first.
+            if self._timer is None or not self._pending:
+                self._timer = None
+                return
+        try:
+            self.flush()
+        finally:
+            # The timer thread's connection would otherwise stay open.
+            connections.close_all()
+
+    def discard(self, task_id):
+        with self._lock:
+            return self._pending.pop(task_id, None)
+
+
+class ProgressReporter:
+    def __init__(self, task_id, user_id, interval_ms=None, step=None, batcher=None, clock=time.monotonic):
+        self.task_id = task_id
+        self.user_id = user_id
+        self.interval = (interval_ms if interval_ms is not None else settings.TASK_PROGRESS_FLUSH_MS) / 1000
+        self.step = step if step is not None else settings.TASK_PROGRESS_FLUSH_STEP
+        self.batcher = batcher
+        self.clock = clock
+        self.current = None
+        self.written = None
+        self._last_write = clock()
+
+    def report(self, percent):
+        self.current = max(0, min(100, int(percent)))
+        if self.written is None or abs(self.current - self.written) >= self.step:
+            self.flush()
+        elif self.current != self.written and self.clock() - self._last_write >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.current is None or self.current == self.written:
+            return
+        if self.batcher is not None:
+            self.batcher.add(self.task_id, self.current)
+        else:
+            _write({self.task_id: self.current})
+        self.written = self.current
+        self._last_write = self.clock()
+        events.publish(
+            {'id': str(self.task_id), 'user': self.user_id, 'status': 'PROCESSING', 'progress': self.current}
+        )
+
+    def close(self):
+        """Write any value still held back, bypassing the batcher's interval."""
+        self.flush()
+        if self.batcher is not None:
+            percent = self.batcher.discard(self.task_id)
+            if percent is not None:
+                _write({self.task_id: percent})
+
+
+_lock = threading.Lock()
+_reporters = {}
+_batcher = None
+
+
+def _shared_batcher():
+    global _batcher
+    if _batcher is None and settings.TASK_PROGRESS_BATCH:
+        _batcher = ProgressBatcher()
+    return _batcher
+
+
+def get_reporter(task_id, user_id):
+    """The process-wide reporter for ``task_id``, created on first use."""
+    with _lock:
+        reporter = _reporters.get(task_id)
+        if reporter is None:
+            reporter = _reporters[task_id] = ProgressReporter(task_id, user_id, batcher=_shared_batcher())
+        return reporter
+
+
+def release(task_id):
+    """Flush and forget the reporter for ``task_id``; called when its handler returns."""
+    with _lock:
+        reporter = _reporters.pop(task_id, None)
+    if reporter is not None:
+        reporter.close()
@@ -0,0 +1,115 @@
+"""Content-addressed memoization of task results.
+
+A task's key is the SHA-256 of its task type, canonicalised ``input_data``,
+input file digest and handler version. When a submission's key is already
+cached the task is completed on the spot from the stored ``output_data`` and
+``output_file`` (the blob is shared, not copied) and never reaches a worker.
+Entries live in the ``TASK_RESULT_CACHE`` cache alias and expire after
+``TASK_RESULT_CACHE_TTL``. LRU eviction comes from LocMem ``MAX_ENTRIES``
+culling, or from a dedicated Redis (``REDIS_RESULT_CACHE_URL``) running
+``maxmemory-policy allkeys-lru``; never set that policy on the Redis that
+holds the broker and metrics. Only handlers registered as ``cacheable`` take
+part. The cache is an optimisation only: when it is unreachable, lookups are
+treated as misses and results go unstored, counted in ``task_result_cache_errors``.
+"""
+
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .handlers import get_handler
+from .metrics import result_cache_errors, result_cache_lookups
+from .utils.file_handler import FileHandler
+
+logger = logging.getLogger(__name__)
+
+
+def _cache():
+    return caches[settings.TASK_RESULT_CACHE]
+
+
+def compute_key(task_type, input_data, input_digest, handler_version):
+    canonical = json.dumps(
+        [task_type, input_data, input_digest, handler_version],
+        sort_keys=True,
+        separators=(',', ':'),
+        cls=DjangoJSONEncoder,
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def key_for_submission(data, input_digest=None):
+    """Cache key for validated serializer data, or '' if the task type is not cacheable.
+
+    ``input_digest`` is the SHA-256 of an input file already stored (and hashed) on upload.
+    """
+    task_type = data.get('task_type', 'DATA_PROCESSING')
+    try:
+        handler = get_handler(task_type)
+    except LookupError:
+        return ''
+    if not handler.cacheable:
+        return ''
+    input_file = data.get('input_file')
+    if input_digest is None and input_file:
+        input_digest = FileHandler.sha256(input_file)[0]
+    return compute_key(task_type, data.get('input_data', {}), input_digest, handler.version)
+
+
+def lookup_many(keys):
+    """Return ``{key: entry}`` for the keys that are cached, recording hits/misses."""
+    keys = [key for key in keys if key]
+    if not keys:
+        return {}
+    try:
+        found = _cache().get_many(keys)
+    except Exception:
+        logger.warning('Result cache lookup failed; treating %d keys as misses', len(keys), exc_info=True)
+        result_cache_errors.inc(operation='lookup')
+        return {}
+    hits = sum(1 for key in keys if key in found)
+    if hits:
+        result_cache_lookups.inc(hits, outcome='hit')
+    if len(keys) - hits:
+        result_cache_lookups.inc(len(keys) - hits, outcome='miss')
+    return found
+
+
+def lookup(key):
+    return lookup_many([key]).get(key)
+
+
+def store(key, output_data, output_file, source_task_id):
+    if not key:
+        return
+    try:
+        _cache().set(
+            key,
+            {'output_data': output_data, 'output_file': output_file or '', 'source': str(source_task_id)},
+            timeout=settings.TASK_RESULT_CACHE_TTL,
+        )
+    except Exception:
+        logger.warning('Could not store result of task %s in the result cache', source_task_id, exc_info=True)
+        result_cache_errors.inc(operation='store')
+
+
+def completed_fields(entry):
+    """Model field values that complete a task from a cache entry."""
+    now = timezone.now()
+    return {
+        'status': 'COMPLETED',
+        'progress': 100,
+        'output_data': entry['output_data'],
+        'output_file': entry['output_file'] or None,
+        'started_at': now,
+        'completed_at': now,
+    }
+
+
+def bypass_requested(request):
+    return request.query_params.get('cache', '').lower() in {'0', 'false', 'no', 'off'}
@@ -0,0 +1,83 @@
+"""Hot/cold retention: terminal tasks move from ``Task`` to ``ArchivedTask``.
+
+Tasks that finished (COMPLETED, FAILED or CANCELLED) more than
+``TASK_ARCHIVE_AFTER_DAYS`` ago are copied to the archive table and deleted
+from the hot one, so ``Task``, its indexes and the per-user queries only grow
+with recent work. Each batch of ``TASK_ARCHIVE_BATCH_SIZE`` rows is its own
+short transaction (copy, then delete by primary key) with a pause between
+batches, so archiving never holds long locks on the hot table. Archived tasks
+stay readable by id through the task detail and status endpoints, and stay in
+the per-user ``UserTaskStats`` counters, so dashboard totals do not drop.
+"""
+
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import ArchivedTask, Task, TaskDeadLetter, Workflow
+from .streams import TERMINAL_STATUSES
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FIELDS = [field.attname for field in ArchivedTask._meta.concrete_fields if field.attname != 'archived_at']
+
+
+def archivable(cutoff):
+    """Terminal tasks created and finished before ``cutoff``, oldest first.
+
+    Tasks with an unreplayed dead letter are kept until it is dealt with, and
+    steps of a still-running workflow are kept with their dependency links and
+    dead-letter history until the workflow finishes.
+    """
+    return (
+        Task.objects.filter(status__in=TERMINAL_STATUSES, created_at__lt=cutoff)
+        .exclude(completed_at__gte=cutoff)
+        .exclude(Exists(TaskDeadLetter.objects.filter(task=OuterRef('pk'), replayed_at__isnull=True)))
+        .exclude(Exists(Workflow.objects.filter(pk=OuterRef('workflow_id'), status='RUNNING')))
+        .order_by('created_at')
+    )
+
+
+def archive_batch(cutoff, batch_size):
+    """Archive up to ``batch_size`` tasks in one transaction; returns how many moved."""
+    with transaction.atomic():
+        rows = list(archivable(cutoff).select_for_update(skip_locked=True).values(*ARCHIVE_FIELDS)[:batch_size])
+        if not rows:
+            return 0
+        ArchivedTask.objects.bulk_create([ArchivedTask(**row) for row in rows], ignore_conflicts=True)
+        # A queryset delete: archived tasks still count in UserTaskStats.
+        Task.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def archive_tasks(now=None, batch_size=None, pause=None, max_seconds=None):
+    """Archive every eligible task in throttled batches; returns the number archived.
+
+    Stops after ``max_seconds`` (``TASK_ARCHIVE_MAX_SECONDS``) so a large
+    backlog is worked off over several periodic runs instead of one long one.
+    """
+    days = settings.TASK_ARCHIVE_AFTER_DAYS
+    if not days:
+        return 0
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    batch_size = batch_size or settings.TASK_ARCHIVE_BATCH_SIZE
+    pause = settings.TASK_ARCHIVE_PAUSE_SECONDS if pause is None else pause
+    max_seconds = settings.TASK_ARCHIVE_MAX_SECONDS if max_seconds is None else max_seconds
+
+    started = time.monotonic()
+    archived = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        archived += moved
+        if moved < batch_size or (max_seconds and time.monotonic() - started >= max_seconds):
+            break
+        time.sleep(pause)
+
+    if archived:
+        logger.info('Archived %d terminal tasks older than %s', archived, cutoff)
+    return archived
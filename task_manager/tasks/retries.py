@@ -0,0 +1,129 @@
+"""Retry policy for failed handlers and the dead-letter queue.
+
+A handler error is either transient (the dependency may recover: network,
+broker, database, storage hiccups) or permanent (bad input, missing file).
+Transient failures go back to PENDING and are re-published through the
+outbox after a full-jitter exponential backoff, so a downstream blip does
+not turn into a synchronized retry storm. Permanent failures, and transient
+ones that have used up ``max_retries``, are marked FAILED and recorded in
+:class:`~tasks.models.TaskDeadLetter` for inspection and replay.
+"""
+
+import random
+import smtplib
+from collections import Counter, defaultdict
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, transaction
+from django.utils import timezone
+
+from .models import Task, TaskDeadLetter, TaskOutbox, UserTaskStats
+
+
+class TransientError(Exception):
+    """Raise from a handler to request a retry."""
+
+
+class PermanentError(Exception):
+    """Raise from a handler to fail the task without retrying."""
+
+
+TRANSIENT_ERRORS = (
+    TransientError,
+    ConnectionError,
+    TimeoutError,
+    # A handler pool process died (e.g. OOM-killed); the engine starts a new pool.
+    BrokenProcessPool,
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+)
+
+try:
+    from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+except ImportError:  # azure is only needed with Blob storage configured
+    pass
+else:
+    TRANSIENT_ERRORS += (ServiceRequestError, ServiceResponseError)
+
+
+def is_transient(exc):
+    if isinstance(exc, PermanentError):
+        return False
+    # Lost connections, deadlocks and lock timeouts; bad data or SQL never heals.
+    return isinstance(exc, TRANSIENT_ERRORS + (OperationalError, InterfaceError))
+
+
+def backoff_delay(attempt, base=None, cap=None, rng=random.random):
+    """Seconds to wait before retry number ``attempt`` (1-based), with full jitter."""
+    base = base if base is not None else settings.TASK_RETRY_BASE_SECONDS
+    cap = cap if cap is not None else settings.TASK_RETRY_MAX_SECONDS
+    return rng() * min(cap, base * 2 ** (attempt - 1))
+
+
+def handle_failure(task, exc):
+    """Retry or dead-letter ``task`` after its handler raised ``exc``.
+
+    Must run inside a transaction holding the task's row lock. Returns the
+    new status.
+    """
+    message = str(exc) or exc.__class__.__name__
+    task.error_message = message
+    if is_transient(exc) and task.retry_count < task.max_retries:
+        task.retry_count += 1
+        task.status = 'PENDING'
+        task.started_at = None
+        task.progress = 0
+        task.save(update_fields=['status', 'error_message', 'retry_count', 'started_at', 'progress'])
+        delay = backoff_delay(task.retry_count)
+        TaskOutbox.objects.create(
+            task=task,
+            priority=task.queued_priority or task.priority,
+            not_before=timezone.now() + timedelta(seconds=delay),
+        )
+        return 'PENDING'
+
+    task.status = 'FAILED'
+    task.save(update_fields=['status', 'error_message'])
+    TaskDeadLetter.objects.create(
+        task=task,
+        reason='transient' if is_transient(exc) else 'permanent',
+        error_type=exc.__class__.__name__,
+        error_message=message,
+        attempts=task.retry_count + 1,
+    )
+    return 'FAILED'
+
+
+def replay_dead_letters(queryset, batch_size=None):
+    """Re-queue the tasks of the unreplayed dead letters in ``queryset``; returns how many."""
+    batch_size = batch_size or settings.TASK_REPLAY_BATCH_SIZE
+    ids = list(queryset.filter(replayed_at__isnull=True).values_list('pk', flat=True))
+    replayed = 0
+    for start in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            letters = list(
+                TaskDeadLetter.objects.select_for_update()
+                .filter(pk__in=ids[start:start + batch_size], replayed_at__isnull=True, task__status='FAILED')
+                .select_related('task')
+            )
+            if not letters:
+                continue
+            tasks = {letter.task_id: letter.task for letter in letters}
+            Task.objects.filter(pk__in=tasks).update(
+                status='PENDING', retry_count=0, error_message='', progress=0, started_at=None, completed_at=None
+            )
+            TaskDeadLetter.objects.filter(pk__in=[letter.pk for letter in letters]).update(replayed_at=timezone.now())
+            TaskOutbox.objects.bulk_create(
+                [TaskOutbox(task_id=pk, priority=task.queued_priority or task.priority) for pk, task in tasks.items()]
+            )
+
+            deltas = defaultdict(Counter)
+            for task in tasks.values():
+                deltas[task.user_id]['FAILED'] -= 1
+                deltas[task.user_id]['PENDING'] += 1
+            for user_id, changes in deltas.items():
+                UserTaskStats.objects.record(user_id, changes)
+        replayed += len(tasks)
+    return replayed
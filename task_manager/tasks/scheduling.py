@@ -0,0 +1,99 @@
+"""Priority-aware dispatch of tasks onto per-priority Celery queues.
+
+Each ``Task.priority`` level has its own queue (``TASK_PRIORITY_QUEUES``).
+Workers drain them in priority order, so a Critical task never waits behind
+Low ones. To keep Low tasks from starving, :func:`promote_aged_tasks`
+re-publishes tasks that have been pending too long onto the next queue up;
+the copy left on the old queue is dropped by the worker's PENDING claim.
+
+Request and periodic code never talks to the broker directly: it calls
+:func:`enqueue_task`/:func:`enqueue_tasks` inside the transaction that
+creates or changes the task, and the outbox relay (``tasks.outbox``)
+publishes the rows once they have committed.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Task, TaskOutbox
+
+logger = logging.getLogger(__name__)
+
+MAX_PRIORITY = max(level for level, _ in Task.PRIORITY_CHOICES)
+
+
+def queue_for_priority(priority):
+    return settings.TASK_PRIORITY_QUEUES.get(priority, settings.TASK_PRIORITY_QUEUES[2])
+
+
+def _publish(task_id, priority, producer=None):
+    from .tasks import process_task_file
+
+    # The Celery id mirrors the Task id so messages can be revoked by task.
+    options = {'producer': producer} if producer is not None else {}
+    process_task_file.apply_async(
+        args=[str(task_id)],
+        queue=queue_for_priority(priority),
+        task_id=str(task_id),
+        **options,
+    )
+
+
+def publish_many(entries, batch_size=None):
+    """Publish ``(task_id, priority)`` pairs, reusing one producer connection per batch."""
+    from .tasks import process_task_file
+
+    entries = list(entries)
+    batch_size = batch_size or settings.TASK_DISPATCH_BATCH_SIZE
+    for start in range(0, len(entries), batch_size):
+        with process_task_file.app.producer_or_acquire() as producer:
+            for task_id, priority in entries[start:start + batch_size]:
+                _publish(task_id, priority, producer=producer)
+
+
+def enqueue_tasks(tasks, priority=None):
+    """Record outbox entries for ``tasks``; call inside the transaction that saves them."""
+    TaskOutbox.objects.bulk_create(
+        [TaskOutbox(task_id=task.pk, priority=priority or task.queued_priority or task.priority) for task in tasks],
+        batch_size=settings.TASK_BULK_CREATE_BATCH_SIZE,
+    )
+
+
+def enqueue_task(task, priority=None):
+    enqueue_tasks([task], priority)
+
+
+def promote_aged_tasks(now=None, batch_size=None):
+    """Move pending tasks up one queue for every aging period they have waited.
+
+    Returns the number of tasks promoted.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.TASK_PRIORITY_AGING_BATCH_SIZE
+    period = timedelta(seconds=settings.TASK_PRIORITY_AGING_SECONDS)
+
+    promoted = 0
+    for priority in range(1, MAX_PRIORITY):
+        # Walk queues top-down so a task moves at most one level per run.
+        for queued in range(MAX_PRIORITY - 1, priority - 1, -1):
+            cutoff = now - period * (queued - priority + 1)
+            ids = list(
+                Task.objects.filter(
+                    status='PENDING', priority=priority, queued_priority=queued, created_at__lte=cutoff,
+                    pending_dependencies=0,
+                ).values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                continue
+            with transaction.atomic():
+                Task.objects.filter(pk__in=ids, status='PENDING').update(queued_priority=queued + 1)
+                TaskOutbox.objects.bulk_create([TaskOutbox(task_id=task_id, priority=queued + 1) for task_id in ids])
+            promoted += len(ids)
+
+    if promoted:
+        logger.info('Promoted %d aged pending tasks', promoted)
+    return promoted
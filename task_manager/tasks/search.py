@@ -0,0 +1,221 @@
+"""Full-text search for ``?search=`` on the task endpoints.
+
+Instead of ``LIKE '%term%'`` over the user's whole history, terms are looked
+up in a full-text index chosen by database vendor:
+
+* SQLite: an FTS5 table (``tasks_task_fts``) holding a copy of each task's
+  id, owner, title and description, kept in step with ``tasks_task`` by
+  triggers and ranked with bm25. Entries are keyed by task id rather than
+  rowid, which VACUUM may renumber on a table with a UUID primary key. The
+  owner's id is indexed too, so a query only walks the postings of that
+  user's tasks.
+* SQL Server: a full-text index on ``tasks_task`` queried through
+  CONTAINSTABLE, with automatic change tracking.
+* Anything else, or SQLite built without FTS5: ``icontains`` per term.
+
+Each term is matched as a prefix and every term must match. Indexed backends
+annotate the results with ``relevance`` (higher is better), which
+:class:`~tasks.pagination.TaskCursorPagination` sorts by unless ``?ordering=``
+asks for something else. The index structures are created after ``migrate``.
+"""
+
+import logging
+import operator
+import sqlite3
+from functools import reduce
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+logger = logging.getLogger(__name__)
+
+
+class LikeSearchBackend:
+    """Unindexed fallback: every term must appear in one of ``fields``."""
+
+    def install(self, connection):
+        pass
+
+    def rebuild(self, connection):
+        pass
+
+    def is_available(self, connection):
+        return True
+
+    def search(self, queryset, terms, fields, user_id=None):
+        conditions = [
+            reduce(operator.or_, (Q(**{f'{field}__icontains': term}) for field in fields))
+            for term in terms
+        ]
+        return queryset.filter(*conditions)
+
+
+class SQLiteSearchBackend(LikeSearchBackend):
+    table = 'tasks_task_fts'
+    # Column weights for bm25: id, user_id, title, description.
+    weights = (0.0, 0.0, 2.0, 1.0)
+
+    def __init__(self):
+        self._fts5 = None
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", [self.table])
+            row = cursor.fetchone()
+            if row is not None and 'content=' in row[0]:
+                # Earlier external-content index keyed by rowid; replaced by one keyed by task id.
+                for trigger in ('insert', 'delete', 'update'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {self.table}_{trigger}')
+                cursor.execute(f'DROP TABLE {self.table}')
+                row = None
+            if row is None:
+                try:
+                    cursor.execute(
+                        f'CREATE VIRTUAL TABLE {self.table} USING fts5('
+                        "id, user_id, title, description, "
+                        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                    )
+                except DatabaseError:
+                    logger.warning('SQLite has no FTS5 module; task search falls back to LIKE')
+                    return
+                weights = ', '.join(str(weight) for weight in self.weights)
+                cursor.execute(f"INSERT INTO {self.table}({self.table}, rank) VALUES ('rank', 'bm25({weights})')")
+                self.rebuild(connection)
+
+            columns = 'id, user_id, title, description'
+            new = 'new.id, new.user_id, new.title, new.description'
+            # The id column is indexed so a task's entry is found by MATCH, not a scan.
+            delete = (
+                f'DELETE FROM {self.table} WHERE rowid IN (SELECT rowid FROM {self.table} '
+                f"WHERE {self.table} MATCH 'id: \"' || old.id || '\"')"
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {self.table}_insert AFTER INSERT ON tasks_task BEGIN '
+                f'INSERT INTO {self.table}({columns}) VALUES ({new}); END'
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {self.table}_delete AFTER DELETE ON tasks_task BEGIN {delete}; END'
+            )
+            # Status and progress writes leave the indexed columns alone and skip this trigger.
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {self.table}_update AFTER UPDATE OF user_id, title, description '
+                'ON tasks_task WHEN old.user_id IS NOT new.user_id OR old.title IS NOT new.title '
+                'OR old.description IS NOT new.description BEGIN '
+                f'{delete}; INSERT INTO {self.table}({columns}) VALUES ({new}); END'
+            )
+
+    def rebuild(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table}(id, user_id, title, description) '
+                'SELECT id, user_id, title, description FROM tasks_task'
+            )
+
+    def is_available(self, connection):
+        # Decided without a query, so async views can call it; the table itself comes with migrate.
+        if self._fts5 is None:
+            probe = sqlite3.connect(':memory:')
+            try:
+                probe.execute('CREATE VIRTUAL TABLE probe USING fts5(body)')
+                self._fts5 = True
+            except sqlite3.OperationalError:
+                self._fts5 = False
+            finally:
+                probe.close()
+        return self._fts5
+
+    def search(self, queryset, terms, fields, user_id=None):
+        phrases = ' AND '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        match = f'{{title description}}: ({phrases})'
+        if user_id is not None:
+            match = f'user_id: "{user_id}" AND {match}'
+        return queryset.filter(search_entry__document__match=match).annotate(
+            relevance=-F('search_entry__rank')
+        )
+
+
+class SQLServerSearchBackend(LikeSearchBackend):
+    catalog = 'tasks_catalog'
+    columns = '(title, description)'
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = '{self.catalog}') "
+                f'CREATE FULLTEXT CATALOG {self.catalog}'
+            )
+            cursor.execute("SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('tasks_task')")
+            if cursor.fetchone() is not None:
+                return
+            cursor.execute(
+                "SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID('tasks_task') AND is_primary_key = 1"
+            )
+            (key_index,) = cursor.fetchone()
+            cursor.execute(
+                f'CREATE FULLTEXT INDEX ON tasks_task {self.columns} KEY INDEX [{key_index}] '
+                f'ON {self.catalog} WITH CHANGE_TRACKING AUTO'
+            )
+
+    def rebuild(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER FULLTEXT INDEX ON tasks_task START FULL POPULATION')
+
+    def search(self, queryset, terms, fields, user_id=None):
+        condition = ' AND '.join('"{}*"'.format(term.replace('"', '')) for term in terms)
+        matches = f'CONTAINSTABLE(tasks_task, {self.columns}, %s)'
+        return queryset.filter(id__in=RawSQL(f'SELECT [KEY] FROM {matches}', [condition])).annotate(
+            relevance=RawSQL(
+                f'(SELECT [RANK] FROM {matches} AS ranked WHERE ranked.[KEY] = tasks_task.id)',
+                [condition],
+                output_field=FloatField(),
+            )
+        )
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'microsoft': SQLServerSearchBackend,
+}
+
+_backends = {}
+
+
+def get_backend(connection):
+    """The search backend for ``connection``: ``TASK_SEARCH_BACKEND`` or the vendor's default."""
+    if connection.alias not in _backends:
+        path = settings.TASK_SEARCH_BACKEND
+        backend_class = import_string(path) if path else VENDOR_BACKENDS.get(connection.vendor, LikeSearchBackend)
+        _backends[connection.alias] = backend_class()
+    return _backends[connection.alias]
+
+
+def install(sender, using, **kwargs):
+    """``post_migrate`` receiver creating the full-text index structures."""
+    connection = connections[using]
+    try:
+        get_backend(connection).install(connection)
+    except DatabaseError:
+        logger.warning('Could not install the task search index on %s', using, exc_info=True)
+
+
+class TaskSearchFilter(filters.SearchFilter):
+    """``?search=`` through the configured backend, scoped to the requesting user."""
+
+    def filter_queryset(self, request, queryset, view):
+        # Terms with nothing to tokenize cannot go to a full-text index.
+        terms = [term for term in self.get_search_terms(request) if any(char.isalnum() for char in term)]
+        if not terms:
+            return super().filter_queryset(request, queryset, view)
+
+        connection = connections[queryset.db]
+        backend = get_backend(connection)
+        if not backend.is_available(connection):
+            backend = LikeSearchBackend()
+        return backend.search(
+            queryset, terms, self.get_search_fields(view, request), user_id=getattr(request.user, 'pk', None)
+        )
@@ -1,7 +1,29 @@
+import uuid
+
+from django.conf import settings
 from rest_framework import serializers
-from .models import Task
+from .handlers import unowned_files
+from .instrumentation import TimedRepresentationMixin
+from .models import Task, TaskDeadLetter, Workflow
+from .utils.file_handler import FileHandler
+from .workflows import create_workflow, describe_steps, topological_order
+
+# Potentially multi-megabyte columns left out of list responses.
+HEAVY_FIELDS = ('description', 'input_data', 'output_data')
+
+
+class DynamicFieldsMixin:
+    """Keep only the serializer fields named in the optional ``fields`` kwarg."""
 
-class TaskSerializer(serializers.ModelSerializer):
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class TaskSerializer(TimedRepresentationMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     processing_time = serializers.SerializerMethodField()
     
     class Meta:
@@ -13,12 +35,120 @@ class TaskSerializer(serializers.ModelSerializer):
     
     def get_processing_time(self, obj):
         return obj.processing_time
+
+    def validate_input_file(self, value):
+        if value:
+            try:
+                FileHandler.validate_file_size(value)
+                FileHandler.validate_file_type(value)
+            except ValueError as exc:
+                raise serializers.ValidationError(str(exc))
+        return value
+
+    def validate(self, attrs):
+        # Checked before the result cache is consulted, so a cached result never
+        # hands one user's stored images to another.
+        input_data = attrs.get('input_data')
+        images = input_data.get('images') if isinstance(input_data, dict) else None
+        if images is not None:
+            if not isinstance(images, list) or not all(isinstance(name, str) for name in images):
+                raise serializers.ValidationError({'input_data': 'images must be a list of stored file names.'})
+            missing = unowned_files(self.context['request'].user.pk, images)
+            if missing:
+                raise serializers.ValidationError({'input_data': f'Unknown images: {", ".join(missing)}'})
+        return attrs
     
+    def store_input_file(self):
+        """Stream an uploaded input file to storage, hashing it on the way; returns its SHA-256 or None.
+
+        The stored name replaces the upload in ``validated_data``, so ``save()`` does not write it again.
+        """
+        upload = self.validated_data.get('input_file')
+        if not upload:
+            return None
+        info = FileHandler.save_uploaded_file(upload, self.validated_data.setdefault('id', uuid.uuid4()))
+        self.validated_data['input_file'] = info['path']
+        return info['sha256']
+
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
-class TaskStatusSerializer(serializers.ModelSerializer):
+class TaskListSerializer(TaskSerializer):
+    """Compact representation used for list responses."""
+
+    class Meta(TaskSerializer.Meta):
+        fields = None
+        exclude = HEAVY_FIELDS
+
+# Columns TaskStatusSerializer (and the event payload) reads.
+STATUS_COLUMNS = ('id', 'user', 'status', 'progress', 'error_message', 'started_at', 'completed_at')
+
+
+class TaskStatusSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
+    # A model property, not a column, so it has to be declared explicitly.
+    processing_time = serializers.FloatField(read_only=True)
+
     class Meta:
         model = Task
-        fields = ['id', 'status', 'progress', 'error_message', 'processing_time']
\ No newline at end of file
+        fields = ['id', 'status', 'progress', 'error_message', 'processing_time']
+
+
+class TaskDeadLetterSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
+    task_id = serializers.UUIDField(source='task.id', read_only=True)
+    title = serializers.CharField(source='task.title', read_only=True)
+    task_type = serializers.CharField(source='task.task_type', read_only=True)
+
+    class Meta:
+        model = TaskDeadLetter
+        fields = ['id', 'task_id', 'title', 'task_type', 'reason', 'error_type', 'error_message',
+                  'attempts', 'created_at']
+
+
+class WorkflowStepSerializer(serializers.Serializer):
+    key = serializers.SlugField(max_length=64)
+    title = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    description = serializers.CharField(required=False, allow_blank=True)
+    task_type = serializers.ChoiceField(choices=Task.TASK_TYPES, default='DATA_PROCESSING')
+    priority = serializers.ChoiceField(choices=Task.PRIORITY_CHOICES, default=2)
+    input_data = serializers.DictField(required=False)
+    # An already stored file of the user's (input or output of one of their tasks).
+    input_file = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    depends_on = serializers.ListField(child=serializers.SlugField(max_length=64), required=False)
+
+
+class WorkflowSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
+    steps = WorkflowStepSerializer(many=True, write_only=True)
+    tasks = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Workflow
+        fields = ['id', 'name', 'status', 'created_at', 'completed_at', 'steps', 'tasks']
+        read_only_fields = ['status', 'completed_at']
+
+    def get_tasks(self, obj):
+        return describe_steps(obj)
+
+    def validate_steps(self, steps):
+        if not steps:
+            raise serializers.ValidationError('A workflow needs at least one step.')
+        if len(steps) > settings.TASK_WORKFLOW_MAX_STEPS:
+            raise serializers.ValidationError(f'At most {settings.TASK_WORKFLOW_MAX_STEPS} steps per workflow.')
+        files = [step['input_file'] for step in steps if step.get('input_file')]
+        missing = unowned_files(self.context['request'].user.pk, files) if files else []
+        if missing:
+            raise serializers.ValidationError(f'Unknown input files: {", ".join(missing)}')
+        try:
+            return topological_order(steps)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+
+    def create(self, validated_data):
+        return create_workflow(validated_data['user'], validated_data.get('name', ''), validated_data['steps'])
+
+
+class WorkflowListSerializer(WorkflowSerializer):
+    """Workflow summary without its steps, for list responses."""
+
+    class Meta(WorkflowSerializer.Meta):
+        fields = ['id', 'name', 'status', 'created_at', 'completed_at']
@@ -0,0 +1,159 @@
+"""Map-reduce over large line-oriented input files.
+
+A DATA_PROCESSING or FILE_CONVERSION task whose csv/ndjson input file is at
+least ``TASK_SHARD_MIN_BYTES`` is split into byte ranges of about
+``TASK_SHARD_BYTES`` (at most ``TASK_SHARD_MAX`` of them). Each range becomes
+a ``process_task_shard`` Celery task on the task's priority queue, so the
+shards run on as many workers as are free, and a chord calls
+``merge_task_shards`` with their outputs once all have finished.
+
+Shards stream their range straight from storage (ranged blob reads on Azure,
+a seek on local files) and own every line that *starts* inside it, so a
+record cut by a range boundary is read whole by exactly one shard. For csv,
+the ranges begin after the header line, which every shard reuses; quoted
+csv fields spanning lines are not supported in sharded files. Only
+handlers registered with a ``merge`` function are split; everything else
+runs in one piece as before.
+"""
+
+import csv
+import io
+import logging
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import F
+
+from . import events
+from .models import Task
+from .utils.file_handler import CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+SHARDABLE_FORMATS = {'csv', 'ndjson', 'jsonl'}
+
+
+@dataclass(frozen=True)
+class Shard:
+    """Bytes ``[start, end)`` of the input file, plus the csv header if any."""
+
+    index: int
+    start: int
+    end: int
+    fieldnames: Optional[tuple] = None
+
+
+def open_range(name, offset=0):
+    """Buffered binary reader over ``name`` from ``offset`` to its end."""
+    if hasattr(default_storage, 'open_range'):
+        return io.BufferedReader(default_storage.open_range(name, offset), CHUNK_SIZE)
+    file = default_storage.open(name, 'rb')
+    file.seek(offset)
+    return file
+
+
+def iter_lines(name, start, end):
+    """Decoded lines of ``name`` that start within bytes ``[start, end)``."""
+    # Starting one byte early tells a line beginning exactly at ``start`` from a cut one.
+    offset = max(start - 1, 0)
+    with open_range(name, offset) as raw:
+        position = offset
+        if start > 0:
+            position += len(raw.readline())
+        while position < end:
+            line = raw.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode('utf-8')
+
+
+def _header(name):
+    with open_range(name) as raw:
+        line = raw.readline()
+    return len(line), tuple(next(csv.reader([line.decode('utf-8')]), []))
+
+
+@dataclass(frozen=True)
+class Plan:
+    size: int
+    shards: list
+
+
+def plan(ctx):
+    """Split ``ctx``'s input into shards, or return None to run it in one piece."""
+    from .handlers import get_handler, input_format
+
+    if get_handler(ctx.task_type).merge is None or not ctx.input_file or 'records' in ctx.input_data:
+        return None
+    fmt = input_format(ctx)
+    if fmt not in SHARDABLE_FORMATS:
+        return None
+    size = default_storage.size(ctx.input_file)
+    if size < settings.TASK_SHARD_MIN_BYTES:
+        return None
+
+    start, fieldnames = 0, None
+    if fmt == 'csv':
+        start, fieldnames = _header(ctx.input_file)
+    step = max(settings.TASK_SHARD_BYTES, math.ceil((size - start) / settings.TASK_SHARD_MAX))
+    bounds = list(range(start, size, step)) + [size]
+    shards = [Shard(index, lo, hi, fieldnames) for index, (lo, hi) in enumerate(zip(bounds, bounds[1:]))]
+    return Plan(size, shards) if len(shards) > 1 else None
+
+
+def dispatch(task, shard_plan):
+    """Publish one Celery task per shard, with the merge as the chord callback."""
+    from celery import chord
+
+    from .scheduling import queue_for_priority
+    from .tasks import merge_task_shards, process_task_shard
+
+    queue = queue_for_priority(task.queued_priority or task.priority)
+    task_id = str(task.pk)
+    header = [
+        process_task_shard.si(task_id, shard.index, shard.start, shard.end, shard_plan.size, shard.fieldnames)
+        .set(queue=queue)
+        for shard in shard_plan.shards
+    ]
+    chord(header)(merge_task_shards.s(task_id).set(queue=queue))
+
+
+def _share(offset, size):
+    # Shards add up to 99%; the merge reports the last percent.
+    return offset * 99 // size
+
+
+def advance_progress(task, start, end, size):
+    """Add a finished shard's share of the input to the task's progress."""
+    delta = _share(end, size) - _share(start, size)
+    if not delta:
+        return
+    if not Task.objects.filter(pk=task.pk, status='PROCESSING').update(progress=F('progress') + delta):
+        return
+    percent = Task.objects.filter(pk=task.pk).values_list('progress', flat=True).first()
+    events.publish({'id': str(task.pk), 'user': task.user_id, 'status': 'PROCESSING', 'progress': percent})
+
+
+def discard_parts(outputs):
+    """Delete the partial files written by shards whose results will not be merged."""
+    for output in outputs:
+        name = (output or {}).get('part')
+        if name:
+            try:
+                default_storage.delete(name)
+            except OSError:
+                logger.warning('Could not delete shard part %s', name, exc_info=True)
+
+
+def copy_part(name, out):
+    """Append the stored file ``name`` to the binary file ``out``."""
+    with default_storage.open(name, 'rb') as part:
+        while True:
+            chunk = part.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            out.write(chunk)
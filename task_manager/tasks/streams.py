@@ -0,0 +1,79 @@
+"""Server-sent event streams of task status/progress (ASGI only).
+
+These are plain async Django views rather than DRF views so each open stream
+costs a coroutine, not a thread. Under WSGI an async iterator would be
+buffered to completion, so they are meant to be served by ``task_manager.asgi``.
+"""
+
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+
+from users.authentication import authenticate_async
+
+from . import events
+from .models import Task
+from .serializers import STATUS_COLUMNS
+
+TERMINAL_STATUSES = {'COMPLETED', 'FAILED', 'CANCELLED'}
+
+
+def format_event(event):
+    return f'event: task\ndata: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def _load_snapshot(pk):
+    task = await Task.objects.filter(pk=pk).only(*STATUS_COLUMNS).afirst()
+    return events.task_event(task) if task else None
+
+
+async def _stream(channels, task_id=None):
+    yield f'retry: {settings.TASK_EVENTS_RETRY_MS}\n\n'
+    subscription = events.subscribe(channels, timeout=settings.TASK_EVENTS_HEARTBEAT_SECONDS)
+    try:
+        # Read the snapshot only once subscribed so no update can fall in between.
+        await subscription.__anext__()
+        if task_id is not None:
+            snapshot = await _load_snapshot(task_id)
+            if snapshot is None:
+                return
+            yield format_event(snapshot)
+            if snapshot['status'] in TERMINAL_STATUSES:
+                return
+        async for event in subscription:
+            if event is None:
+                yield ': keep-alive\n\n'
+                continue
+            yield format_event(event)
+            if task_id is not None and event.get('status') in TERMINAL_STATUSES:
+                return
+    finally:
+        await subscription.aclose()
+
+
+def _event_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def task_events(request, pk):
+    """Stream events for one task, starting with its current state."""
+    user = await authenticate_async(request, allow_query_token=True)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    if not await Task.objects.filter(pk=pk, user=user).aexists():
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    return _event_response(_stream([events.task_channel(pk)], task_id=pk))
+
+
+async def user_events(request):
+    """Stream events for every task owned by the authenticated user."""
+    user = await authenticate_async(request, allow_query_token=True)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    return _event_response(_stream([events.user_channel(user.pk)]))
@@ -1,10 +1,205 @@
+import logging
+
 from celery import shared_task
-import time
+from django.db import transaction
+from django.utils import timezone
+
+from . import result_cache, sharding, workflows
+from .cancellation import TaskCancelled, revoke
+from .retries import PermanentError, TransientError, handle_failure, is_transient
+from .engine import run_handler
+from .handlers import HandlerContext, get_handler
+from .metrics import processing_seconds, queue_wait_seconds, task_attempts
+from .models import ArchivedTask, Task, TaskOutbox, UserTaskStats
+from .retention import archive_tasks
+from .scheduling import promote_aged_tasks
+
+logger = logging.getLogger(__name__)
+
 
 @shared_task
 def process_task_file(task_id):
-    # This simulates heavy processing (like AI analysis or file compression)
-    print(f"Starting background processing for Task ID: {task_id}")
-    time.sleep(10) # Simulate a 10-second heavy job
-    print(f"Task {task_id} processing complete!")
-    return True
\ No newline at end of file
+    """Run the registered handler for a task and record the outcome on the row."""
+    with transaction.atomic():
+        task = Task.objects.select_for_update().filter(pk=task_id).first()
+        if task is None or task.status != 'PENDING':
+            logger.info('Skipping task %s: not pending', task_id)
+            return False
+        if task.pending_dependencies:
+            logger.info('Skipping task %s: waiting for %d upstream step(s)', task_id, task.pending_dependencies)
+            return False
+        # A duplicate message must not run a retry before its backoff is up.
+        if TaskOutbox.objects.filter(task_id=task.pk, not_before__gt=timezone.now()).exists():
+            logger.info('Skipping task %s: retry not due yet', task_id)
+            return False
+        task.status = 'PROCESSING'
+        task.progress = 0
+        task.save(update_fields=['status', 'started_at', 'progress'])
+
+    labels = {'task_type': task.task_type, 'priority': task.priority}
+    if not task.retry_count:
+        queue_wait_seconds.observe((task.started_at - task.created_at).total_seconds(), **labels)
+
+    ctx = _context(task)
+    logger.info('Starting %s task %s', task.task_type, task_id)
+    try:
+        shard_plan = sharding.plan(ctx)
+        if shard_plan is not None:
+            sharding.dispatch(task, shard_plan)
+            logger.info('Task %s split into %d shards', task_id, len(shard_plan.shards))
+            return False
+        output_data, output_file = run_handler(ctx)
+    except TaskCancelled:
+        logger.info('Task %s stopped after cancellation', task_id)
+        task_attempts.inc(outcome='cancelled', **labels)
+        return False
+    except Exception as exc:
+        return _fail(task, exc, labels)
+    return _complete(task, output_data, output_file, labels)
+
+
+def _context(task, shard=None):
+    return HandlerContext(
+        task_id=str(task.id),
+        user_id=task.user_id,
+        task_type=task.task_type,
+        input_data=task.input_data,
+        input_file=task.input_file.name or None,
+        shard=shard,
+    )
+
+
+def _fail(task, exc, labels):
+    """Retry or dead-letter a task whose handler raised ``exc``."""
+    with transaction.atomic():
+        if not _still_processing(task):
+            task_attempts.inc(outcome='cancelled', **labels)
+            return False
+        outcome = handle_failure(task, exc)
+        if outcome == 'FAILED':
+            workflows.halt([task.pk], 'FAILED')
+    task_attempts.inc(outcome='retried' if outcome == 'PENDING' else 'failed', **labels)
+    if outcome == 'PENDING':
+        logger.warning('Task %s failed (attempt %d of %d), will retry: %s',
+                       task.pk, task.retry_count, task.max_retries + 1, task.error_message)
+    else:
+        logger.error('Task %s failed', task.pk, exc_info=exc)
+    return False
+
+
+def _complete(task, output_data, output_file, labels):
+    """Store a handler's result and release any workflow steps waiting on it."""
+    task.status = 'COMPLETED'
+    task.progress = 100
+    task.output_data = output_data
+    update_fields = ['status', 'completed_at', 'progress', 'output_data']
+    if output_file:
+        task.output_file.name = output_file
+        update_fields.append('output_file')
+    with transaction.atomic():
+        if not _still_processing(task):
+            task_attempts.inc(outcome='cancelled', **labels)
+            return False
+        task.save(update_fields=update_fields)
+        workflows.step_completed(task)
+    task_attempts.inc(outcome='completed', **labels)
+    processing_seconds.observe(task.processing_time, **labels)
+    if task.cache_key and get_handler(task.task_type).cacheable:
+        result_cache.store(task.cache_key, output_data, output_file, task.id)
+    logger.info('Task %s completed in %.3fs', task.pk, task.processing_time)
+    return True
+
+
+@shared_task
+def process_task_shard(task_id, index, start, end, size, fieldnames=None):
+    """Map step of a sharded task: run its handler over bytes ``[start, end)`` of the input.
+
+    Never raises, so one failed shard still lets the chord reach the merge,
+    which decides the task's outcome.
+    """
+    task = Task.objects.filter(pk=task_id, status='PROCESSING').first()
+    if task is None:
+        return {'cancelled': True}
+    shard = sharding.Shard(index, start, end, tuple(fieldnames) if fieldnames else None)
+    try:
+        output_data, _ = run_handler(_context(task, shard))
+    except TaskCancelled:
+        return {'cancelled': True}
+    except Exception as exc:
+        logger.warning('Shard %d of task %s failed: %s', index, task_id, exc, exc_info=True)
+        return {'error': str(exc) or exc.__class__.__name__, 'transient': is_transient(exc)}
+    sharding.advance_progress(task, start, end, size)
+    return {'output': output_data}
+
+
+@shared_task
+def merge_task_shards(results, task_id):
+    """Reduce step of a sharded task: merge the shard outputs and complete the task."""
+    outputs = [result.get('output') for result in results]
+    task = Task.objects.filter(pk=task_id, status='PROCESSING').first()
+    if task is None or any(result.get('cancelled') for result in results):
+        logger.info('Discarding shards of task %s: no longer processing', task_id)
+        sharding.discard_parts(outputs)
+        return False
+
+    labels = {'task_type': task.task_type, 'priority': task.priority}
+    errors = [result for result in results if 'error' in result]
+    if errors:
+        sharding.discard_parts(outputs)
+        # Retrying the whole task is only worth it if every failure may go away.
+        error_class = TransientError if all(error['transient'] for error in errors) else PermanentError
+        return _fail(task, error_class(errors[0]['error']), labels)
+
+    ctx = _context(task)
+    try:
+        output_data = get_handler(task.task_type).merge(ctx, outputs)
+    except Exception as exc:
+        sharding.discard_parts(outputs)
+        return _fail(task, exc, labels)
+    return _complete(task, output_data, ctx.output_file, labels)
+
+
+def _still_processing(task):
+    """Lock the row and check the task was not cancelled while its handler ran."""
+    if Task.objects.select_for_update().filter(pk=task.pk, status='PROCESSING').exists():
+        return True
+    logger.info('Discarding outcome of task %s: no longer processing', task.pk)
+    return False
+
+
+@shared_task
+def terminate_cancelled_tasks(task_ids):
+    """Hard-stop cancelled tasks whose handlers outlived the grace period.
+
+    Terminating kills the prefork child running the handler inline; handlers
+    in the engine's process pool are killed by the engine instead.
+    """
+    # Terminating is a no-op for ids the workers are no longer running.
+    task_ids = list(Task.objects.filter(pk__in=task_ids, status='CANCELLED').values_list('pk', flat=True))
+    revoke(task_ids, terminate=True)
+    return len(task_ids)
+
+
+@shared_task
+def age_pending_tasks():
+    """Periodic: promote long-waiting tasks so low priorities never starve."""
+    return promote_aged_tasks()
+
+
+@shared_task
+def reconcile_task_counters():
+    """Periodic: rebuild every user's status counters from the task and archive tables."""
+    user_ids = Task.objects.order_by().values_list('user_id', flat=True).union(
+        ArchivedTask.objects.order_by().values_list('user_id', flat=True)
+    )
+    count = 0
+    for user_id in user_ids.iterator():
+        UserTaskStats.objects.reconcile(user_id)
+        count += 1
+    return count
+
+
+@shared_task
+def archive_terminal_tasks():
+    """Periodic: move old finished tasks to the archive table."""
+    return archive_tasks()
@@ -1,9 +1,51 @@
+import gzip
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
 from django.urls import reverse
+from django.utils import timezone
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from asgiref.sync import async_to_sync
+from cryptography.fernet import Fernet
+from django.db import connection
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-from .models import Task
+from . import async_views, benchmarks, engine, events, metrics, outbox, result_cache, retention, search, sharding
+from .cancellation import CancellationToken, TaskCancelled, cancel_tasks
+from .handlers import HandlerContext
+from .metrics import queue_wait_seconds, result_cache_lookups
+from .retries import TransientError, backoff_delay, is_transient
+from .progress import ProgressBatcher, ProgressReporter
+from .models import ArchivedTask, Task, TaskDeadLetter, TaskDependency, TaskOutbox, UserTaskStats, Workflow
+from .scheduling import promote_aged_tasks, publish_many
+from .tasks import process_task_file, reconcile_task_counters
+from .utils.file_handler import SNIFFABLE_TYPES, FileHandler, HashingStream
+from task_manager.custom_azure import AzureMediaStorage, BlobRangeReader
+from task_manager.keyvault import SECRET_MAPPING, SecretCache, VaultSecretsLoader
+from users.authentication import cache_user
 
 User = get_user_model()
 
@@ -45,10 +87,1456 @@ class TaskOrchestratorTests(APITestCase):
         response = self.client.get(url)
 
         # Check if the list returns only the user's tasks
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_unauthenticated_access(self):
         self.client.credentials()  # Clear tokens
         url = reverse('task-list')
         response = self.client.get(url)
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+    def test_list_keyset_pagination_walks_ties_without_gaps(self):
+        created_at = timezone.now()
+        tasks = [Task.objects.create(user=self.user, title=f'T{i}', priority=i % 2 + 1) for i in range(7)]
+        # Identical timestamps force the id tiebreaker to do the work.
+        Task.objects.filter(user=self.user).update(created_at=created_at)
+
+        # Low-cardinality orderings fall back to created_at before the id, like their indexes.
+        Task.objects.filter(pk__in=[t.pk for t in tasks[:3]]).update(created_at=created_at - timedelta(hours=1))
+        keysets = {
+            '-created_at': ('-created_at', '-id'),
+            'priority': ('priority', 'created_at', 'id'),
+            'status': ('status', 'created_at', 'id'),
+        }
+        for ordering, keyset in keysets.items():
+            seen = []
+            url = reverse('task-list') + f'?page_size=3&ordering={ordering}'
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                seen.extend(row['id'] for row in response.data['results'])
+                url = response.data['next']
+            expected = Task.objects.filter(user=self.user).order_by(*keyset).values_list('id', flat=True)
+            self.assertEqual(seen, [str(pk) for pk in expected])
+
+        first = self.client.get(reverse('task-by-status') + '?page_size=3')
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    def test_list_omits_heavy_columns_and_supports_projection(self):
+        task = Task.objects.create(user=self.user, title='Big', description='x' * 1000, input_data={'k': 1})
+        url = reverse('task-list')
+
+        with self.assertNumQueries(1):  # one list query; the JWT user comes from the auth cache
+            row = self.client.get(url).data['results'][0]
+        self.assertNotIn('input_data', row)
+        self.assertNotIn('description', row)
+        self.assertIn('status', row)
+
+        with self.assertNumQueries(1):
+            row = self.client.get(url + '?fields=id,title,input_data,processing_time').data['results'][0]
+        self.assertEqual(set(row), {'id', 'title', 'input_data', 'processing_time'})
+
+        detail = self.client.get(reverse('task-detail', args=[task.id])).data
+        self.assertEqual(detail['description'], 'x' * 1000)
+
+        response = self.client.get(url + '?fields=nope')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_dashboard_stats_reads_maintained_counters(self):
+        done = Task.objects.create(user=self.user, title='Done')
+        Task.objects.create(user=self.user, title='Waiting')
+        gone = Task.objects.create(user=self.user, title='Gone')
+        done.status = 'COMPLETED'
+        done.save(update_fields=['status', 'completed_at'])
+        self.client.post(reverse('task-cancel', args=[gone.id]))
+
+        with self.assertNumQueries(2):  # counters row, recent tasks (JWT user is cached)
+            response = self.client.get(reverse('task-dashboard-stats'))
+        self.assertEqual(
+            response.data['stats'],
+            {'total': 3, 'pending': 1, 'processing': 0, 'completed': 1, 'failed': 0, 'cancelled': 1},
+        )
+
+        gone.delete()
+        UserTaskStats.objects.filter(user=self.user).update(pending=40)
+        UserTaskStats.objects.reconcile(self.user.pk)
+        stats = self.client.get(reverse('task-dashboard-stats')).data['stats']
+        self.assertEqual((stats['total'], stats['pending'], stats['cancelled']), (2, 1, 0))
+
+        filtered = self.client.get(reverse('task-dashboard-stats') + '?status=COMPLETED').data['stats']
+        self.assertEqual(filtered['total'], 1)
+
+    @override_settings(TASK_EXPORT_BATCH_SIZE=2)
+    def test_export_streams_every_row(self):
+        for i in range(5):
+            Task.objects.create(user=self.user, title=f'E{i}', input_data={'n': i})
+        Task.objects.create(user=User.objects.create_user(username='o', email='o@example.com'), title='Other')
+
+        response = self.client.get(reverse('task-export'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(sorted(json.loads(line)['title'] for line in lines), [f'E{i}' for i in range(5)])
+
+        response = self.client.get(reverse('task-export') + '?output=csv&compress=gzip')
+        rows = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(rows), 6)
+        self.assertTrue(rows[0].startswith('id,user_id,title'))
+
+    def test_bulk_create_reports_per_item_results(self):
+        url = reverse('task-bulk-create')
+        payload = [
+            {'title': 'First', 'priority': 3},
+            {'title': '', 'priority': 1},
+            {'title': 'Third', 'task_type': 'REPORT_GENERATION'},
+        ]
+        response = self.client.post(url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([r['status'] for r in response.data['results']], ['created', 'invalid', 'created'])
+        self.assertIn('title', response.data['results'][1]['errors'])
+        self.assertEqual(Task.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Task.objects.get(title='First').queued_priority, 3)
+        self.assertEqual(UserTaskStats.objects.get(user=self.user).pending, 2)
+        queued = TaskOutbox.objects.values_list('task_id', flat=True)
+        self.assertEqual({str(pk) for pk in queued}, {response.data['results'][0]['id'], response.data['results'][2]['id']})
+
+    def test_bulk_create_rejects_non_list(self):
+        response = self.client.post(reverse('task-bulk-create'), {'title': 'x'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+@override_settings(TASK_CPU_POOL_SIZE=0, TASK_IO_POOL_SIZE=0)
+class TaskExecutionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='worker', email='worker@example.com', password='pw')
+
+    def test_data_processing_completes_with_output(self):
+        task = Task.objects.create(
+            user=self.user,
+            title='Sum',
+            task_type='DATA_PROCESSING',
+            input_data={'records': [{'value': 1, 'name': 'a'}, {'value': '3'}]},
+        )
+        self.assertTrue(process_task_file(str(task.id)))
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'COMPLETED')
+        self.assertEqual(task.progress, 100)
+        self.assertEqual(task.output_data['rows'], 2)
+        self.assertEqual(task.output_data['columns']['value']['sum'], 4)
+        self.assertIsNotNone(task.processing_time)
+
+    def test_handler_error_marks_task_failed(self):
+        task = Task.objects.create(user=self.user, title='Mail', task_type='EMAIL_NOTIFICATION')
+        self.assertFalse(process_task_file(str(task.id)))
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'FAILED')
+        self.assertIn('recipient', task.error_message)
+
+    def test_email_notification_sends_mail(self):
+        task = Task.objects.create(
+            user=self.user,
+            title='Mail',
+            task_type='EMAIL_NOTIFICATION',
+            input_data={'subject': 'Done', 'message': 'Hi', 'recipients': ['a@example.com']},
+        )
+        process_task_file(str(task.id))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_non_pending_task_is_skipped(self):
+        task = Task.objects.create(user=self.user, title='Gone', status='CANCELLED')
+        self.assertFalse(process_task_file(str(task.id)))
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'CANCELLED')
+
+    @override_settings(TASK_CPU_POOL_SIZE=2)
+    def test_prefork_children_run_cpu_handlers_inline(self):
+        task = Task.objects.create(
+            user=self.user, title='Sum', task_type='DATA_PROCESSING', input_data={'records': [{'value': 1}]}
+        )
+        with mock.patch.object(engine, '_in_daemon_process', return_value=True), \
+                mock.patch.object(engine, '_get_process_pool') as pool:
+            self.assertTrue(process_task_file(str(task.id)))
+        pool.assert_not_called()
+
+    @override_settings(TASK_CPU_POOL_SIZE=1)
+    def test_broken_process_pool_is_replaced(self):
+        broken = mock.Mock(_broken='A child process terminated abruptly')
+        self.enterContext(mock.patch.object(engine, '_process_pool', broken))
+        with mock.patch.object(engine, 'ProcessPoolExecutor') as executor:
+            self.assertIs(engine._get_process_pool(), executor.return_value)
+        broken.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+        self.assertTrue(is_transient(BrokenProcessPool()))
+
+
+class PrioritySchedulingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sched', email='sched@example.com', password='pw')
+
+    @mock.patch('tasks.tasks.process_task_file.apply_async')
+    def test_publish_routes_by_priority(self, apply_async):
+        task = Task.objects.create(user=self.user, title='Urgent', priority=4)
+        publish_many([(task.id, 4)])
+        apply_async.assert_called_once_with(
+            args=[str(task.id)], queue='tasks.critical', task_id=str(task.id), producer=mock.ANY,
+        )
+
+    @override_settings(TASK_PRIORITY_AGING_SECONDS=60)
+    def test_aged_low_priority_task_is_promoted_once_per_run(self):
+        old = Task.objects.create(user=self.user, title='Old', priority=1)
+        Task.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(minutes=10))
+        Task.objects.create(user=self.user, title='Fresh', priority=1)
+
+        TaskOutbox.objects.all().delete()
+        self.assertEqual(promote_aged_tasks(), 1)
+        self.assertEqual(list(TaskOutbox.objects.values_list('task_id', 'priority')), [(old.id, 2)])
+        old.refresh_from_db()
+        self.assertEqual(old.queued_priority, 2)
+
+    def test_queue_stats_requires_staff(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get(reverse('task-queue-stats')).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        Task.objects.create(user=self.user, title='Waiting', priority=4)
+        response = client.get(reverse('task-queue-stats'))
+        self.assertEqual(response.data['Critical']['pending'], 1)
+        self.assertEqual(response.data['Critical']['queue'], 'tasks.critical')
+
+    def test_queue_wait_quantiles(self):
+        for seconds in (0.2, 0.3, 40):
+            queue_wait_seconds.observe(seconds, priority='test')
+        self.assertLessEqual(queue_wait_seconds.quantile(0.5, priority='test'), 0.5)
+        self.assertGreater(queue_wait_seconds.quantile(0.99, priority='test'), 30)
+
+
+@override_settings(TASK_CPU_POOL_SIZE=0, TASK_IO_POOL_SIZE=0, TASK_METRICS_FLUSH_SECONDS=60)
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.flush()
+        caches['metrics'].clear()
+        self.user = User.objects.create_user(username='metered', email='metered@example.com', password='pw')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_observations_are_buffered_until_flushed(self):
+        metrics.result_cache_lookups.inc(3, outcome='buffered')
+        self.assertIsNone(caches['metrics'].get('metrics:task_result_cache_lookups:outcome=buffered'))
+        self.assertEqual(metrics.result_cache_lookups.value(outcome='buffered'), 3)
+
+    def test_due_flush_runs_off_thread_into_the_metrics_cache(self):
+        with override_settings(TASK_METRICS_FLUSH_SECONDS=0):
+            with mock.patch.object(metrics, 'flush', wraps=metrics.flush) as flush:
+                metrics.result_cache_lookups.inc(outcome='background')
+                metrics._flusher.join()
+        flush.assert_called_once_with()
+        self.assertEqual(caches['metrics'].get('metrics:task_result_cache_lookups:outcome=background'), 1)
+        self.assertIsNone(caches['default'].get('metrics:task_result_cache_lookups:outcome=background'))
+
+    def test_request_cost_per_view_and_action(self):
+        Task.objects.create(user=self.user, title='One')
+        self.client.get(reverse('task-list'))
+        self.client.get(reverse('task-list'))
+
+        labels = {'view': 'TaskViewSet', 'action': 'list'}
+        queries = metrics.request_queries.snapshot(**labels)
+        self.assertEqual(queries['count'], 2)
+        self.assertGreaterEqual(queries['sum'], 2)
+        self.assertGreater(metrics.request_query_seconds.snapshot(**labels)['sum'], 0)
+        self.assertEqual(metrics.request_serialize_seconds.snapshot(**labels)['count'], 2)
+        self.assertGreater(metrics.response_size_bytes.snapshot(**labels)['sum'], 0)
+        # Non-viewset routes are not recorded.
+        self.client.get('/metrics')
+        self.assertEqual(metrics.request_seconds.series(view='metrics_view'), [])
+
+    def test_worker_lifecycle_metrics(self):
+        ok = Task.objects.create(user=self.user, title='Sum', priority=3, input_data={'records': [{'v': 1}]})
+        bad = Task.objects.create(user=self.user, title='Mail', task_type='EMAIL_NOTIFICATION', max_retries=0)
+        process_task_file(str(ok.id))
+        process_task_file(str(bad.id))
+
+        labels = {'task_type': 'DATA_PROCESSING', 'priority': 3}
+        self.assertEqual(metrics.task_attempts.value(outcome='completed', **labels), 1)
+        self.assertEqual(metrics.processing_seconds.snapshot(**labels)['count'], 1)
+        self.assertEqual(metrics.queue_wait_seconds.snapshot(task_type='DATA_PROCESSING')['count'], 1)
+        self.assertEqual(metrics.task_attempts.value(outcome='failed', task_type='EMAIL_NOTIFICATION', priority=2), 1)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_prometheus_endpoint(self):
+        Task.objects.create(user=self.user, title='Waiting', priority=4)
+        self.client.get(reverse('task-list'))
+        self.assertEqual(APIClient().get('/metrics').status_code, 401)
+
+        response = APIClient().get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE api_request_seconds histogram', body)
+        self.assertIn('api_request_seconds_bucket{action="list",le="+Inf",view="TaskViewSet"} 1', body)
+        self.assertIn('task_pending{priority="4",task_type="DATA_PROCESSING"} 1', body)
+
+
+class TaskEventStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='stream', email='stream@example.com', password='pw')
+        self.token = str(AccessToken.for_user(self.user))
+
+    def test_status_change_publishes_after_commit(self):
+        task = Task.objects.create(user=self.user, title='Push')
+        with mock.patch('tasks.events.publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                task.status = 'PROCESSING'
+                task.save(update_fields=['status', 'started_at'])
+            with self.captureOnCommitCallbacks(execute=True):
+                task.save(update_fields=['title'])
+        publish.assert_called_once()
+        event = publish.call_args[0][0]
+        self.assertEqual((event['id'], event['status']), (str(task.id), 'PROCESSING'))
+        self.assertIn('processing_time', event)
+
+    def test_publish_is_queued_for_a_background_thread(self):
+        release = threading.Event()
+        client = mock.Mock()
+        client.pipeline.return_value.execute.side_effect = lambda: release.wait(5)
+        with mock.patch('tasks.events._redis', return_value=client):
+            started = time.monotonic()
+            for index in range(3):
+                events.publish({'id': f'task-{index}', 'user': self.user.pk})
+            self.assertLess(time.monotonic() - started, 0.5)
+            release.set()
+            deadline = time.monotonic() + 5
+            while client.pipeline.return_value.publish.call_count < 6 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        channels = {c.args[0] for c in client.pipeline.return_value.publish.call_args_list}
+        self.assertEqual(channels, {'tasks:task:task-0', 'tasks:task:task-1', 'tasks:task:task-2',
+                                    f'tasks:user:{self.user.pk}'})
+
+    @override_settings(TASK_EVENTS_SOCKET_TIMEOUT=0.25)
+    def test_redis_client_has_socket_timeouts(self):
+        self.enterContext(mock.patch.object(events, '_client', None))
+        with mock.patch('redis.Redis.from_url') as from_url:
+            events._redis()
+        self.assertEqual(from_url.call_args.kwargs, {'socket_connect_timeout': 0.25, 'socket_timeout': 0.25})
+
+    async def test_task_stream_sends_snapshot_then_events_until_terminal(self):
+        task = await Task.objects.acreate(user=self.user, title='Watch')
+
+        async def fake_subscribe(channels, timeout):
+            self.assertEqual(channels, [f'tasks:task:{task.id}'])
+            yield None
+            yield {'id': str(task.id), 'status': 'PROCESSING', 'progress': 50}
+            yield {'id': str(task.id), 'status': 'COMPLETED', 'progress': 100}
+            yield {'id': str(task.id), 'status': 'NEVER_SENT'}
+
+        with mock.patch('tasks.events.subscribe', fake_subscribe):
+            response = await AsyncClient().get(f'/api/tasks/{task.id}/events/?token={self.token}')
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        statuses = [json.loads(line[6:])['status'] for line in body.splitlines() if line.startswith('data: ')]
+        self.assertEqual(statuses, ['PENDING', 'PROCESSING', 'COMPLETED'])
+
+    async def test_stream_requires_token_and_ownership(self):
+        task = await Task.objects.acreate(user=self.user, title='Private')
+        response = await AsyncClient().get(f'/api/tasks/{task.id}/events/')
+        self.assertEqual(response.status_code, 401)
+
+        other = await User.objects.acreate(username='x', email='x@example.com')
+        token = str(AccessToken.for_user(other))
+        response = await AsyncClient().get(
+            f'/api/tasks/{task.id}/events/', headers={'Authorization': f'Bearer {token}'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@mock.patch('tasks.events.publish')
+class ProgressReporterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='prog', email='prog@example.com', password='pw')
+        self.task = Task.objects.create(user=self.user, title='Slow', status='PROCESSING')
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    def test_reports_are_coalesced_by_step_and_interval(self, publish):
+        reporter = ProgressReporter(self.task.id, self.user.pk, interval_ms=500, step=25, clock=self.clock)
+        with self.assertNumQueries(5):  # 0, 25, 50, 75, 100
+            for percent in range(101):
+                reporter.report(percent)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.progress, 100)
+
+        reporter.report(3)  # large drop still counts as a step
+        self.now = 1.0
+        with self.assertNumQueries(1):
+            reporter.report(4)
+            reporter.report(4)
+        self.assertEqual(publish.call_count, 7)
+
+    def test_batcher_folds_many_tasks_into_one_update(self, publish):
+        other = Task.objects.create(user=self.user, title='Other', status='PROCESSING')
+        batcher = ProgressBatcher(interval_ms=1000, clock=self.clock)
+        first = ProgressReporter(self.task.id, self.user.pk, step=1, batcher=batcher, clock=self.clock)
+        second = ProgressReporter(other.id, self.user.pk, step=1, batcher=batcher, clock=self.clock)
+
+        with self.assertNumQueries(0):
+            first.report(40)
+            second.report(70)
+        self.now = 2.0
+        with self.assertNumQueries(1):
+            first.report(41)
+        self.assertEqual(
+            dict(Task.objects.filter(pk__in=[self.task.id, other.id]).values_list('title', 'progress')),
+            {'Slow': 41, 'Other': 70},
+        )
+
+        second.report(90)
+        with self.assertNumQueries(1):
+            second.close()
+        other.refresh_from_db()
+        self.assertEqual(other.progress, 90)
+
+    @mock.patch('tasks.progress.connections')
+    @mock.patch('tasks.progress.threading.Timer')
+    def test_batcher_writes_held_back_values_on_a_timer(self, timer, connections, publish):
+        batcher = ProgressBatcher(interval_ms=1000, clock=self.clock)
+        reporter = ProgressReporter(self.task.id, self.user.pk, step=1, batcher=batcher, clock=self.clock)
+        self.now = 0.25
+        with self.assertNumQueries(0):
+            reporter.report(30)
+            reporter.report(35)
+        timer.assert_called_once_with(0.75, batcher._flush_held)
+
+        with self.assertNumQueries(1):
+            timer.call_args.args[1]()
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.progress, 35)
+        timer.return_value.cancel.assert_called_once_with()
+
+    def test_late_flush_does_not_touch_a_finished_task(self, publish):
+        batcher = ProgressBatcher(interval_ms=1000, clock=self.clock)
+        reporter = ProgressReporter(self.task.id, self.user.pk, step=1, batcher=batcher, clock=self.clock)
+        reporter.report(40)
+        Task.objects.filter(pk=self.task.pk).update(status='COMPLETED', progress=100)
+        batcher.flush()
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.progress, 100)
+
+
+class FileHandlerTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def test_save_streams_and_hashes_upload(self):
+        content = b'a,b\n' + b'1,2\n' * 50000
+        upload = SimpleUploadedFile('data.csv', content, content_type='text/csv')
+
+        info = FileHandler.save_uploaded_file(upload, 'abc')
+
+        self.assertEqual(info['sha256'], hashlib.sha256(content).hexdigest())
+        self.assertEqual(info['size'], len(content))
+        with default_storage.open(info['path'], 'rb') as stored:
+            self.assertEqual(stored.read(), content)
+
+    def test_hashing_stream_reports_the_full_size_before_reading(self):
+        content = b'x' * 1000
+        for source in (SimpleUploadedFile('data.csv', content), io.BytesIO(content)):
+            stream = HashingStream(source)
+            self.assertEqual(File(stream).size, len(content))
+            self.assertEqual((stream.bytes_read, source.tell()), (0, 0))
+            stream.read(300)
+            self.assertEqual((stream.size, stream.bytes_read), (len(content), 300))
+
+    def test_type_is_sniffed_from_content(self):
+        png = SimpleUploadedFile('image.png', b'\x89PNG\r\n\x1a\n' + b'\x00' * 32)
+        self.assertTrue(FileHandler.validate_file_type(png, ['.png']))
+        self.assertEqual(png.tell(), 0)
+
+        fake = SimpleUploadedFile('image.png', b'<script>alert(1)</script>')
+        with self.assertRaisesMessage(ValueError, 'does not match'):
+            FileHandler.validate_file_type(fake, ['.png'])
+        with self.assertRaisesMessage(ValueError, 'not allowed'):
+            FileHandler.validate_file_type(SimpleUploadedFile('run.exe', b'MZ'), ['.png'])
+
+    def test_task_upload_is_stored_and_hashed_in_one_pass(self):
+        user = User.objects.create_user(username='up', email='up@example.com', password='pw')
+        client = APIClient()
+        client.force_authenticate(user)
+        content = b'a,b\n' + b'1,2\n' * 1000
+        upload = SimpleUploadedFile('data.csv', content, content_type='text/csv')
+        with mock.patch.object(FileHandler, 'sha256', side_effect=AssertionError('hashed twice')):
+            response = client.post(
+                reverse('task-list'), {'title': 'Rows', 'input_file': upload}, format='multipart'
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+
+        task = Task.objects.get()
+        self.assertEqual(task.input_file.name, f'tasks/{task.pk}/input_{task.pk}.csv')
+        with default_storage.open(task.input_file.name, 'rb') as stored:
+            self.assertEqual(stored.read(), content)
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(task.cache_key, result_cache.compute_key('DATA_PROCESSING', {}, digest, 1))
+
+    def test_allowed_types_are_the_sniffable_ones(self):
+        self.assertEqual(set(settings.TASK_ALLOWED_INPUT_TYPES), SNIFFABLE_TYPES)
+        with self.assertRaisesMessage(ValueError, 'not allowed'):
+            FileHandler.validate_file_type(SimpleUploadedFile('notes.md', b'# hi'), ['.md', '.txt'])
+
+    def test_task_upload_with_mismatched_content_is_rejected(self):
+        user = User.objects.create_user(username='up', email='up@example.com', password='pw')
+        client = APIClient()
+        client.force_authenticate(user)
+        upload = SimpleUploadedFile('data.pdf', b'not really a pdf')
+        response = client.post(reverse('task-list'), {'title': 'Doc', 'input_file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('input_file', response.data)
+
+
+@override_settings(TASK_CPU_POOL_SIZE=0, TASK_IO_POOL_SIZE=0)
+class ResultCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='memo', email='memo@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payload = {'title': 'Sum', 'task_type': 'DATA_PROCESSING', 'input_data': {'records': [{'v': 2}]}}
+        caches['results'].clear()
+
+    def test_duplicate_submission_is_completed_from_cache(self):
+        first = self.client.post(reverse('task-list'), self.payload, format='json').data
+        process_task_file(first['id'])
+        self.assertEqual(TaskOutbox.objects.count(), 1)
+        hits = result_cache_lookups.value(outcome='hit')
+
+        second = self.client.post(reverse('task-list'), {**self.payload, 'title': 'Again'}, format='json').data
+        self.assertEqual(TaskOutbox.objects.count(), 1)
+        self.assertEqual(second['status'], 'COMPLETED')
+        self.assertEqual(second['output_data'], Task.objects.get(pk=first['id']).output_data)
+        self.assertEqual(result_cache_lookups.value(outcome='hit'), hits + 1)
+
+        self.client.post(reverse('task-list') + '?cache=false', self.payload, format='json')
+        self.assertEqual(TaskOutbox.objects.count(), 2)
+
+    def test_bulk_submission_uses_cache(self):
+        seed = self.client.post(reverse('task-list'), self.payload, format='json').data
+        process_task_file(seed['id'])
+
+        response = self.client.post(
+            reverse('task-bulk-create'),
+            [self.payload, {'title': 'Mail', 'task_type': 'EMAIL_NOTIFICATION', 'input_data': {'recipients': ['a@b.c']}}],
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # Side-effecting handlers are never served from the cache.
+        queued = TaskOutbox.objects.exclude(task_id=seed['id']).values_list('task__task_type', flat=True)
+        self.assertEqual(list(queued), ['EMAIL_NOTIFICATION'])
+        self.assertEqual(Task.objects.get(pk=response.data['results'][0]['id']).status, 'COMPLETED')
+
+    def test_cache_outage_does_not_fail_submissions(self):
+        down = mock.Mock(**{name: mock.Mock(side_effect=ConnectionError('redis down')) for name in ('get_many', 'set')})
+        errors = metrics.result_cache_errors.value(operation='lookup')
+        with mock.patch('tasks.result_cache._cache', return_value=down), \
+                self.assertLogs('tasks.result_cache', 'WARNING'):
+            created = self.client.post(reverse('task-list'), self.payload, format='json')
+            self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+            bulk = self.client.post(reverse('task-bulk-create'), [self.payload], format='json')
+            self.assertEqual(bulk.status_code, status.HTTP_201_CREATED)
+            self.assertTrue(process_task_file(created.data['id']))
+        self.assertEqual(TaskOutbox.objects.count(), 2)
+        self.assertEqual(metrics.result_cache_errors.value(operation='lookup'), errors + 2)
+        self.assertEqual(Task.objects.get(pk=created.data['id']).status, 'COMPLETED')
+
+
+class _FakeBlobClient:
+    def __init__(self, data):
+        self.data = data
+        self.requests = []
+
+    def download_blob(self, offset, length, **kwargs):
+        self.requests.append((offset, length))
+        return mock.Mock(readall=lambda: self.data[offset:offset + length])
+
+
+AZURITE = os.getenv('AZURITE_CONNECTION_STRING')
+
+
+class AzureStorageTests(TestCase):
+    def test_range_reader_downloads_only_what_is_read(self):
+        blob = _FakeBlobClient(bytes(range(256)) * 4)
+        reader = BlobRangeReader(blob, 100, 900)
+        reader.seek(10)
+        self.assertEqual(reader.read(5), blob.data[110:115])
+        self.assertEqual(blob.requests, [(110, 5)])
+        reader.seek(-3, os.SEEK_END)
+        self.assertEqual(reader.read(), blob.data[897:900])
+        self.assertEqual(reader.read(), b'')
+
+    def test_storages_share_one_service_client(self):
+        connection_string = (
+            'DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;AccountKey=a2V5;'
+            'BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;'
+        )
+        first = AzureMediaStorage(connection_string=connection_string)
+        second = AzureMediaStorage(connection_string=connection_string)
+        self.assertIs(first.service_client, second.service_client)
+        self.assertEqual(first.service_client._config.max_block_size, first.block_size)
+
+    @unittest.skipUnless(AZURITE, 'set AZURITE_CONNECTION_STRING to run against Azurite')
+    def test_round_trip_against_azurite(self):
+        storage = AzureMediaStorage(
+            connection_string=AZURITE, azure_container='tasks-test', block_size=256 * 1024, single_put_size=256 * 1024
+        )
+        if not storage.client.exists():
+            storage.client.create_container()
+        payload = os.urandom(1024 * 1024 + 17)
+        names = FileHandler.save_many([('big.bin', ContentFile(payload)), ('small.txt', ContentFile(b'hi'))], storage)
+        self.addCleanup(lambda: [storage.delete(name) for name in names])
+
+        with storage.open(names[0]) as f:
+            f.seek(1024 * 1024)
+            self.assertEqual(f.read(), payload[1024 * 1024:])
+        self.assertEqual(storage.open_range(names[0], 5, 10).read(), payload[5:15])
+        self.assertEqual(FileHandler.open_many(names, storage), {names[0]: payload, names[1]: b'hi'})
+
+
+@override_settings(TASK_CPU_POOL_SIZE=0, TASK_IO_POOL_SIZE=0)
+class CancellationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='stopper', email='stop@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @mock.patch('tasks.cancellation.revoke')
+    def test_cancelling_pending_task_revokes_its_message(self, revoke):
+        task = Task.objects.create(user=self.user, title='Queued')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('task-cancel', args=[task.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        revoke.assert_called_once_with([task.id])
+        self.assertFalse(process_task_file(str(task.id)))
+
+        response = self.client.post(reverse('task-cancel', args=[task.id]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @mock.patch('tasks.cancellation.revoke')
+    @mock.patch('tasks.tasks.terminate_cancelled_tasks.apply_async')
+    def test_running_handler_stops_at_next_progress_point(self, terminate, revoke):
+        task = Task.objects.create(user=self.user, title='Long', input_data={'records': []})
+
+        def handler(ctx):
+            with self.captureOnCommitCallbacks(execute=True):
+                cancel_tasks(Task.objects.filter(pk=task.pk))
+            ctx.report_progress(50)
+            raise AssertionError('handler kept running')
+
+        with mock.patch('tasks.tasks.run_handler', side_effect=handler):
+            self.assertFalse(process_task_file(str(task.id)))
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'CANCELLED')
+        self.assertEqual(terminate.call_args.kwargs['args'], [[str(task.id)]])
+        stats = UserTaskStats.objects.get(user=self.user)
+        self.assertEqual((stats.processing, stats.cancelled), (0, 1))
+
+    def test_outcome_of_cancelled_task_is_discarded(self):
+        task = Task.objects.create(user=self.user, title='Late', input_data={'records': [{'v': 1}]})
+
+        def handler(ctx):
+            cancel_tasks(Task.objects.filter(pk=task.pk))
+            return {'rows': 1}, None
+
+        with mock.patch('tasks.tasks.run_handler', side_effect=handler):
+            self.assertFalse(process_task_file(str(task.id)))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.output_data), ('CANCELLED', {}))
+
+    @override_settings(TASK_CANCEL_CHECK_MS=1, TASK_CANCEL_GRACE_SECONDS=0)
+    def test_stuck_pool_handler_is_killed(self):
+        task = Task.objects.create(user=self.user, title='Stuck', status='CANCELLED')
+        ctx = HandlerContext(task_id=str(task.id), user_id=self.user.pk, task_type='DATA_PROCESSING', input_data={})
+        future = mock.Mock()
+        future.result.side_effect = FutureTimeout
+        pool = mock.Mock(_processes={4242: object()})
+        with mock.patch.object(engine, '_pool_pid', return_value=4242), mock.patch('os.kill') as kill:
+            with self.assertRaises(TaskCancelled):
+                engine._wait_killable(pool, future, ctx)
+        kill.assert_called_once_with(4242, signal.SIGKILL)
+
+        # Never signal a pid the pool does not own.
+        with mock.patch.object(engine, '_pool_pid', return_value=1), mock.patch('os.kill') as kill:
+            with self.assertRaises(TaskCancelled):
+                engine._wait_killable(pool, future, ctx)
+        kill.assert_not_called()
+
+    def test_parent_process_handlers_do_not_report_pids(self):
+        started = multiprocessing.SimpleQueue()
+        ctx = HandlerContext(task_id='t1', user_id=self.user.pk, task_type='DATA_PROCESSING', input_data={})
+        handler = mock.Mock(func=lambda ctx: ({'rows': 0}, None))
+        with mock.patch.object(engine, '_started', started), mock.patch.object(engine, '_pids', {}) as pids:
+            with mock.patch('tasks.handlers.get_handler', return_value=handler):
+                engine._call('DATA_PROCESSING', ctx)
+            self.assertTrue(started.empty())
+            self.assertIsNone(engine._pool_pid('t1'))
+            self.assertEqual(pids, {})
+
+    def test_token_checks_database_at_most_once_per_interval(self):
+        task = Task.objects.create(user=self.user, title='Token')
+        now = [0.0]
+        token = CancellationToken(task.id, interval_ms=1000, clock=lambda: now[0])
+        token.raise_if_cancelled()
+        Task.objects.filter(pk=task.pk).update(status='CANCELLED')
+        with self.assertNumQueries(0):
+            token.raise_if_cancelled()
+        now[0] = 1.0
+        with self.assertRaises(TaskCancelled):
+            token.raise_if_cancelled()
+
+    @mock.patch('tasks.cancellation.revoke')
+    def test_bulk_cancel_filtered_tasks(self, revoke):
+        other = User.objects.create_user(username='bystander', email='by@example.com', password='pw')
+        mails = [Task.objects.create(user=self.user, title=f'Mail {i}', task_type='EMAIL_NOTIFICATION') for i in range(3)]
+        kept = Task.objects.create(user=self.user, title='Report', task_type='REPORT_GENERATION')
+        foreign = Task.objects.create(user=other, title='Theirs', task_type='EMAIL_NOTIFICATION')
+        mails[0].status = 'COMPLETED'
+        mails[0].save(update_fields=['status'])
+
+        response = self.client.post(reverse('task-bulk-cancel') + '?task_type=EMAIL_NOTIFICATION', {}, format='json')
+        self.assertEqual(response.data, {'cancelled': 2})
+        self.assertEqual(set(Task.objects.filter(status='CANCELLED').values_list('pk', flat=True)),
+                         {mails[1].pk, mails[2].pk})
+        self.assertEqual(UserTaskStats.objects.get(user=self.user).as_dict()['cancelled'], 2)
+        self.assertEqual(Task.objects.get(pk=foreign.pk).status, 'PENDING')
+
+        response = self.client.post(reverse('task-bulk-cancel'), {'ids': [str(kept.id)]}, format='json')
+        self.assertEqual(response.data, {'cancelled': 1})
+        response = self.client.post(reverse('task-bulk-cancel'), {'ids': ['nope']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TaskOutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='relay', email='relay@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @mock.patch('tasks.scheduling._publish', side_effect=ConnectionError('broker down'))
+    def test_create_does_not_touch_the_broker(self, publish):
+        response = self.client.post(reverse('task-list'), {'title': 'Queued', 'priority': 3}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        publish.assert_not_called()
+        entry = TaskOutbox.objects.get()
+        self.assertEqual((str(entry.task_id), entry.priority, entry.dispatched_at), (response.data['id'], 3, None))
+
+    def test_relay_publishes_pending_entries_once(self):
+        tasks = [Task.objects.create(user=self.user, title=f'T{i}', priority=i + 1) for i in range(3)]
+        TaskOutbox.objects.bulk_create([TaskOutbox(task=task, priority=task.priority) for task in tasks])
+        cancel_tasks(Task.objects.filter(pk=tasks[2].pk))
+
+        with mock.patch('tasks.scheduling._publish') as publish:
+            self.assertEqual(outbox.relay_batch(batch_size=2), 2)
+            self.assertEqual(outbox.relay_batch(batch_size=2), 1)
+            self.assertEqual(outbox.relay_batch(batch_size=2), 0)
+        self.assertEqual([c.args for c in publish.call_args_list], [(tasks[0].id, 1), (tasks[1].id, 2)])
+        self.assertFalse(TaskOutbox.objects.filter(dispatched_at__isnull=True).exists())
+        self.assertEqual(outbox.backlog(), (0, 0.0))
+
+    def test_failed_publish_leaves_entries_for_retry(self):
+        task = Task.objects.create(user=self.user, title='Retry')
+        TaskOutbox.objects.create(task=task, priority=2)
+        with mock.patch('tasks.scheduling._publish', side_effect=ConnectionError('broker down')):
+            with self.assertRaises(ConnectionError):
+                outbox.relay_batch()
+        entry = TaskOutbox.objects.get()
+        self.assertEqual((entry.dispatched_at, entry.attempts, entry.last_error), (None, 1, 'broker down'))
+
+        with mock.patch('tasks.scheduling._publish') as publish:
+            call_command('relay_outbox', '--once')
+        publish.assert_called_once()
+        self.assertEqual(outbox.prune(retention_seconds=0), 1)
+
+
+@override_settings(TASK_CPU_POOL_SIZE=0, TASK_IO_POOL_SIZE=0, TASK_RETRY_BASE_SECONDS=10)
+class RetryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='retry', email='retry@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def run_failing(self, task, exc):
+        with mock.patch('tasks.tasks.run_handler', side_effect=exc):
+            self.assertFalse(process_task_file(str(task.id)))
+        task.refresh_from_db()
+
+    def test_backoff_is_jittered_and_capped(self):
+        self.assertEqual(backoff_delay(3, base=2, cap=60, rng=lambda: 1.0), 8)
+        self.assertEqual(backoff_delay(10, base=2, cap=60, rng=lambda: 1.0), 60)
+        self.assertEqual(backoff_delay(10, base=2, cap=60, rng=lambda: 0.25), 15)
+
+    def test_only_connection_level_database_errors_are_transient(self):
+        from django.db import DataError, IntegrityError, InterfaceError, OperationalError, ProgrammingError
+
+        self.assertTrue(is_transient(OperationalError('deadlock')))
+        self.assertTrue(is_transient(InterfaceError('connection closed')))
+        for error in (DataError, IntegrityError, ProgrammingError):
+            self.assertFalse(is_transient(error('never heals')))
+
+    def test_transient_error_is_retried_after_backoff(self):
+        task = Task.objects.create(user=self.user, title='Flaky', max_retries=1)
+        TaskOutbox.objects.all().delete()
+        before = timezone.now()
+        self.run_failing(task, ConnectionError('reset by peer'))
+
+        self.assertEqual((task.status, task.retry_count, task.error_message), ('PENDING', 1, 'reset by peer'))
+        entry = TaskOutbox.objects.get()
+        self.assertTrue(before <= entry.not_before <= before + timedelta(seconds=10))
+        with mock.patch('tasks.scheduling._publish') as publish, \
+                mock.patch('tasks.outbox.timezone.now', return_value=before):
+            self.assertEqual(outbox.relay_batch(), 0)
+        publish.assert_not_called()
+
+        # A leftover duplicate message does not cut the backoff short.
+        with mock.patch('tasks.tasks.run_handler') as run:
+            self.assertFalse(process_task_file(str(task.id)))
+        run.assert_not_called()
+        TaskOutbox.objects.update(not_before=before)
+
+        self.run_failing(task, TransientError('still down'))
+        self.assertEqual(task.status, 'FAILED')
+        letter = TaskDeadLetter.objects.get()
+        self.assertEqual((letter.reason, letter.attempts, letter.error_type), ('transient', 2, 'TransientError'))
+
+    def test_permanent_error_is_dead_lettered_and_replayable(self):
+        tasks = [Task.objects.create(user=self.user, title=f'Bad {i}') for i in range(2)]
+        for task in tasks:
+            self.run_failing(task, ValueError('bad input'))
+        self.assertEqual(tasks[0].retry_count, 0)
+
+        response = self.client.get(reverse('task-dead-letters') + '?reason=permanent')
+        self.assertEqual([item['task_id'] for item in response.data['results']], [str(t.id) for t in reversed(tasks)])
+
+        TaskOutbox.objects.all().delete()
+        response = self.client.post(reverse('task-replay'), {'ids': [str(tasks[0].id)]}, format='json')
+        self.assertEqual(response.data, {'replayed': 1})
+        tasks[0].refresh_from_db()
+        self.assertEqual((tasks[0].status, tasks[0].error_message), ('PENDING', ''))
+        self.assertEqual(list(TaskOutbox.objects.values_list('task_id', flat=True)), [tasks[0].id])
+        stats = UserTaskStats.objects.get(user=self.user)
+        self.assertEqual((stats.pending, stats.failed), (1, 1))
+        self.assertEqual(len(self.client.get(reverse('task-dead-letters')).data['results']), 1)
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='async', email='async@example.com', password='pw')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+        self.tasks = [Task.objects.create(user=self.user, title=f'T{i}', priority=i % 4 + 1) for i in range(4)]
+        self.factory = AsyncRequestFactory()
+
+    def call(self, view, path, *args):
+        response = async_to_sync(view)(self.factory.get(path, headers=self.headers), *args)
+        return response.status_code, json.loads(response.content)
+
+    def test_responses_match_the_sync_views(self):
+        pk = self.tasks[0].pk
+        cases = [
+            (async_views.task_list, '/api/tasks/?page_size=2&ordering=priority', ()),
+            (async_views.task_list, '/api/tasks/?fields=id,title&status=PENDING', ()),
+            (async_views.task_detail, f'/api/tasks/{pk}/', (pk,)),
+            (async_views.task_status, f'/api/tasks/{pk}/status/', (pk,)),
+            (async_views.dashboard_stats, '/api/tasks/dashboard_stats/', ()),
+            (async_views.dashboard_stats, '/api/tasks/dashboard_stats/?priority=2', ()),
+        ]
+        for view, path, args in cases:
+            with self.subTest(path=path):
+                expected = self.client.get(path)
+                self.assertEqual(self.call(view, path, *args), (expected.status_code, expected.json()))
+
+    def test_errors_and_other_methods(self):
+        response = async_to_sync(async_views.task_list)(self.factory.get('/api/tasks/'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.call(async_views.task_list, '/api/tasks/?fields=nope')[0], 400)
+        other = Task.objects.create(user=User.objects.create_user(username='o2', email='o2@example.com'), title='X')
+        self.assertEqual(self.call(async_views.task_detail, f'/api/tasks/{other.pk}/', other.pk)[0], 404)
+
+        request = self.factory.post('/api/tasks/', {'title': 'Posted'}, content_type='application/json',
+                                    headers=self.headers)
+        self.assertEqual(async_to_sync(async_views.task_list)(request).status_code, 201)
+
+    def test_status_long_poll_returns_on_change(self):
+        task = self.tasks[0]
+
+        async def fake_subscribe(channels, timeout):
+            yield None
+            await Task.objects.filter(pk=task.pk).aupdate(status='PROCESSING', progress=30)
+            yield {'id': str(task.id), 'status': 'PROCESSING'}
+
+        with mock.patch('tasks.events.subscribe', fake_subscribe):
+            status_code, data = self.call(
+                async_views.task_status, f'/api/tasks/{task.pk}/status/?wait=5&last_status=PENDING', task.pk
+            )
+        self.assertEqual((status_code, data['status'], data['progress']), (200, 'PROCESSING', 30))
+
+        # Already different from what the client saw: answered without subscribing.
+        with mock.patch('tasks.events.subscribe') as subscribe:
+            data = self.call(async_views.task_status, f'/api/tasks/{task.pk}/status/?wait=5&last_progress=0', task.pk)[1]
+        subscribe.assert_not_called()
+        self.assertEqual(data['progress'], 30)
+
+
+@override_settings(TASK_CPU_POOL_SIZE=0, TASK_IO_POOL_SIZE=0)
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        # Entries left by other tests (SQLite reuses primary keys) would change the query counts.
+        self.clear_caches()
+        self.addCleanup(self.clear_caches)
+
+    def clear_caches(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def run_scenarios(self, names, tasks):
+        users = benchmarks.seed(2, tasks, batch_size=50)
+        # Measured with the bench user's authentication already cached, as in steady state.
+        cache_user(users[0])
+        client = benchmarks.client_for(users[0])
+        with benchmarks.offline():
+            return {
+                scenario.name: benchmarks.run_scenario(client, users[0], scenario, iterations=2)
+                for scenario in benchmarks.SCENARIOS
+                if scenario.name in names
+            }
+
+    def test_every_endpoint_within_query_budget(self):
+        names = {scenario.name for scenario in benchmarks.SCENARIOS}
+        for name, result in self.run_scenarios(names, 40).items():
+            with self.subTest(name):
+                self.assertEqual(result['errors'], 0)
+                self.assertLessEqual(result['queries'], result['max_queries'])
+
+    def test_read_query_counts_do_not_grow_with_dataset(self):
+        names = {'list', 'filter', 'search', 'dashboard_stats'}
+        small = self.run_scenarios(names, 20)
+        large = self.run_scenarios(names, 200)
+        self.assertEqual({n: r['queries'] for n, r in small.items()}, {n: r['queries'] for n, r in large.items()})
+
+    def test_command_writes_results_and_cleans_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.json')
+            call_command('benchmark', users=2, tasks=30, iterations=2, worker_tasks=1, json_path=path,
+                         only=['list', 'cancel'], stdout=io.StringIO())
+            with open(path) as f:
+                results = json.load(f)
+        self.assertEqual([r['name'] for r in results['endpoints']], ['list', 'cancel'])
+        self.assertEqual({r['task_type'] for r in results['workers']}, {value for value, _ in Task.TASK_TYPES})
+        self.assertTrue(all(r['completed'] == r['tasks'] for r in results['workers']))
+        self.assertFalse(Task.objects.filter(title__startswith=benchmarks.SCRATCH_TITLE).exists())
+        self.assertEqual(Task.objects.count(), 30)
+
+    def test_only_sqlite_is_seeded_without_force(self):
+        with mock.patch.object(connection, 'vendor', 'microsoft'):
+            with self.assertRaisesMessage(CommandError, 'without --force'):
+                call_command('benchmark', users=1, tasks=1, stdout=io.StringIO())
+            with self.assertRaises(RuntimeError):
+                benchmarks.seed(1, 1)
+        self.assertFalse(User.objects.exists())
+
+
+class TaskSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', email='searcher@example.com', password='pass12345!')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='pass12345!')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('task-list'), {'search': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def titles(self, query, **params):
+        return [row['title'] for row in self.search(query, **params)['results']]
+
+    def test_ranked_prefix_matches_scoped_to_user_and_filters(self):
+        # The best match is the oldest, so ranking is not just the default newest-first order.
+        Task.objects.create(user=self.user, title='Invoice batch', description='Invoice run for March', status='COMPLETED')
+        Task.objects.create(user=self.user, title='Weekly summary', description='Includes the invoice totals')
+        Task.objects.create(user=self.user, title='Backup', description='Nightly')
+        Task.objects.create(user=self.other, title='Invoice of someone else')
+
+        self.assertEqual(self.titles('invoice'), ['Invoice batch', 'Weekly summary'])
+        self.assertEqual(self.titles('inv'), ['Invoice batch', 'Weekly summary'])
+        self.assertEqual(self.titles('invoice totals'), ['Weekly summary'])
+        self.assertEqual(self.titles('invoice', status='PENDING'), ['Weekly summary'])
+        self.assertEqual(self.titles('invoice', ordering='-created_at'), ['Weekly summary', 'Invoice batch'])
+        self.assertEqual(self.titles('"; DROP'), [])
+
+    def test_index_follows_writes(self):
+        task = Task.objects.create(user=self.user, title='Draft report')
+        Task.objects.bulk_create([Task(user=self.user, title='Bulk report')])
+        self.assertCountEqual(self.titles('report'), ['Draft report', 'Bulk report'])
+
+        task.title = 'Final digest'
+        task.save()
+        Task.objects.filter(title='Bulk report').update(description='archived report')
+        Task.objects.filter(pk=task.pk).update(status='COMPLETED', progress=100)
+        self.assertEqual(self.titles('digest'), ['Final digest'])
+        self.assertEqual(self.titles('report'), ['Bulk report'])
+
+        Task.objects.filter(title='Bulk report').delete()
+        self.assertEqual(self.titles('report'), [])
+
+    def test_index_is_keyed_by_task_id_not_rowid(self):
+        keep = Task.objects.create(user=self.user, title='Keep digest')
+        drop = Task.objects.create(user=self.user, title='Drop digest')
+        # What a VACUUM may do to a table without an integer primary key.
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE tasks_task SET rowid = rowid + 1000')
+        drop.delete()
+        keep.title = 'Kept summary'
+        keep.save()
+        self.assertEqual(self.titles('digest'), [])
+        self.assertEqual(self.titles('summary'), ['Kept summary'])
+
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.titles('kept'), ['Kept summary'])
+
+    def test_ranked_results_paginate_without_gaps(self):
+        Task.objects.bulk_create(
+            [Task(user=self.user, title=f'Audit {"audit " * (n % 3)}{n}', description='audit') for n in range(7)]
+        )
+        page = self.search('audit', page_size=2)
+        seen = [row['id'] for row in page['results']]
+        while page['next']:
+            page = self.client.get(page['next']).data
+            seen.extend(row['id'] for row in page['results'])
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+
+        with CaptureQueriesContext(connection) as captured:
+            self.search('audit', page_size=2)
+        self.assertEqual(len(captured), 1)
+        self.assertIn('MATCH', captured[0]['sql'])
+
+    def test_like_fallback(self):
+        Task.objects.create(user=self.user, title='Thumbnail set', description='png')
+        with mock.patch.dict(search._backends, {'default': search.LikeSearchBackend()}):
+            data = self.search('humbnail')
+        self.assertEqual([row['title'] for row in data['results']], ['Thumbnail set'])
+
+
+@override_settings(TASK_ARCHIVE_AFTER_DAYS=30)
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='keeper', email='keeper@example.com', password='pw')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        old = timezone.now() - timedelta(days=45)
+
+        def task(title, status, age=old, **fields):
+            created = Task.objects.create(user=self.user, title=title, status=status, **fields)
+            finished = fields.get('completed_at', age) if status != 'PENDING' else None
+            Task.objects.filter(pk=created.pk).update(created_at=age, completed_at=finished)
+            return created
+
+        self.done = [task(f'Done {i}', 'COMPLETED', output_data={'n': i}) for i in range(3)]
+        self.cancelled = task('Cancelled', 'CANCELLED')
+        self.recent = task('Recent', 'COMPLETED', age=timezone.now() - timedelta(days=2))
+        self.late_finish = task('Late finish', 'COMPLETED', completed_at=timezone.now() - timedelta(days=1))
+        self.pending = task('Waiting', 'PENDING')
+        self.dead = task('Dead', 'FAILED')
+        TaskDeadLetter.objects.create(task=self.dead, reason='permanent', error_type='ValueError', attempts=1)
+
+    def test_archives_old_terminal_tasks_in_batches(self):
+        before = UserTaskStats.objects.get(user=self.user).as_dict()
+        with mock.patch('tasks.retention.time.sleep') as sleep:
+            self.assertEqual(retention.archive_tasks(batch_size=2), 4)
+        self.assertEqual(sleep.call_count, 2)
+
+        moved = {task.pk for task in [*self.done, self.cancelled]}
+        self.assertEqual(set(ArchivedTask.objects.values_list('pk', flat=True)), moved)
+        self.assertFalse(Task.objects.filter(pk__in=moved).exists())
+        self.assertEqual(Task.objects.count(), 4)
+        self.assertEqual(ArchivedTask.objects.get(pk=self.done[1].pk).output_data, {'n': 1})
+
+        # Dashboard totals keep archived tasks, and reconciliation agrees.
+        self.assertEqual(UserTaskStats.objects.get(user=self.user).as_dict(), before)
+        UserTaskStats.objects.reconcile(self.user.pk)
+        self.assertEqual(UserTaskStats.objects.get(user=self.user).as_dict(), before)
+        Task.objects.filter(user=self.user).delete()
+        UserTaskStats.objects.update(completed=0)
+        self.assertEqual(reconcile_task_counters(), 1)
+        self.assertEqual(UserTaskStats.objects.get(user=self.user).completed, 3)
+        self.assertEqual(retention.archive_tasks(), 0)
+
+        with override_settings(TASK_ARCHIVE_AFTER_DAYS=0):
+            Task.objects.filter(pk=self.recent.pk).update(created_at=timezone.now() - timedelta(days=90))
+            self.assertEqual(retention.archive_tasks(), 0)
+
+    def test_steps_of_running_workflows_are_kept(self):
+        old = timezone.now() - timedelta(days=45)
+        workflow = Workflow.objects.create(user=self.user, name='Nightly')
+        first = Task.objects.create(user=self.user, title='Extract', status='COMPLETED', workflow=workflow)
+        second = Task.objects.create(user=self.user, title='Load', status='COMPLETED', workflow=workflow)
+        Task.objects.filter(pk__in=[first.pk, second.pk]).update(created_at=old, completed_at=old)
+        TaskDependency.objects.create(upstream=first, downstream=second)
+        TaskDeadLetter.objects.create(task=first, reason='transient', error_type='TimeoutError', attempts=3,
+                                      replayed_at=old)
+
+        self.assertEqual(retention.archive_tasks(pause=0), 4)
+        self.assertEqual(set(Task.objects.filter(workflow=workflow)), {first, second})
+        self.assertEqual((TaskDependency.objects.count(), first.dead_letters.count()), (1, 1))
+
+        Workflow.objects.filter(pk=workflow.pk).update(status='COMPLETED', completed_at=old)
+        self.assertEqual(retention.archive_tasks(pause=0), 2)
+        self.assertEqual(ArchivedTask.objects.filter(workflow=workflow).count(), 2)
+
+    def test_archived_tasks_stay_readable_by_id(self):
+        retention.archive_tasks(pause=0)
+        pk = self.done[0].pk
+
+        detail = self.client.get(reverse('task-detail', args=[pk]))
+        self.assertEqual(detail.status_code, status.HTTP_200_OK)
+        self.assertEqual((detail.data['title'], detail.data['status']), ('Done 0', 'COMPLETED'))
+        self.assertEqual(self.client.get(reverse('task-task-status', args=[pk])).data['status'], 'COMPLETED')
+        self.assertEqual(self.client.post(reverse('task-cancel', args=[pk])).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn(str(pk), [row['id'] for row in self.client.get(reverse('task-list')).data['results']])
+
+        factory = AsyncRequestFactory()
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        for view, path in [(async_views.task_detail, f'/api/tasks/{pk}/'),
+                           (async_views.task_status, f'/api/tasks/{pk}/status/')]:
+            with self.subTest(path=path):
+                response = async_to_sync(view)(factory.get(path, headers=headers), pk)
+                self.assertEqual(json.loads(response.content), self.client.get(path).json())
+
+        stranger = APIClient()
+        other = User.objects.create_user(username='stranger', email='stranger@example.com', password='pw')
+        stranger.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(other)}')
+        self.assertEqual(stranger.get(reverse('task-detail', args=[pk])).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class WorkflowTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='flow', email='flow@example.com', password='pw')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def create(self, steps, expected=status.HTTP_201_CREATED):
+        response = self.client.post(reverse('workflow-list'), {'name': 'Nightly', 'steps': steps}, format='json')
+        self.assertEqual(response.status_code, expected, response.data)
+        return response.data
+
+    def step(self, workflow, key):
+        return Task.objects.get(workflow_id=workflow['id'], workflow_step=key)
+
+    def enqueued(self):
+        return set(TaskOutbox.objects.values_list('task__workflow_step', flat=True))
+
+    def diamond(self, extract_type='DATA_PROCESSING'):
+        records = {'records': [{'value': 2}, {'value': 5}]}
+        return self.create([
+            {'key': 'report', 'depends_on': ['left', 'right'], 'task_type': 'DATA_PROCESSING',
+             'input_data': records},
+            {'key': 'left', 'depends_on': ['extract'], 'input_data': records},
+            {'key': 'right', 'depends_on': ['extract'], 'input_data': records},
+            {'key': 'extract', 'task_type': extract_type, 'input_data': records},
+        ])
+
+    def test_fan_out_fan_in_passes_outputs(self):
+        workflow = self.diamond()
+        self.assertEqual([t['step'] for t in workflow['tasks'] if not t['depends_on']], ['extract'])
+        self.assertEqual(self.enqueued(), {'extract'})
+        self.assertEqual(UserTaskStats.objects.get(user=self.user).pending, 4)
+
+        self.assertFalse(process_task_file(str(self.step(workflow, 'report').pk)))  # still blocked
+        self.assertTrue(process_task_file(str(self.step(workflow, 'extract').pk)))
+        self.assertEqual(self.enqueued(), {'extract', 'left', 'right'})
+        left = self.step(workflow, 'left')
+        self.assertEqual(left.input_data['upstream']['extract']['rows'], 2)
+        self.assertEqual(left.input_data['records'], [{'value': 2}, {'value': 5}])
+
+        self.assertTrue(process_task_file(str(left.pk)))
+        self.assertEqual(self.step(workflow, 'report').pending_dependencies, 1)
+        self.assertNotIn('report', self.enqueued())
+        self.assertTrue(process_task_file(str(self.step(workflow, 'right').pk)))
+        report = self.step(workflow, 'report')
+        self.assertIn('report', self.enqueued())
+        self.assertEqual(set(report.input_data['upstream']), {'left', 'right'})
+
+        self.assertTrue(process_task_file(str(report.pk)))
+        detail = self.client.get(reverse('workflow-detail', args=[workflow['id']])).data
+        self.assertEqual(detail['status'], 'COMPLETED')
+        self.assertEqual({t['status'] for t in detail['tasks']}, {'COMPLETED'})
+        self.assertEqual(self.client.get(reverse('workflow-list')).data['results'][0]['status'], 'COMPLETED')
+
+    def test_failure_and_cancellation_propagate_downstream(self):
+        failed = self.diamond(extract_type='EMAIL_NOTIFICATION')  # no recipients: fails permanently
+        self.assertFalse(process_task_file(str(self.step(failed, 'extract').pk)))
+        self.assertEqual(Workflow.objects.get(pk=failed['id']).status, 'FAILED')
+        self.assertEqual(
+            set(Task.objects.filter(workflow_id=failed['id'], status='CANCELLED').values_list('workflow_step', flat=True)),
+            {'left', 'right', 'report'},
+        )
+
+        cancelled = self.diamond()
+        process_task_file(str(self.step(cancelled, 'extract').pk))
+        self.client.post(reverse('task-cancel', args=[self.step(cancelled, 'left').pk]))
+        self.assertEqual(self.step(cancelled, 'report').status, 'CANCELLED')
+        self.assertEqual(self.step(cancelled, 'right').status, 'PENDING')
+        self.assertEqual(Workflow.objects.get(pk=cancelled['id']).status, 'CANCELLED')
+
+        response = self.client.post(reverse('workflow-cancel', args=[cancelled['id']]))
+        self.assertEqual(response.data, {'cancelled': 1})
+        counters = UserTaskStats.objects.get(user=self.user).as_dict()
+        UserTaskStats.objects.reconcile(self.user.pk)
+        self.assertEqual(counters, UserTaskStats.objects.get(user=self.user).as_dict())
+
+    def test_rejects_invalid_graphs(self):
+        cycle = self.create([{'key': 'a', 'depends_on': ['b']}, {'key': 'b', 'depends_on': ['a']}],
+                            expected=status.HTTP_400_BAD_REQUEST)
+        self.assertIn('cycle', str(cycle['steps']))
+        unknown = self.create([{'key': 'a', 'depends_on': ['missing']}], expected=status.HTTP_400_BAD_REQUEST)
+        self.assertIn('missing', str(unknown['steps']))
+        self.create([{'key': 'a'}, {'key': 'a'}], expected=status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Task.objects.exists())
+
+    def test_steps_take_dict_input_and_owned_input_files(self):
+        listed = self.create([{'key': 'a', 'input_data': [1, 2]}], expected=status.HTTP_400_BAD_REQUEST)
+        self.assertIn('input_data', str(listed['steps']))
+
+        Task.objects.create(user=self.user, title='Upload', input_file='task_inputs/mine.csv')
+        stranger = User.objects.create_user(username='else', email='else@example.com', password='pw')
+        Task.objects.create(user=stranger, title='Upload', input_file='task_inputs/theirs.csv')
+        foreign = self.create([{'key': 'convert', 'input_file': 'task_inputs/theirs.csv'}],
+                              expected=status.HTTP_400_BAD_REQUEST)
+        self.assertIn('theirs.csv', str(foreign['steps']))
+
+        workflow = self.create([
+            {'key': 'convert', 'task_type': 'FILE_CONVERSION', 'input_file': 'task_inputs/mine.csv',
+             'input_data': {'target_format': 'json'}},
+            {'key': 'process', 'depends_on': ['convert']},
+        ])
+        self.assertEqual(self.step(workflow, 'convert').input_file.name, 'task_inputs/mine.csv')
+        self.assertFalse(self.step(workflow, 'process').input_file)
+
+
+class _FakeSecretClient:
+    def __init__(self, values, fail=()):
+        self.values = values
+        self.fail = set(fail)
+        self.lock = threading.Lock()
+        self.in_flight = self.peak = self.calls = 0
+
+    def get_secret(self, name):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        time.sleep(0.02)
+        with self.lock:
+            self.in_flight -= 1
+        if name in self.fail:
+            raise ConnectionError(name)
+        return mock.Mock(value=self.values[name])
+
+
+class KeyVaultBootstrapTests(TestCase):
+    def setUp(self):
+        self.values = {name: f'value-of-{name}' for name in SECRET_MAPPING}
+        self.client = _FakeSecretClient(self.values)
+        self.now = [1000.0]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'secrets.bin')
+        self.cache = SecretCache(self.path, Fernet.generate_key(), clock=lambda: self.now[0])
+
+    def loader(self, client=None):
+        return VaultSecretsLoader('vault', client_factory=lambda name: client or self.client, cache=self.cache, ttl=60)
+
+    def test_fetches_concurrently_and_caches_encrypted(self):
+        secrets = self.loader().load()
+        self.assertEqual(secrets['DB_PASS'], 'value-of-DB-PASSWORD')
+        self.assertEqual(len(secrets), len(SECRET_MAPPING))
+        self.assertGreater(self.client.peak, 1)
+        with open(self.path, 'rb') as f:
+            self.assertNotIn(b'value-of-DB-PASSWORD', f.read())
+
+        # A fresh cache answers without touching the vault.
+        offline = _FakeSecretClient(self.values, fail=SECRET_MAPPING)
+        self.assertEqual(self.loader(offline).load(), secrets)
+        self.assertEqual(offline.calls, 0)
+
+    def test_stale_cache_is_served_and_refreshed_in_background(self):
+        self.loader().load()
+        self.now[0] += 120
+        self.values['DB-PASSWORD'] = 'rotated'
+        loader = self.loader()
+        self.assertEqual(loader.load()['DB_PASS'], 'value-of-DB-PASSWORD')
+        loader.refresh_thread.join()
+        self.assertEqual(self.cache.read()[0]['DB_PASS'], 'rotated')
+
+    def test_partial_failure_is_logged_and_not_cached(self):
+        client = _FakeSecretClient(self.values, fail={'DB-PASSWORD'})
+        with self.assertLogs('task_manager.keyvault', 'WARNING') as logs:
+            secrets = self.loader(client).load()
+        self.assertNotIn('DB_PASS', secrets)
+        self.assertEqual(secrets['DB_NAME'], 'value-of-DB-NAME')
+        self.assertIn('DB-PASSWORD (ConnectionError)', logs.output[0])
+        self.assertEqual(self.cache.read(), (None, None))
+
+
+@override_settings(TASK_CPU_POOL_SIZE=0, TASK_IO_POOL_SIZE=0, TASK_SHARD_MIN_BYTES=1, TASK_SHARD_BYTES=64)
+class ShardingTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        # Run the chord in process: shards first, then the merge with their results.
+        conf = process_task_file.app.conf
+        conf.task_always_eager = True
+        self.addCleanup(setattr, conf, 'task_always_eager', False)
+        self.user = User.objects.create_user(username='shards', email='shards@example.com', password='pw')
+
+    def run_task(self, task_type, name, content, **input_data):
+        path = default_storage.save(f'task_inputs/{name}', ContentFile(content))
+        task = Task.objects.create(
+            user=self.user, title=name, task_type=task_type, input_file=path, input_data=input_data
+        )
+        process_task_file(str(task.id))
+        task.refresh_from_db()
+        return task
+
+    def test_every_line_is_read_by_exactly_one_shard(self):
+        content = ''.join(f'{{"n": {n}, "pad": "{"x" * (n % 7)}"}}\n' for n in range(200)).encode()
+        name = default_storage.save('task_inputs/lines.ndjson', ContentFile(content))
+        for step in (1, 17, 64, 1000):
+            bounds = list(range(0, len(content), step)) + [len(content)]
+            lines = [line for lo, hi in zip(bounds, bounds[1:]) for line in sharding.iter_lines(name, lo, hi)]
+            self.assertEqual(''.join(lines).encode(), content)
+
+    def test_sharded_statistics_match_a_single_pass(self):
+        content = 'value,name,weight\n' + ''.join(f'{n},row{n},{n % 5}\n' for n in range(300))
+        with override_settings(TASK_SHARD_MIN_BYTES=10 ** 9):
+            whole = self.run_task('DATA_PROCESSING', 'whole.csv', content.encode())
+        sharded = self.run_task('DATA_PROCESSING', 'sharded.csv', content.encode())
+
+        self.assertEqual(sharded.status, 'COMPLETED')
+        self.assertEqual(sharded.progress, 100)
+        self.assertEqual(sharded.output_data, whole.output_data)
+        self.assertEqual(sharded.output_data['rows'], 300)
+        self.assertEqual(sharded.output_data['columns']['value']['max'], 299)
+
+    def test_sharded_conversion_matches_a_single_pass(self):
+        # Later records add a column, so the csv merge has to widen earlier shards.
+        records = [{'id': n, 'name': f'r{n}'} for n in range(80)] + [{'id': 80, 'extra': 'x'}]
+        content = ''.join(json.dumps(record) + '\n' for record in records).encode()
+        for target in ('csv', 'json', 'ndjson'):
+            with override_settings(TASK_SHARD_MIN_BYTES=10 ** 9):
+                whole = self.run_task('FILE_CONVERSION', 'whole.ndjson', content, target_format=target)
+            sharded = self.run_task('FILE_CONVERSION', 'sharded.ndjson', content, target_format=target)
+            self.assertEqual(sharded.status, 'COMPLETED', sharded.error_message)
+            self.assertEqual(sharded.output_data['rows'], 81)
+            with whole.output_file.open('rb') as expected, sharded.output_file.open('rb') as actual:
+                self.assertEqual(actual.read(), expected.read())
+
+        _, outputs = default_storage.listdir('task_outputs')
+        self.assertFalse([name for name in outputs if '.part' in name])
+
+    def test_failed_shard_fails_the_task(self):
+        content = b''.join(b'{"value": %d}\n' % n for n in range(50)) + b'not json\n'
+        task = self.run_task('DATA_PROCESSING', 'broken.ndjson', content)
+        self.assertEqual(task.status, 'FAILED')
+        self.assertTrue(TaskDeadLetter.objects.filter(task=task).exists())
+
+
+@override_settings(TASK_CPU_POOL_SIZE=0, TASK_IO_POOL_SIZE=0)
+class ImageProcessingTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.user = User.objects.create_user(username='pixels', email='pixels@example.com', password='pw')
+
+    def image(self, name, size, fmt='JPEG', user=None):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 30, 90)).save(buffer, format=fmt)
+        path = default_storage.save(f'task_inputs/{name}', ContentFile(buffer.getvalue()))
+        Task.objects.create(user=user or self.user, title=name, task_type='IMAGE_PROCESSING', input_file=path)
+        return path
+
+    def test_batch_writes_every_rendition(self):
+        photos = [self.image('a.jpg', (1600, 1200)), self.image('b.png', (300, 900), fmt='PNG')]
+        task = Task.objects.create(
+            user=self.user,
+            title='Batch',
+            task_type='IMAGE_PROCESSING',
+            input_data={
+                'images': photos,
+                'renditions': [
+                    {'name': 'large', 'max_size': [800, 800], 'format': 'JPEG', 'quality': 85},
+                    {'name': 'thumb', 'max_size': [100, 100], 'format': 'WEBP'},
+                ],
+            },
+        )
+        self.assertTrue(process_task_file(str(task.id)))
+
+        task.refresh_from_db()
+        first, second = task.output_data['images']
+        self.assertEqual(first['source'], photos[0])
+        self.assertEqual((first['renditions']['large']['width'], first['renditions']['large']['height']), (800, 600))
+        self.assertEqual(first['renditions']['thumb']['width'], 100)
+        self.assertEqual(second['renditions']['thumb']['height'], 100)
+        self.assertEqual(task.output_file.name, first['renditions']['large']['output_file'])
+        with default_storage.open(second['renditions']['thumb']['output_file'], 'rb') as stored:
+            self.assertEqual(stored.read(4), b'RIFF')
+
+    def test_single_rendition_keeps_the_flat_output(self):
+        task = Task.objects.get(input_file=self.image('one.jpg', (640, 480)))
+        task.input_data = {'format': 'png', 'max_size': [64, 64]}
+        task.save(update_fields=['input_data'])
+        self.assertTrue(process_task_file(str(task.id)))
+
+        task.refresh_from_db()
+        self.assertEqual((task.output_data['width'], task.output_data['height'], task.output_data['format']),
+                         (64, 48, 'PNG'))
+        self.assertTrue(task.output_file.name.endswith('.png'))
+
+    def test_images_of_other_users_are_rejected(self):
+        stranger = User.objects.create_user(username='other', email='other@example.com', password='pw')
+        foreign = self.image('theirs.jpg', (50, 50), user=stranger)
+        task = Task.objects.create(
+            user=self.user, title='Steal', task_type='IMAGE_PROCESSING', input_data={'images': [foreign]}
+        )
+        self.assertFalse(process_task_file(str(task.id)))
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'FAILED')
+        self.assertIn('Unknown images', task.error_message)
+
+    def test_cached_results_never_expose_another_users_images(self):
+        secret = self.image('secret.png', (40, 40), fmt='PNG')
+        owner = Task.objects.create(
+            user=self.user, title='Mine', task_type='IMAGE_PROCESSING', input_data={'images': [secret]}
+        )
+        self.assertTrue(process_task_file(str(owner.id)))
+
+        stranger = User.objects.create_user(username='peek', email='peek@example.com', password='pw')
+        client = APIClient()
+        client.force_authenticate(stranger)
+        peek = {'title': 'Peek', 'task_type': 'IMAGE_PROCESSING', 'input_data': {'images': [secret]}}
+        for url, body in [(reverse('task-list'), peek), (reverse('task-bulk-create'), [peek])]:
+            response = client.post(url, body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, response.data)
+        self.assertFalse(Task.objects.filter(user=stranger).exists())
+
@@ -1,10 +1,27 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TaskViewSet
+from .streams import task_events, user_events
+from .views import TaskViewSet, WorkflowViewSet
 
 router = DefaultRouter()
 router.register(r'tasks', TaskViewSet, basename='task')
+router.register(r'workflows', WorkflowViewSet, basename='workflow')
 
 urlpatterns = [
+    # Server-sent event streams; listed before the router so 'events' is not read as a pk.
+    path('tasks/events/', user_events, name='task-user-events'),
+    path('tasks/<uuid:pk>/events/', task_events, name='task-events'),
     path('', include(router.urls)),
-]
\ No newline at end of file
+]
+
+if settings.TASK_ASYNC_READ_VIEWS:
+    from . import async_views
+
+    # Same URLs as the router's, served natively async; must precede the router.
+    urlpatterns[-1:-1] = [
+        path('tasks/', async_views.task_list, name='task-list'),
+        path('tasks/dashboard_stats/', async_views.dashboard_stats, name='task-dashboard-stats'),
+        path('tasks/<uuid:pk>/', async_views.task_detail, name='task-detail'),
+        path('tasks/<uuid:pk>/status/', async_views.task_status, name='task-task-status'),
+    ]
@@ -1,41 +1,180 @@
+import hashlib
 import os
-import uuid
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+from django.core.files.base import File
 from django.conf import settings
 
+CHUNK_SIZE = 64 * 1024
+SNIFF_SIZE = 512
+
+# Leading bytes expected for each binary extension we accept.
+MAGIC_NUMBERS = {
+    '.png': (b'\x89PNG\r\n\x1a\n',),
+    '.jpg': (b'\xff\xd8\xff',),
+    '.jpeg': (b'\xff\xd8\xff',),
+    '.gif': (b'GIF87a', b'GIF89a'),
+    '.bmp': (b'BM',),
+    '.tif': (b'II*\x00', b'MM\x00*'),
+    '.tiff': (b'II*\x00', b'MM\x00*'),
+    '.pdf': (b'%PDF-',),
+    '.zip': (b'PK\x03\x04', b'PK\x05\x06'),
+    '.xlsx': (b'PK\x03\x04',),
+    '.docx': (b'PK\x03\x04',),
+    '.gz': (b'\x1f\x8b',),
+}
+TEXT_TYPES = {'.csv', '.json', '.ndjson', '.jsonl', '.txt'}
+# Every extension sniff_matches can check; uploads of any other type are refused.
+SNIFFABLE_TYPES = {*MAGIC_NUMBERS, *TEXT_TYPES, '.webp'}
+
+
+def sniff_matches(ext, head):
+    """Whether the first bytes of a file are plausible for extension ``ext``."""
+    if ext == '.webp':
+        return head[:4] == b'RIFF' and head[8:12] == b'WEBP'
+    if ext in MAGIC_NUMBERS:
+        return head.startswith(MAGIC_NUMBERS[ext])
+    if ext in TEXT_TYPES:
+        if b'\x00' in head:
+            return False
+        try:
+            head.decode('utf-8')
+        except UnicodeDecodeError as exc:
+            # A multi-byte character may be cut off at the end of the sample.
+            return exc.start >= len(head) - 3
+        return True
+    return False
+
+
+class HashingStream:
+    """Read-only file-like wrapper that hashes and counts bytes as they are read.
+
+    Storage backends pull from it in their own block size, so the upload is
+    never materialised in memory. Rewinding to 0 (as backends do before
+    uploading or on retry) restarts the digest; any other seek invalidates it.
+    ``size`` is the full size of the source, ``bytes_read`` what has been hashed.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.name = getattr(source, 'name', None)
+        self.content_type = getattr(source, 'content_type', None)
+        self.size = getattr(source, 'size', None)
+        if self.size is None:
+            position = source.tell()
+            self.size = source.seek(0, os.SEEK_END)
+            source.seek(position)
+        self._reset()
+
+    def _reset(self):
+        self.sha256 = hashlib.sha256()
+        self.bytes_read = 0
+        self.valid = True
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        if self.valid:
+            self.sha256.update(data)
+            self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        position = self.source.seek(offset, whence)
+        if position == 0:
+            self._reset()
+        else:
+            self.valid = False
+        return position
+
+    def tell(self):
+        return self.source.tell()
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def close(self):
+        pass
+
+
 class FileHandler:
     @staticmethod
     def save_uploaded_file(uploaded_file, task_id, file_type='input'):
-        """Save uploaded file locally (Phase 1)"""
+        """Stream an upload to storage, computing its SHA-256 on the way through."""
         ext = os.path.splitext(uploaded_file.name)[1]
         filename = f"{file_type}_{task_id}{ext}"
-        
-        # Save to local storage
-        path = default_storage.save(
-            f'tasks/{task_id}/{filename}',
-            ContentFile(uploaded_file.read())
-        )
-        
+
+        stream = HashingStream(uploaded_file)
+        stream.seek(0)
+        path = default_storage.save(f'tasks/{task_id}/{filename}', File(stream, name=filename))
+
+        if stream.valid:
+            digest, size = stream.sha256.hexdigest(), stream.bytes_read
+        else:
+            # The backend seeked around mid-upload; hash the source again instead.
+            digest, size = FileHandler.sha256(uploaded_file)
+
         return {
             'filename': filename,
             'path': path,
             'url': default_storage.url(path),
-            'size': uploaded_file.size
+            'size': size,
+            'sha256': digest,
         }
-    
+
+    @staticmethod
+    def save_many(items, storage=None):
+        """Save ``(name, content)`` pairs, concurrently where the storage supports it."""
+        storage = storage or default_storage
+        if hasattr(storage, 'save_many'):
+            return storage.save_many(items)
+        return [storage.save(name, content) for name, content in items]
+
+    @staticmethod
+    def open_many(names, storage=None):
+        """Return ``{name: bytes}`` for ``names``, downloaded concurrently where supported."""
+        storage = storage or default_storage
+        if hasattr(storage, 'open_many'):
+            return storage.open_many(names)
+        contents = {}
+        for name in names:
+            with storage.open(name, 'rb') as f:
+                contents[name] = f.read()
+        return contents
+
+    @staticmethod
+    def sha256(file_obj, chunk_size=CHUNK_SIZE):
+        """Return ``(hexdigest, size)`` of a file, reading it in fixed-size chunks."""
+        digest = hashlib.sha256()
+        size = 0
+        file_obj.seek(0)
+        for chunk in iter(lambda: file_obj.read(chunk_size), b''):
+            digest.update(chunk)
+            size += len(chunk)
+        file_obj.seek(0)
+        return digest.hexdigest(), size
+
     @staticmethod
-    def validate_file_size(uploaded_file, max_size_mb=100):
+    def validate_file_size(uploaded_file, max_size_mb=None):
         """Validate file size"""
+        max_size_mb = max_size_mb or settings.TASK_MAX_UPLOAD_MB
         max_size_bytes = max_size_mb * 1024 * 1024
         if uploaded_file.size > max_size_bytes:
             raise ValueError(f"File size exceeds {max_size_mb}MB limit")
         return True
-    
+
     @staticmethod
-    def validate_file_type(uploaded_file, allowed_types):
-        """Validate file type"""
+    def validate_file_type(uploaded_file, allowed_types=None):
+        """Validate file type by extension and by sniffing the leading bytes"""
+        allowed_types = sorted(SNIFFABLE_TYPES.intersection(allowed_types or settings.TASK_ALLOWED_INPUT_TYPES))
         ext = os.path.splitext(uploaded_file.name)[1].lower()
         if ext not in allowed_types:
             raise ValueError(f"File type {ext} not allowed. Allowed: {allowed_types}")
-        return True
\ No newline at end of file
+
+        uploaded_file.seek(0)
+        head = uploaded_file.read(SNIFF_SIZE)
+        uploaded_file.seek(0)
+        if not sniff_matches(ext, head):
+            raise ValueError(f"File content does not match the {ext} file type")
+        return True
@@ -1,23 +1,118 @@
-from django.db import models
+import uuid
+
+from django.conf import settings
+from django.db import models, transaction
 from django.db.models import Q
-from rest_framework import filters, status, viewsets
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from rest_framework import filters, mixins, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-from .models import Task
-from .serializers import TaskSerializer
-from .tasks import process_task_file
+from . import exports, result_cache
+from .cancellation import cancel_tasks
+from .instrumentation import TimedJSONRenderer
+from .metrics import queue_wait_seconds, render as render_metrics
+from .models import STATUS_COUNTER_FIELDS, ArchivedTask, Task, TaskDeadLetter, UserTaskStats, Workflow
+from .retries import replay_dead_letters
+from .scheduling import enqueue_task, enqueue_tasks, queue_for_priority
+from .search import TaskSearchFilter
+from .serializers import (
+    HEAVY_FIELDS,
+    STATUS_COLUMNS,
+    TaskDeadLetterSerializer,
+    TaskListSerializer,
+    TaskSerializer,
+    TaskStatusSerializer,
+    WorkflowListSerializer,
+    WorkflowSerializer,
+)
+
+
+def status_aggregates():
+    """``aggregate()`` arguments giving the same shape as ``UserTaskStats.as_dict()``."""
+    return {
+        'total': models.Count('id'),
+        **{field: models.Count('id', filter=Q(status=value)) for value, field in STATUS_COUNTER_FIELDS.items()},
+    }
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; requires ``Authorization: Bearer <METRICS_TOKEN>`` when one is set."""
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=401)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 class TaskViewSet(viewsets.ModelViewSet):
     serializer_class = TaskSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    renderer_classes = [TimedJSONRenderer, BrowsableAPIRenderer]
+    filter_backends = [TaskSearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'description']
     ordering_fields = ['created_at', 'priority', 'status']
+    list_actions = {'list', 'by_status'}
+    # Read-only actions that also find tasks moved to the archive (tasks.retention).
+    archive_actions = {'retrieve', 'task_status'}
+
+    def get_requested_fields(self):
+        """Field names from ``?fields=a,b``, or None when no projection was asked for."""
+        if not hasattr(self, '_requested_fields'):
+            raw = self.request.query_params.get('fields')
+            requested = [name.strip() for name in raw.split(',') if name.strip()] if raw else None
+            unknown = set(requested or ()) - set(TaskSerializer().fields)
+            if unknown:
+                raise ValidationError({'fields': f'Unknown fields: {", ".join(sorted(unknown))}'})
+            self._requested_fields = requested
+        return self._requested_fields
+
+    def project_queryset(self, queryset):
+        """Load only the columns the list response will serialize."""
+        fields = self.get_requested_fields()
+        if fields is None:
+            return queryset.defer(*HEAVY_FIELDS)
+        # Pagination reads the ordering columns, so they are always loaded.
+        columns = {'id', 'user', *self.ordering_fields}
+        for name in fields:
+            if name == 'processing_time':
+                columns.update({'started_at', 'completed_at'})
+            else:
+                columns.add(name)
+        return queryset.only(*columns)
+
+    def get_serializer_class(self):
+        if self.action in self.list_actions and self.get_requested_fields() is None:
+            return TaskListSerializer
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method == 'GET':
+            kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.action not in self.archive_actions:
+                raise
+            return get_object_or_404(ArchivedTask.objects.filter(user=self.request.user), pk=self.kwargs['pk'])
+
+    def get_body_ids(self):
+        """Task ids from an optional ``{"ids": [...]}`` request body."""
+        ids = self.request.data.get('ids') if isinstance(self.request.data, dict) else None
+        if ids is None:
+            return None
+        try:
+            return [uuid.UUID(str(value)) for value in ids]
+        except (TypeError, ValueError):
+            raise ValidationError({'ids': 'Expected a list of task ids.'}) from None
 
     def get_queryset(self):
         """Optimized queryset scoped to the authenticated user."""
-        queryset = Task.objects.filter(user=self.request.user).select_related('user')
+        queryset = Task.objects.filter(user=self.request.user)
 
         status_filter = self.request.query_params.get('status')
         task_type = self.request.query_params.get('task_type')
@@ -30,53 +125,234 @@ class TaskViewSet(viewsets.ModelViewSet):
         if priority:
             queryset = queryset.filter(priority=priority)
 
+        if self.action in self.list_actions:
+            queryset = self.project_queryset(queryset)
+        elif self.action == 'task_status':
+            queryset = queryset.only(*STATUS_COLUMNS)
         return queryset
 
     @action(detail=False, methods=['get'])
     def dashboard_stats(self, request):
-        """Get task statistics for dashboard in a single aggregate query."""
-        stats = self.get_queryset().aggregate(
-            total=models.Count('id'),
-            pending=models.Count('id', filter=Q(status='PENDING')),
-            processing=models.Count('id', filter=Q(status='PROCESSING')),
-            completed=models.Count('id', filter=Q(status='COMPLETED')),
-            failed=models.Count('id', filter=Q(status='FAILED')),
-        )
+        """Get task statistics for dashboard from the per-user status counters."""
+        if any(self.request.query_params.get(name) for name in ('status', 'task_type', 'priority')):
+            # Counters are kept per status only; filtered stats need a real count.
+            stats = self.get_queryset().aggregate(**status_aggregates())
+        else:
+            counters = UserTaskStats.objects.filter(user=request.user).first()
+            if counters is None:
+                UserTaskStats.objects.reconcile(request.user.pk)
+                counters = UserTaskStats.objects.get(user=request.user)
+            stats = counters.as_dict()
 
-        recent_tasks = self.get_queryset()[:5]
+        recent_tasks = self.get_queryset().defer(*HEAVY_FIELDS)[:5]
 
         return Response(
             {
                 'stats': stats,
-                'recent_tasks': TaskSerializer(recent_tasks, many=True).data,
+                'recent_tasks': TaskListSerializer(recent_tasks, many=True).data,
             }
         )
 
+    @action(detail=True, methods=['get'], url_path='status')
+    def task_status(self, request, pk=None):
+        """Current status and progress of a task, read from the narrow status columns."""
+        return Response(TaskStatusSerializer(self.get_object()).data)
+
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         """Cancel a task if it's pending or processing."""
         task = self.get_object()
-        if task.status in ['PENDING', 'PROCESSING']:
-            task.status = 'CANCELLED'
-            task.save(update_fields=['status'])
+        if cancel_tasks(Task.objects.filter(pk=task.pk)):
             return Response({'status': 'task cancelled'})
 
+        task.refresh_from_db(fields=['status'])
         return Response(
             {'error': f'Cannot cancel task in {task.status} state'},
             status=status.HTTP_400_BAD_REQUEST,
         )
 
+    @action(detail=False, methods=['post'])
+    def bulk_cancel(self, request):
+        """Cancel every pending/processing task matching the filters.
+
+        Accepts the list filters (``?status=&task_type=&priority=``) and an
+        optional ``{"ids": [...]}`` body to narrow the selection further.
+        """
+        queryset = self.get_queryset()
+        ids = self.get_body_ids()
+        if ids is not None:
+            queryset = queryset.filter(pk__in=ids)
+        return Response({'cancelled': cancel_tasks(queryset)})
+
+    def get_dead_letter_queryset(self):
+        """The user's unreplayed dead letters, filtered by ``?reason=`` and ``?task_type=``."""
+        queryset = TaskDeadLetter.objects.filter(
+            task__user=self.request.user, replayed_at__isnull=True
+        ).select_related('task')
+        reason = self.request.query_params.get('reason')
+        task_type = self.request.query_params.get('task_type')
+        if reason:
+            queryset = queryset.filter(reason=reason)
+        if task_type:
+            queryset = queryset.filter(task__task_type=task_type)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def dead_letters(self, request):
+        """Tasks that failed for good and have not been replayed, newest first."""
+        page = self.paginate_queryset(self.get_dead_letter_queryset())
+        return self.get_paginated_response(TaskDeadLetterSerializer(page, many=True).data)
+
+    @action(detail=False, methods=['post'])
+    def replay(self, request):
+        """Re-queue dead-lettered tasks matching the filters (and optional ``ids`` body)."""
+        queryset = self.get_dead_letter_queryset()
+        ids = self.get_body_ids()
+        if ids is not None:
+            queryset = queryset.filter(task_id__in=ids)
+        return Response({'replayed': replay_dead_letters(queryset)})
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def queue_stats(self, request):
+        """Per-priority queue wait percentiles and pending backlog (all users)."""
+        pending = dict(
+            Task.objects.filter(status='PENDING')
+            .values_list('priority')
+            .annotate(count=models.Count('id'))
+            .order_by()
+        )
+        stats = {}
+        for priority, label in Task.PRIORITY_CHOICES:
+            wait = queue_wait_seconds.snapshot(priority=priority)
+            stats[label] = {
+                'queue': queue_for_priority(priority),
+                'pending': pending.get(priority, 0),
+                'started': wait['count'],
+                'wait_p50': queue_wait_seconds.quantile(0.5, snapshot=wait),
+                'wait_p99': queue_wait_seconds.quantile(0.99, snapshot=wait),
+            }
+        return Response(stats)
+
+    @action(detail=False, methods=['post'])
+    def bulk_create(self, request):
+        """Create a list of tasks in batched INSERTs; returns one result per item."""
+        if not isinstance(request.data, list):
+            return Response({'error': 'Expected a list of tasks'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > settings.TASK_BULK_MAX_ITEMS:
+            return Response(
+                {'error': f'At most {settings.TASK_BULK_MAX_ITEMS} tasks per request'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        results, tasks = [], []
+        for index, item in enumerate(request.data):
+            try:
+                data = serializer.child.run_validation(item)
+            except ValidationError as exc:
+                results.append({'index': index, 'status': 'invalid', 'errors': exc.detail})
+                continue
+            task = Task(user=request.user, cache_key=result_cache.key_for_submission(data), **data)
+            task.queued_priority = task.priority
+            tasks.append(task)
+            results.append({'index': index, 'status': 'created', 'id': str(task.id)})
+
+        cached = {}
+        if not result_cache.bypass_requested(request):
+            cached = result_cache.lookup_many({task.cache_key for task in tasks})
+        pending = []
+        for task in tasks:
+            if task.cache_key in cached:
+                for field, value in result_cache.completed_fields(cached[task.cache_key]).items():
+                    setattr(task, field, value)
+            else:
+                pending.append(task)
+
+        with transaction.atomic():
+            Task.objects.bulk_create(tasks, batch_size=settings.TASK_BULK_CREATE_BATCH_SIZE)
+            UserTaskStats.objects.record(
+                request.user.pk, {'PENDING': len(pending), 'COMPLETED': len(tasks) - len(pending)}
+            )
+            enqueue_tasks(pending)
+
+        if not tasks:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif len(tasks) < len(results):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response({'created': len(tasks), 'results': results}, status=response_status)
+
     @action(detail=False, methods=['get'])
     def by_status(self, request):
-        serializer = self.get_serializer(self.get_queryset(), many=True)
-        return Response(serializer.data)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the filtered tasks as NDJSON (default) or CSV, optionally gzipped."""
+        output = request.query_params.get('output', 'ndjson')
+        if output not in {'ndjson', 'csv'}:
+            return Response({'error': 'output must be ndjson or csv'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = exports.iter_rows(self.filter_queryset(self.get_queryset()))
+        lines = exports.csv_lines(rows) if output == 'csv' else exports.ndjson_lines(rows)
+        chunks = exports.encode(lines)
+        content_type = 'text/csv' if output == 'csv' else 'application/x-ndjson'
+        filename = f'tasks.{output}'
+        if request.query_params.get('compress') == 'gzip':
+            chunks = exports.gzip_stream(chunks)
+            content_type = 'application/gzip'
+            filename += '.gz'
+
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
     def perform_create(self, serializer):
-        task = serializer.save(user=self.request.user)
-        try:
-            # Pass task.id as a string for JSON serialization in the broker
-            process_task_file.delay(str(task.id))
-        except Exception:
-            # Log the error here if you have a logger configured
-            # This prevents a 500 error if Redis/RabbitMQ is down
-            pass
\ No newline at end of file
+        # One streaming pass stores the upload and yields the digest the cache key needs.
+        digest = serializer.store_input_file()
+        cache_key = result_cache.key_for_submission(serializer.validated_data, digest)
+        if cache_key and not result_cache.bypass_requested(self.request):
+            entry = result_cache.lookup(cache_key)
+            if entry is not None:
+                # Identical work already done: complete from the cached result.
+                serializer.save(user=self.request.user, cache_key=cache_key, **result_cache.completed_fields(entry))
+                return
+
+        with transaction.atomic():
+            task = serializer.save(user=self.request.user, cache_key=cache_key)
+            # Published by the outbox relay once committed, on the queue for its priority.
+            enqueue_task(task)
+
+
+class WorkflowViewSet(
+    mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet
+):
+    """Create and follow task DAGs (see tasks.workflows); steps are ordinary tasks."""
+
+    serializer_class = WorkflowSerializer
+
+    def get_queryset(self):
+        return Workflow.objects.filter(user=self.request.user)
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return WorkflowListSerializer
+        return super().get_serializer_class()
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Cancel every step of the workflow that has not finished yet."""
+        workflow = self.get_object()
+        cancelled = cancel_tasks(workflow.tasks.all())
+        if not cancelled:
+            return Response(
+                {'error': f'Cannot cancel workflow in {workflow.status} state'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'cancelled': cancelled})
@@ -0,0 +1,189 @@
+"""Workflows: DAGs of tasks with parallel branches, fan-in joins and output passing.
+
+A workflow's steps are ordinary tasks linked by ``TaskDependency`` rows. Each
+step counts the upstream steps it still waits for (``pending_dependencies``)
+and only steps at zero are enqueued, so independent branches run side by side
+on the workers. When a step completes, the same transaction counts it off its
+downstream steps and enqueues, through the outbox, every step that reaches
+zero: a join starts as soon as its last input is done, without clients polling
+and re-submitting. Before a step is released its upstream steps' ``output_data``
+is copied into its ``input_data['upstream']`` (keyed by step), and a single
+upstream output file becomes its ``input_file`` if it has none.
+
+A step that fails for good or is cancelled cancels every step downstream of
+it and marks the workflow FAILED or CANCELLED; the workflow is COMPLETED once
+all of its steps are. Replaying a failed step does not revive the steps that
+were cancelled below it.
+"""
+
+import logging
+from collections import defaultdict, deque
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task, TaskDependency, UserTaskStats, Workflow
+from .scheduling import enqueue_tasks
+
+logger = logging.getLogger(__name__)
+
+
+def topological_order(steps):
+    """Return ``steps`` (dicts with ``key`` and ``depends_on``) upstream-first; ValueError if not a DAG."""
+    keys = [step['key'] for step in steps]
+    if len(set(keys)) != len(keys):
+        raise ValueError('Step keys must be unique.')
+    by_key = {step['key']: step for step in steps}
+    waiting = {}
+    children = defaultdict(list)
+    for step in steps:
+        parents = set(step.get('depends_on') or ())
+        unknown = parents - by_key.keys()
+        if unknown:
+            raise ValueError(f'Step {step["key"]} depends on unknown steps: {", ".join(sorted(unknown))}.')
+        waiting[step['key']] = len(parents)
+        for parent in parents:
+            children[parent].append(step['key'])
+
+    ready = deque(key for key in keys if not waiting[key])
+    order = []
+    while ready:
+        key = ready.popleft()
+        order.append(by_key[key])
+        for child in children[key]:
+            waiting[child] -= 1
+            if not waiting[child]:
+                ready.append(child)
+    if len(order) != len(steps):
+        raise ValueError('Step dependencies must not form a cycle.')
+    return order
+
+
+def create_workflow(user, name, steps):
+    """Create a workflow's tasks and dependency rows and enqueue its root steps.
+
+    ``steps`` must already be in upstream-first order (see :func:`topological_order`).
+    """
+    with transaction.atomic():
+        workflow = Workflow.objects.create(user=user, name=name)
+        tasks = {}
+        for step in steps:
+            task = Task(
+                user=user,
+                workflow=workflow,
+                workflow_step=step['key'],
+                title=step.get('title') or step['key'],
+                description=step.get('description', ''),
+                task_type=step.get('task_type', 'DATA_PROCESSING'),
+                priority=step.get('priority', 2),
+                input_data=step.get('input_data') or {},
+                input_file=step.get('input_file') or None,
+                pending_dependencies=len(set(step.get('depends_on') or ())),
+            )
+            task.queued_priority = task.priority
+            tasks[step['key']] = task
+        Task.objects.bulk_create(tasks.values())
+        TaskDependency.objects.bulk_create([
+            TaskDependency(upstream=tasks[parent], downstream=tasks[step['key']])
+            for step in steps
+            for parent in set(step.get('depends_on') or ())
+        ])
+        UserTaskStats.objects.record(user.pk, {'PENDING': len(tasks)})
+        enqueue_tasks([task for task in tasks.values() if not task.pending_dependencies])
+    return workflow
+
+
+def _pass_outputs(tasks):
+    """Copy upstream outputs into the inputs of ``tasks`` before they run."""
+    outputs = defaultdict(dict)
+    files = defaultdict(list)
+    edges = TaskDependency.objects.filter(downstream__in=tasks).values_list(
+        'downstream_id', 'upstream__workflow_step', 'upstream__output_data', 'upstream__output_file'
+    )
+    for task_id, step, output_data, output_file in edges:
+        outputs[task_id][step] = output_data
+        if output_file:
+            files[task_id].append(output_file)
+    for task in tasks:
+        task.input_data = {**task.input_data, 'upstream': outputs[task.pk]}
+        update_fields = ['input_data']
+        if not task.input_file and len(files[task.pk]) == 1:
+            task.input_file.name = files[task.pk][0]
+            update_fields.append('input_file')
+        task.save(update_fields=update_fields)
+
+
+def step_completed(task):
+    """Release the steps whose last dependency was ``task``; call in the transaction completing it."""
+    if task.workflow_id is None:
+        return
+    downstream = list(TaskDependency.objects.filter(upstream=task).values_list('downstream_id', flat=True))
+    if downstream:
+        Task.objects.filter(pk__in=downstream, status='PENDING').update(
+            pending_dependencies=F('pending_dependencies') - 1
+        )
+        ready = list(
+            Task.objects.select_for_update().filter(pk__in=downstream, status='PENDING', pending_dependencies=0)
+        )
+        if ready:
+            _pass_outputs(ready)
+            enqueue_tasks(ready)
+            logger.info('Workflow %s: released %d step(s) after %s', task.workflow_id, len(ready), task.pk)
+
+    if not Task.objects.filter(workflow_id=task.workflow_id).exclude(status='COMPLETED').exists():
+        Workflow.objects.filter(pk=task.workflow_id, status='RUNNING').update(
+            status='COMPLETED', completed_at=timezone.now()
+        )
+
+
+def halt(task_ids, status):
+    """Cancel every step downstream of ``task_ids`` and mark their workflows ``status``.
+
+    Called when workflow steps fail for good (FAILED) or are cancelled (CANCELLED).
+    """
+    from .cancellation import cancel_tasks
+
+    stopped = dict(Task.objects.filter(pk__in=task_ids, workflow__isnull=False).values_list('pk', 'workflow_id'))
+    if not stopped:
+        return
+    workflow_ids = set(stopped.values())
+    children = defaultdict(list)
+    for upstream, downstream in TaskDependency.objects.filter(upstream__workflow__in=workflow_ids).values_list(
+        'upstream_id', 'downstream_id'
+    ):
+        children[upstream].append(downstream)
+
+    below, frontier = set(), list(stopped)
+    while frontier:
+        frontier = [child for parent in frontier for child in children[parent] if child not in below]
+        below.update(frontier)
+
+    Workflow.objects.filter(pk__in=workflow_ids, status='RUNNING').update(status=status, completed_at=timezone.now())
+    if below:
+        cancel_tasks(Task.objects.filter(pk__in=below))
+
+
+def describe_steps(workflow):
+    """The workflow's steps with their state and the step keys they depend on."""
+    depends_on = defaultdict(list)
+    for task_id, step in TaskDependency.objects.filter(downstream__workflow=workflow).values_list(
+        'downstream_id', 'upstream__workflow_step'
+    ):
+        depends_on[task_id].append(step)
+    tasks = workflow.tasks.order_by('created_at', 'workflow_step').values(
+        'id', 'workflow_step', 'title', 'task_type', 'status', 'progress', 'pending_dependencies'
+    )
+    return [
+        {
+            'id': task['id'],
+            'step': task['workflow_step'],
+            'title': task['title'],
+            'task_type': task['task_type'],
+            'status': task['status'],
+            'progress': task['progress'],
+            'depends_on': sorted(depends_on[task['id']]),
+            'pending_dependencies': task['pending_dependencies'],
+        }
+        for task in tasks
+    ]
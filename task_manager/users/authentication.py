@@ -0,0 +1,150 @@
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+
+def _cache():
+    return caches[settings.AUTH_USER_CACHE]
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+# The cache only saves a query: when it is down, authentication goes to the database.
+def _cached(key):
+    try:
+        return _cache().get(key)
+    except Exception:
+        logger.warning('Auth user cache read failed', exc_info=True)
+        return None
+
+
+async def _acached(key):
+    try:
+        return await _cache().aget(key)
+    except Exception:
+        logger.warning('Auth user cache read failed', exc_info=True)
+        return None
+
+
+def _store(key, user):
+    try:
+        _cache().set(key, user, settings.AUTH_USER_CACHE_SECONDS)
+    except Exception:
+        logger.warning('Auth user cache write failed', exc_info=True)
+
+
+async def _astore(key, user):
+    try:
+        await _cache().aset(key, user, settings.AUTH_USER_CACHE_SECONDS)
+    except Exception:
+        logger.warning('Auth user cache write failed', exc_info=True)
+
+
+def _forget(key):
+    try:
+        _cache().delete(key)
+    except Exception:
+        logger.warning('Auth user cache delete failed for %s', key, exc_info=True)
+
+
+def cache_user(user):
+    _store(user_cache_key(getattr(user, api_settings.USER_ID_FIELD)), user)
+
+
+@receiver(post_save, sender=User, dispatch_uid='users.authentication.invalidate_on_save')
+@receiver(post_delete, sender=User, dispatch_uid='users.authentication.invalidate_on_delete')
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drop the cached user now and again on commit, so a concurrent request cannot re-cache the old row."""
+    key = user_cache_key(getattr(instance, api_settings.USER_ID_FIELD))
+    _forget(key)
+    transaction.on_commit(lambda: _forget(key))
+
+
+def verified_user(user, validated_token):
+    """Return ``user`` if ``validated_token`` may act for it, else raise ``AuthenticationFailed``.
+
+    The checks ``JWTAuthentication.get_user`` makes, for users found in the cache as well.
+    """
+    if user is None:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    if not user.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+        api_settings.REVOKE_TOKEN_CLAIM
+    ) != get_md5_hash_password(user.password):
+        raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+    return user
+
+
+def _user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken('Token contained no recognizable user identification')
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` that keeps the token's user in the cache for ``AUTH_USER_CACHE_SECONDS``.
+
+    Saving or deleting a user invalidates the entry; queryset ``update()``s
+    bypass the signal and are picked up when the entry expires.
+    """
+
+    def get_user(self, validated_token):
+        key = user_cache_key(_user_id(validated_token))
+        user = _cached(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            _store(key, user)
+            return user
+        return verified_user(user, validated_token)
+
+
+async def authenticate_async(request, allow_query_token=False):
+    """Resolve the JWT on a plain Django request to an active user, or None.
+
+    ``allow_query_token`` also accepts ``?token=`` for clients such as
+    EventSource that cannot set an Authorization header.
+    """
+    authenticator = JWTAuthentication()
+    try:
+        raw_token = None
+        header = authenticator.get_header(request)
+        if header is not None:
+            raw_token = authenticator.get_raw_token(header)
+        if raw_token is None and allow_query_token:
+            raw_token = request.GET.get('token')
+        if not raw_token:
+            return None
+        # Signature and claim checks are pure CPU; only the user lookup is I/O.
+        token = authenticator.get_validated_token(raw_token)
+        user_id = _user_id(token)
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return None
+
+    key = user_cache_key(user_id)
+    user = await _acached(key)
+    if user is None:
+        user = await User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+        if user is not None:
+            await _astore(key, user)
+    try:
+        return verified_user(user, token)
+    except AuthenticationFailed:
+        return None
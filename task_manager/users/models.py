@@ -1,10 +1,12 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
     bio = models.TextField(max_length=500, blank=True)
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
+    # Rendition name -> storage path, filled in by users.tasks.generate_avatar_renditions.
+    avatar_renditions = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -12,4 +14,24 @@ class User(AbstractUser):
     REQUIRED_FIELDS = ['username']
     
     def __str__(self):
-        return self.email
\ No newline at end of file
+        return self.email
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored avatar so save() can tell when a new one was uploaded.
+        instance._loaded_avatar = instance.__dict__.get('avatar') or ''
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'avatar' not in update_fields:
+            return
+        avatar = self.avatar.name or ''
+        if avatar != getattr(self, '_loaded_avatar', ''):
+            from .tasks import generate_avatar_renditions
+
+            user_id = self.pk
+            transaction.on_commit(lambda: generate_avatar_renditions.delay(user_id, avatar), robust=True)
+        self._loaded_avatar = avatar
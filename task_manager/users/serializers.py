@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from django.core.files.storage import default_storage
 
 User = get_user_model()
 
@@ -23,6 +24,17 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 class UserSerializer(serializers.ModelSerializer):
+    # Small versions of the avatar for profiles and listings; empty until they are rendered.
+    avatar_renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'bio', 'avatar', 'created_at')
\ No newline at end of file
+        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'bio', 'avatar', 'avatar_renditions',
+                  'created_at')
+
+    def get_avatar_renditions(self, obj):
+        request = self.context.get('request')
+        urls = {name: default_storage.url(path) for name, path in obj.avatar_renditions.items()}
+        if request is not None:
+            urls = {name: request.build_absolute_uri(url) for name, url in urls.items()}
+        return urls
\ No newline at end of file
@@ -0,0 +1,48 @@
+import logging
+
+from celery import shared_task
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from tasks import images
+from tasks.utils.file_handler import FileHandler
+
+from .authentication import invalidate_cached_user
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+@shared_task
+def generate_avatar_renditions(user_id, avatar):
+    """Render ``AVATAR_RENDITIONS`` of a newly uploaded avatar and drop the previous ones."""
+    user = User.objects.filter(pk=user_id).first()
+    if user is None or (user.avatar.name or '') != avatar:
+        logger.info('Skipping avatar renditions for user %s: avatar changed since upload', user_id)
+        return {}
+
+    paths = {}
+    if avatar:
+        renditions = [images.Rendition.from_dict(spec) for spec in settings.AVATAR_RENDITIONS]
+        with default_storage.open(avatar, 'rb') as original:
+            (rendered,) = images.render_many([original.read()], renditions)
+        stem = avatar.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+        saved = FileHandler.save_many([
+            (f'avatars/renditions/{user_id}/{stem}_{rendition.name}.{rendition.extension}',
+             ContentFile(output['content']))
+            for rendition, output in zip(renditions, rendered)
+        ])
+        paths = {rendition.name: path for rendition, path in zip(renditions, saved)}
+
+    # Conditional, so renditions of a replaced avatar never overwrite the new one's.
+    if User.objects.filter(pk=user_id, avatar=avatar).update(avatar_renditions=paths):
+        stale = set(user.avatar_renditions.values()) - set(paths.values())
+        invalidate_cached_user(User, user)
+    else:
+        stale = set(paths.values())
+    for path in stale:
+        default_storage.delete(path)
+    return paths
@@ -1,3 +1,144 @@
-from django.test import TestCase
+import io
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tasks.models import Task
+
+from .authentication import authenticate_async
+from .tasks import generate_avatar_renditions
+
+User = get_user_model()
+
+
+class CachedAuthenticationTests(APITestCase):
+    def setUp(self):
+        caches['auth'].clear()
+        self.user = User.objects.create_user(username='cached', email='cached@example.com', password='pass12345!')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_login_reuses_authenticated_user(self):
+        self.client.credentials()
+        # Only the authentication backend's lookup; the profile reuses its user.
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                reverse('token_obtain_pair'), {'email': 'cached@example.com', 'password': 'pass12345!'}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['username'], 'cached')
+        self.assertIn('access', response.data)
+
+        # The login warmed the cache for the first authenticated request.
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('user_profile')).status_code, status.HTTP_200_OK)
+
+        bad = self.client.post(reverse('token_obtain_pair'), {'email': 'cached@example.com', 'password': 'wrong'})
+        self.assertEqual(bad.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_lookup_is_cached_per_token_user(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('user_profile'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('user_profile'))
+
+        task = Task.objects.create(user=self.user, title='One')
+        with self.assertNumQueries(1):  # the task only; no user join
+            response = self.client.get(reverse('task-detail', args=[task.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_profile_update_and_deactivation_invalidate_cache(self):
+        self.client.get(reverse('user_profile'))
+        self.client.patch(reverse('user_profile'), {'bio': 'Updated'})
+        self.assertEqual(self.client.get(reverse('user_profile')).data['bio'], 'Updated')
+
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.client.get(reverse('user_profile')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_cache_outage_falls_back_to_the_database(self):
+        down = mock.Mock(**{
+            name: mock.Mock(side_effect=ConnectionError('redis down'))
+            for name in ('get', 'set', 'delete', 'aget', 'aset')
+        })
+        token = str(AccessToken.for_user(self.user))
+        with mock.patch('users.authentication._cache', return_value=down), \
+                self.assertLogs('users.authentication', 'WARNING'):
+            response = await self.async_client.get(
+                reverse('user_profile'), headers={'Authorization': f'Bearer {token}'}
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(await authenticate_async(request), self.user)
+            self.user.bio = 'Saved anyway'
+            await self.user.asave()
+        down.get.assert_called()
+
+    @mock.patch.object(api_settings, 'CHECK_REVOKE_TOKEN', True)
+    async def test_password_change_revokes_tokens_on_both_paths(self):
+        token = str(AccessToken.for_user(self.user))
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(await authenticate_async(request), self.user)
+
+        # The new hash reaches the cache, so both authenticators answer from it.
+        self.user.set_password('changed12345!')
+        await self.user.asave()
+        self.assertIsNone(await authenticate_async(request))
+        self.assertIsNotNone(caches['auth'].get(f'auth:user:{self.user.pk}'))
+        response = await self.async_client.get(reverse('user_profile'), headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(TASK_CPU_POOL_SIZE=0)
+class AvatarRenditionTests(APITestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.user = User.objects.create_user(username='face', email='face@example.com', password='pass12345!')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def upload(self, size):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (10, 120, 200)).save(buffer, format='JPEG')
+        avatar = SimpleUploadedFile('me.jpg', buffer.getvalue(), content_type='image/jpeg')
+        with mock.patch.object(generate_avatar_renditions, 'delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(reverse('user_profile'), {'avatar': avatar}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.user.refresh_from_db()
+        delay.assert_called_once_with(self.user.pk, self.user.avatar.name)
+        return generate_avatar_renditions(self.user.pk, self.user.avatar.name)
+
+    def test_upload_renders_small_avatars_for_the_profile(self):
+        self.assertEqual(self.client.get(reverse('user_profile')).data['avatar_renditions'], {})
+        paths = self.upload((1200, 800))
+
+        self.assertEqual(set(paths), {'small', 'medium'})
+        with default_storage.open(paths['small'], 'rb') as small:
+            self.assertEqual(Image.open(small).size, (64, 43))
+        renditions = self.client.get(reverse('user_profile')).data['avatar_renditions']
+        self.assertTrue(renditions['small'].startswith('http://testserver/'))
+        self.assertTrue(renditions['medium'].endswith('.webp'))
+
+        # A new upload replaces the renditions and removes the old files.
+        new_paths = self.upload((300, 300))
+        self.assertFalse(default_storage.exists(paths['small']))
+        self.assertTrue(default_storage.exists(new_paths['small']))
+
+    def test_renditions_of_a_replaced_avatar_are_discarded(self):
+        self.upload((200, 200))
+        self.assertEqual(generate_avatar_renditions(self.user.pk, 'avatars/old.jpg'), {})
+        self.assertEqual(set(User.objects.get(pk=self.user.pk).avatar_renditions), {'small', 'medium'})
 
-# Create your tests here.
@@ -1,8 +1,10 @@
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView
 
+from .authentication import cache_user
 from .serializers import UserRegistrationSerializer, UserSerializer
 
 User = get_user_model()
@@ -16,24 +18,18 @@ class RegisterView(generics.CreateAPIView):
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-
-        if response.status_code == 200:
-            # Check both email and username as identifiers
-            login_identifier = request.data.get('email') or request.data.get('username')
-            if login_identifier:
-                try:
-                    # Retrieve user by email to include profile data in response
-                    user = User.objects.get(email=login_identifier)
-                    response.data['user'] = UserSerializer(user).data
-                except ObjectDoesNotExist:
-                    # If user is not found by email, try fetching by username
-                    try:
-                        user = User.objects.get(username=login_identifier)
-                        response.data['user'] = UserSerializer(user).data
-                    except ObjectDoesNotExist:
-                        pass
-        return response
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as exc:
+            raise InvalidToken(exc.args[0])
+
+        # The serializer has already authenticated the user: reuse it for the
+        # profile data and to warm the authentication cache.
+        data = dict(serializer.validated_data)
+        data['user'] = UserSerializer(serializer.user).data
+        cache_user(serializer.user)
+        return Response(data, status=status.HTTP_200_OK)
 
 
 class UserProfileView(generics.RetrieveUpdateAPIView):